@@ -3,6 +3,8 @@ from setuptools import setup, find_packages
 
 entry_points = {
     'console_scripts': [
+        'nti_xapi_benchmark = nti.xapi.benchmark:main',
+        'nti_xapi_local_lrs = nti.xapi.testing:main',
     ],
 }
 
@@ -68,6 +70,12 @@ setup(
     ],
     extras_require={
         'test': TESTS_REQUIRE,
+        'orjson': [
+            'orjson; python_version >= "3.6"',
+        ],
+        'ujson': [
+            'ujson',
+        ],
         'docs': [
             'Sphinx',
             'repoze.sphinx.autointerface',
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+An :mod:`asyncio` facade over :class:`nti.xapi.client.LRSClient`.
+
+Every :class:`nti.xapi.interfaces.ILRSClient` operation is available as
+a coroutine. Calls run on a bounded pool of worker threads that share the
+connection pool of a single :class:`~nti.xapi.client.LRSClient`, so the
+responses are parsed, and the results built, exactly as the synchronous
+client does.
+
+The transport is still the blocking one: each call in flight holds a
+worker thread until its response is read, so no more than
+``max_concurrency`` calls are in flight at once, however many
+coroutines await them. The event loop itself is never blocked.
+
+This module requires Python 3.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import asyncio
+
+from functools import partial
+
+from concurrent.futures import ThreadPoolExecutor
+
+from zope import interface
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.deadline import Deadline
+from nti.xapi.deadline import deadline as scoped_deadline
+
+from nti.xapi.interfaces import Version
+from nti.xapi.interfaces import ILRSClient
+from nti.xapi.interfaces import IAsyncLRSClient
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The default number of LRS calls allowed in flight at once
+DEFAULT_CONCURRENCY = 10
+
+try:
+    _running_loop = asyncio.get_running_loop
+except AttributeError:  # pragma: no cover
+    # Python 3.6
+    _running_loop = asyncio.get_event_loop
+
+_DONE = object()
+
+
+def _within(deadline, func, *args):
+    with scoped_deadline(deadline):
+        return func(*args)
+
+
+def _delegate(name):
+
+    async def operation(self, *args, **kwargs):
+        return await self._call(getattr(self.client, name), *args, **kwargs)
+
+    operation.__name__ = name
+    operation.__doc__ = ILRSClient[name].__doc__
+    return operation
+
+
+@interface.implementer(IAsyncLRSClient)
+class AsyncLRSClient(object):
+    """
+    Coroutine based LRS client. Use as an async context manager or call
+    :meth:`close` when done.
+    """
+
+    def __init__(self, endpoint=None, auth=None, version=Version.latest,
+                 max_concurrency=DEFAULT_CONCURRENCY, client=None, **kwargs):
+        """
+        :param max_concurrency: Maximum number of calls in flight at once.
+            Also the size of the connection pool when a client is created.
+        :type max_concurrency: int
+        :param client: An existing client to share, otherwise one is
+            created from the endpoint, auth, version and remaining keyword
+            arguments.
+        :type client: :class:`nti.xapi.client.LRSClient`
+        """
+        if client is None:
+            kwargs.setdefault('pool_maxsize', max_concurrency)
+            client = LRSClient(endpoint, auth=auth, version=version, **kwargs)
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    @property
+    def endpoint(self):
+        return self.client.endpoint
+
+    async def _call(self, func, *args, **kwargs):
+        loop = _running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(func, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+    async def _fetch(self, deadline, func, arg):
+        return await self._call(_within, deadline, func, arg)
+
+    async def iter_statements(self, query, max_statements=None, prefetch=True,
+                              stream=False, deadline=None):
+        """
+        Asynchronously iterate the statements matching a query, see
+        :meth:`nti.xapi.interfaces.ILRSClient.iter_statements`. A page
+        fetched ahead is cancelled when the iteration stops early.
+        """
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+        if stream:
+            iterator = self.client.iter_statements(query, max_statements,
+                                                   stream=True, deadline=deadline)
+            try:
+                while True:
+                    statement = await self._call(next, iterator, _DONE)
+                    if statement is _DONE:
+                        return
+                    yield statement
+            finally:
+                await self._call(iterator.close)
+        result = await self._fetch(deadline, self.client.query_statements, query)
+        count = 0
+        pending = None
+        try:
+            while result is not None:
+                more = result.more
+                statements, result = result.statements or (), None
+                if max_statements is not None:
+                    statements = statements[:max_statements - count]
+                    if count + len(statements) >= max_statements:
+                        more = None  # no page is fetched past the last wanted
+                if more and prefetch:
+                    pending = asyncio.ensure_future(
+                        self._fetch(deadline, self.client.more_statements, more))
+                for statement in statements:
+                    count += 1
+                    yield statement
+                if pending is not None:
+                    result, pending = await pending, None
+                elif more:
+                    result = await self._fetch(deadline, self.client.more_statements, more)
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *unused_args):
+        self.close()
+
+
+# the same aliases LRSClient provides
+_ALIASES = {
+    'statement': 'retrieve_statement',
+    'get_statement': 'retrieve_statement',
+    'get_voided_statement': 'retrieve_voided_statement',
+    'get_state_ids': 'retrieve_state_ids',
+    'get_state': 'retrieve_state',
+    'get_activity_profile_ids': 'retrieve_activity_profile_ids',
+    'get_activity_profile': 'retrieve_activity_profile',
+    'get_agent_profile_ids': 'retrieve_agent_profile_ids',
+    'get_agent_profile': 'retrieve_agent_profile',
+}
+
+for _name in ILRSClient.names():
+    if not hasattr(AsyncLRSClient, _name):
+        setattr(AsyncLRSClient, _name, _delegate(_name))
+for _alias, _name in _ALIASES.items():
+    setattr(AsyncLRSClient, _alias, getattr(AsyncLRSClient, _name))
+del _alias, _name
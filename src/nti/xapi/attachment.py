@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
+The attachment model, and helpers to describe attachment data with its
+SHA-2 hash and length, read in one streaming pass.
+
 .. $Id$
 """
 
@@ -8,6 +11,15 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import os
+import mmap
+import hashlib
+import mimetypes
+
+from multiprocessing.pool import ThreadPool
+
+import six
+
 from zope import interface
 
 from nti.schema.fieldproperty import createDirectFieldProperties
@@ -15,6 +27,9 @@ from nti.schema.fieldproperty import createDirectFieldProperties
 from nti.schema.schema import SchemaConfigured
 
 from nti.xapi.interfaces import IAttachment
+from nti.xapi.interfaces import AttachmentMismatchException
+
+from nti.xapi.language_map import LanguageMap
 
 logger = __import__('logging').getLogger(__name__)
 
@@ -25,3 +40,178 @@ class Attachment(SchemaConfigured):
     __external_can_create__ = True
 
     createDirectFieldProperties(IAttachment)
+
+
+#: Bytes read at a time from a stream
+CHUNK_SIZE = 64 * 1024
+
+#: Files at least this large are hashed through a memory map
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+#: The SHA-2 algorithms by the length of their hex digest
+_ALGORITHMS = {64: 'sha256', 96: 'sha384', 128: 'sha512'}
+
+
+def _algorithm(sha2):
+    return _ALGORITHMS.get(len(sha2 or ''), 'sha256')
+
+
+def hash_stream(stream, algorithm='sha256', chunk_size=CHUNK_SIZE):
+    """
+    Read a stream to its end, returning the hex digest and the number
+    of bytes read. Text is hashed as UTF-8.
+    """
+    digest = hashlib.new(algorithm)
+    length = 0
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        digest.update(data)
+        length += len(data)
+    return digest.hexdigest(), length
+
+
+def hash_file(path, algorithm='sha256'):
+    """
+    Return the hex digest and the size of a file. Files of at least
+    :data:`MMAP_THRESHOLD` bytes are hashed from a memory map.
+    """
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            return hash_stream(fp, algorithm)
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            digest = hashlib.new(algorithm)
+            digest.update(data)
+            return digest.hexdigest(), size
+        finally:
+            data.close()
+
+
+def hash_files(paths, algorithm='sha256', max_workers=4):
+    """
+    Hash files on a pool of threads; :mod:`hashlib` releases the GIL
+    while hashing.
+
+    :return: The (hex digest, size) of each file, in order
+    """
+    paths = list(paths)
+    if len(paths) < 2 or max_workers < 2:
+        return [hash_file(path, algorithm) for path in paths]
+    pool = ThreadPool(min(max_workers, len(paths)))
+    try:
+        return pool.map(lambda path: hash_file(path, algorithm), paths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _attachment(sha2, length, usage_type, display, content_type,
+                description=None):
+    result = Attachment(usageType=usage_type,
+                        display=LanguageMap(display),
+                        contentType=content_type,
+                        length=length,
+                        sha2=sha2)
+    if description:
+        result.description = LanguageMap(description)
+    return result
+
+
+def _display(path, display):
+    # 'und' is the undetermined language tag
+    return display or {'und': os.path.basename(path)}
+
+
+def _content_type(path, content_type):
+    return (content_type
+            or mimetypes.guess_type(path)[0]
+            or 'application/octet-stream')
+
+
+def attachment_from_file(path, usage_type, display=None, content_type=None,
+                         description=None, algorithm='sha256'):
+    """
+    Describe the data of a file with an :class:`Attachment`.
+
+    :param usage_type: The IRI of the usage of the attachment
+    :param display: The language map of its title, by default the
+        file name
+    :param content_type: Its content type, by default guessed from the
+        file name
+    """
+    sha2, length = hash_file(path, algorithm)
+    return _attachment(sha2, length, usage_type, _display(path, display),
+                       _content_type(path, content_type), description)
+
+
+def attachments_from_files(paths, usage_type, content_type=None,
+                           algorithm='sha256', max_workers=4):
+    """
+    Describe the data of many files, hashed with :func:`hash_files`,
+    each titled with its file name.
+    """
+    paths = list(paths)
+    hashes = hash_files(paths, algorithm, max_workers)
+    return [_attachment(sha2, length, usage_type, _display(path, None),
+                        _content_type(path, content_type))
+            for path, (sha2, length) in zip(paths, hashes)]
+
+
+def attachment_from_stream(stream, usage_type, display,
+                           content_type='application/octet-stream',
+                           description=None, algorithm='sha256'):
+    """
+    Describe the data of a stream with an :class:`Attachment`. A
+    seekable stream is returned to its position, ready to be sent; any
+    other is consumed.
+    """
+    sha2, length = _hash_from_position(stream, algorithm)
+    return _attachment(sha2, length, usage_type, display, content_type,
+                       description)
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except AttributeError:
+        return hasattr(stream, 'seek') and hasattr(stream, 'tell')
+
+
+def _hash_from_position(stream, algorithm):
+    if not _seekable(stream):
+        return hash_stream(stream, algorithm)
+    position = stream.tell()
+    try:
+        return hash_stream(stream, algorithm)
+    finally:
+        stream.seek(position)
+
+
+def verify_attachment(attachment, data):
+    """
+    Check that data, bytes or a stream, matches the hash and length an
+    attachment declares. Streams are returned to their position.
+
+    :return: False if the data is a stream that can't be read without
+        consuming it, so was not checked
+    :raises AttachmentMismatchException: If it doesn't match
+    """
+    algorithm = _algorithm(attachment.sha2)
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    if isinstance(data, bytes):
+        sha2, length = hashlib.new(algorithm, data).hexdigest(), len(data)
+    elif _seekable(data):
+        sha2, length = _hash_from_position(data, algorithm)
+    else:
+        return False
+    if sha2 != (attachment.sha2 or '').lower() or length != attachment.length:
+        raise AttachmentMismatchException(
+            'Attachment data does not match its hash or length',
+            attachment.sha2)
+    return True
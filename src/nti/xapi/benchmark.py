@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the serialization and client paths, run offline against
+a :class:`nti.xapi.testing.LocalLRS`.
+
+Each benchmark runs on a generated corpus of statements, of a chosen
+size and shape, and is timed over several runs. The results are
+written as JSON, so those of two commits can be compared::
+
+    nti_xapi_benchmark --statements 2000 --shape complete -o before.json
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+import uuid
+import random
+import shutil
+import hashlib
+import platform
+import argparse
+import tempfile
+
+from collections import OrderedDict
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+import simplejson as json
+
+from nti.externalization import to_external_object
+
+from nti.xapi.activity import Activity
+
+from nti.xapi.attachment import hash_files
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.codec import CODECS
+from nti.xapi.codec import get_codec
+
+from nti.xapi.compression import COMPRESSORS
+
+from nti.xapi.documents.document import StateDocument
+
+from nti.xapi.entities import Agent
+
+from nti.xapi.externalization import externalize
+from nti.xapi.externalization import internalize
+
+from nti.xapi.statement import Statement
+
+from nti.xapi.testing import LocalLRS
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Statements with an actor, a verb and an activity
+SIMPLE = 'simple'
+
+#: Statements with a result, a context and activity definitions as well
+COMPLETE = 'complete'
+
+SHAPES = (SIMPLE, COMPLETE)
+
+_VERBS = ('attempted', 'completed', 'passed', 'failed', 'answered',
+          'experienced', 'launched', 'progressed', 'scored', 'terminated')
+
+
+def _statement_ext(rng, index, shape, actors, verbs, activities):
+    actor = rng.randrange(actors)
+    verb = _VERBS[rng.randrange(min(verbs, len(_VERBS)))]
+    activity = rng.randrange(activities)
+    result = {
+        'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'actor': {'objectType': 'Agent',
+                  'name': u'Learner %d' % actor,
+                  'mbox': u'mailto:learner%d@example.com' % actor},
+        'verb': {'id': u'http://adlnet.gov/expapi/verbs/%s' % verb,
+                 'display': {u'en-US': verb}},
+        'object': {'objectType': 'Activity',
+                   'id': u'http://example.com/activities/%d' % activity},
+        'timestamp': '2020-01-01T00:%02d:%02dZ' % (index // 60 % 60, index % 60),
+    }
+    if shape == COMPLETE:
+        result['object']['definition'] = {
+            'name': {u'en-US': u'Activity %d' % activity},
+            'description': {u'en-US': u'The description of activity %d' % activity},
+            'type': u'http://adlnet.gov/expapi/activities/lesson',
+        }
+        result['result'] = {
+            'score': {'scaled': rng.random(), 'raw': rng.randrange(100),
+                      'min': 0, 'max': 100},
+            'success': rng.random() > 0.5,
+            'completion': True,
+            'duration': 'PT%dS' % rng.randrange(1, 3600),
+            'response': u'response %d' % index,
+        }
+        result['context'] = {
+            'registration': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'platform': u'Example LMS',
+            'language': u'en-US',
+            'contextActivities': {
+                'parent': [{'id': u'http://example.com/courses/%d' % (activity // 10)}],
+                'grouping': [{'id': u'http://example.com/programs/1'}],
+            },
+            'extensions': {
+                u'http://example.com/extensions/session': rng.randrange(1000),
+            },
+        }
+    return result
+
+
+def generate_statements(count, shape=SIMPLE, actors=10, verbs=5,
+                        activities=50, seed=0):
+    """
+    Return a repeatable corpus of statements, drawing their actors,
+    verbs and activities from pools of the given sizes.
+
+    :param count: The number of statements
+    :type count: int
+    :param shape: :data:`SIMPLE` or :data:`COMPLETE`
+    :type shape: str
+    """
+    if shape not in SHAPES:
+        raise ValueError('Unknown statement shape %r' % (shape,))
+    rng = random.Random(seed)
+    return [internalize(_statement_ext(rng, i, shape, actors, verbs, activities),
+                        Statement)
+            for i in range(count)]
+
+
+def _attachment_data(index, size):
+    return (('%08d' % index).encode('ascii') * (size // 8 + 1))[:size]
+
+
+def _with_attachments(statements, size):
+    """
+    Give each statement an attachment of ``size`` bytes, returning
+    the attachment data by hash.
+    """
+    result = {}
+    for index, statement in enumerate(statements):
+        data = _attachment_data(index, size)
+        sha2 = hashlib.sha256(data).hexdigest()
+        ext = externalize(statement)
+        ext['attachments'] = [{
+            'usageType': u'http://adlnet.gov/expapi/attachments/signature',
+            'display': {u'en-US': u'Attachment'},
+            'contentType': u'application/octet-stream',
+            'length': size,
+            'sha2': sha2,
+        }]
+        statements[index] = internalize(ext, Statement)
+        result[sha2] = data
+    return result
+
+
+def _batches(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _time(func, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        runs.append(time.time() - start)
+    return runs
+
+
+def _memory(func, items):
+    """
+    Return the bytes per item of the objects the function returns,
+    or None without :mod:`tracemalloc`.
+    """
+    if tracemalloc is None:  # pragma: no cover
+        return None
+    tracemalloc.start()
+    try:
+        kept = func()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size // max(items, 1)
+
+
+def _result(runs, items, unit, **extra):
+    ordered = sorted(runs)
+    best = ordered[0]
+    result = OrderedDict((
+        ('items', items),
+        ('unit', unit),
+        ('runs', runs),
+        ('best', best),
+        ('median', ordered[len(ordered) // 2]),
+        ('rate', items / best if best else None),
+    ))
+    result.update(sorted(extra.items()))
+    return result
+
+
+class Benchmarks(object):
+    """
+    The benchmarks, each a method returning its timings.
+    """
+
+    names = ('about', 'about_new_session',
+             'to_external_object', 'externalize', 'encode_json', 'decode_json',
+             'read_statement_result',
+             'read_statement_result_fast', 'read_statement_result_compact',
+             'read_statement_result_interned',
+             'send_statements',
+             'send_statements_attachments', 'hash_files', 'hash_files_serial',
+             'save_documents',
+             'retrieve_documents', 'iter_statements', 'iter_statements_stream')
+
+    def __init__(self, statements=1000, shape=SIMPLE, repeat=3, batch_size=100,
+                 page_size=100, documents=100, document_size=1024,
+                 attachment_size=16 * 1024, seed=0, requests=100, codec=None,
+                 compression=None):
+        self.codec = get_codec(codec)
+        self.parameters = OrderedDict((
+            ('statements', statements),
+            ('shape', shape),
+            ('repeat', repeat),
+            ('requests', requests),
+            ('batch_size', batch_size),
+            ('page_size', page_size),
+            ('documents', documents),
+            ('document_size', document_size),
+            ('attachment_size', attachment_size),
+            ('seed', seed),
+            ('codec', self.codec.name),
+            ('compression', compression),
+        ))
+        self.compression = compression
+        self.count = statements
+        self.repeat = repeat
+        self.requests = requests
+        self.batch_size = batch_size
+        self.documents = documents
+        self.document_size = document_size
+        self.attachment_size = attachment_size
+        self.statements = generate_statements(statements, shape, seed=seed)
+        self.lrs = self.client = None
+
+    def run(self, names=None):
+        """
+        Run the benchmarks named, all of them by default, returning
+        their results by name.
+        """
+        names = names or self.names
+        unknown = set(names) - set(self.names)
+        if unknown:
+            raise ValueError('Unknown benchmarks %s' % ', '.join(sorted(unknown)))
+        result = OrderedDict()
+        with LocalLRS(page_size=self.parameters['page_size']) as lrs:
+            self.lrs = lrs
+            self.client = LRSClient(lrs.endpoint, codec=self.codec,
+                                    compression=self.compression)
+            try:
+                for name in names:
+                    logger.info("Running benchmark %s", name)
+                    result[name] = getattr(self, name)()
+            finally:
+                self.client.close()
+                self.lrs = self.client = None
+        return result
+
+    # transport
+
+    def _about(self, request):
+        url = self.client.endpoint + 'about'
+
+        def about():
+            for _ in range(self.requests):
+                request(url)
+        runs = _time(about, self.repeat)
+        return _result(runs, self.requests, 'requests')
+
+    def about(self):
+        return self._about(lambda url: self.client._request('GET', url).raise_for_status())
+
+    def about_new_session(self):
+        def request(url):
+            with self.client.new_session() as session:
+                session.get(url).raise_for_status()
+        return self._about(request)
+
+    # serialization
+
+    def to_external_object(self):
+        runs = _time(lambda: to_external_object(self.statements), self.repeat)
+        return _result(runs, self.count, 'statements')
+
+    def externalize(self):
+        runs = _time(lambda: externalize(self.statements), self.repeat)
+        return _result(runs, self.count, 'statements')
+
+    def encode_json(self):
+        payload = externalize(self.statements)
+        runs = _time(lambda: self.codec.dumps(payload), self.repeat)
+        return _result(runs, self.count, 'statements')
+
+    def decode_json(self):
+        data = self.codec.dumps(externalize(self.statements))
+        runs = _time(lambda: self.codec.loads(data), self.repeat)
+        return _result(runs, self.count, 'statements', bytes=len(data))
+
+    def _read_statement_result(self, **kwargs):
+        client = LRSClient(self.lrs.endpoint, codec=self.codec, **kwargs)
+        data = client.codec.dumps({'statements': externalize(self.statements),
+                                   'more': ''})
+        # measured first, while an interner holds nothing yet
+        memory = _memory(lambda: client.read_statement_result(data), self.count)
+        runs = _time(lambda: client.read_statement_result(data), self.repeat)
+        return _result(runs, self.count, 'statements', bytes=len(data),
+                       memory=memory)
+
+    def read_statement_result(self):
+        return self._read_statement_result()
+
+    def read_statement_result_fast(self):
+        return self._read_statement_result(fast_decode=True)
+
+    def read_statement_result_compact(self):
+        return self._read_statement_result(compact=True)
+
+    def read_statement_result_interned(self):
+        return self._read_statement_result(interner=True)
+
+    # client
+
+    def _send(self, batches, attachments=None):
+        session = self.client.session()
+        sent = [0]
+
+        def send():
+            for batch in batches:
+                response = self.client.send_statement_request_helper(
+                    'POST', session, batch, attachments)
+                response.raise_for_status()
+            sent[0] += 1
+        received = self.lrs.bytes_received
+        runs = _time(send, self.repeat)
+        size = (self.lrs.bytes_received - received) // max(sent[0], 1)
+        return _result(runs, self.count, 'statements', bytes=size)
+
+    def send_statements(self):
+        return self._send(_batches(self.statements, self.batch_size))
+
+    def send_statements_attachments(self):
+        statements = list(self.statements)
+        attachments = _with_attachments(statements, self.attachment_size)
+        return self._send(_batches(statements, self.batch_size), attachments)
+
+    def _hash_files(self, max_workers):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for index in range(self.documents):
+                paths.append(os.path.join(tmpdir, '%d' % index))
+                with open(paths[-1], 'wb') as fp:
+                    fp.write(_attachment_data(index, self.attachment_size))
+            runs = _time(lambda: hash_files(paths, max_workers=max_workers),
+                         self.repeat)
+        finally:
+            shutil.rmtree(tmpdir)
+        return _result(runs, self.documents, 'files',
+                       bytes=self.documents * self.attachment_size)
+
+    def hash_files(self):
+        return self._hash_files(4)
+
+    def hash_files_serial(self):
+        return self._hash_files(1)
+
+    def _states(self):
+        activity = Activity(id=u'http://example.com/activities/benchmark')
+        agent = Agent(mbox=str('mailto:benchmark@example.com'))
+        content = b'x' * self.document_size
+        return activity, agent, [StateDocument(id=u'state-%d' % i, content=content,
+                                               activity=activity, agent=agent)
+                                 for i in range(self.documents)]
+
+    def save_documents(self):
+        states = self._states()[2]
+
+        def save():
+            for state in states:
+                self.client.save_state(state)
+        runs = _time(save, self.repeat)
+        return _result(runs, self.documents, 'documents')
+
+    def retrieve_documents(self):
+        activity, agent, states = self._states()
+        for state in states:
+            self.client.save_state(state)
+
+        def retrieve():
+            for state in states:
+                self.client.retrieve_state(activity, agent, state.id)
+        runs = _time(retrieve, self.repeat)
+        return _result(runs, self.documents, 'documents')
+
+    def _iterate(self, stream):
+        self.lrs.statements.clear()
+        for ext in externalize(self.statements):
+            self.lrs.statements[ext['id']] = ext
+
+        def iterate():
+            for _ in self.client.iter_statements({}, stream=stream):
+                pass
+        runs = _time(iterate, self.repeat)
+        return _result(runs, self.count, 'statements')
+
+    def iter_statements(self):
+        return self._iterate(False)
+
+    def iter_statements_stream(self):
+        return self._iterate(True)
+
+
+def run_benchmarks(names=None, label=None, **parameters):
+    """
+    Run benchmarks, returning a JSON-serializable report of the
+    environment, the parameters and the results.
+
+    :param names: The benchmarks run, all by default; see
+        :attr:`Benchmarks.names`
+    :param label: A label for the run, such as a commit
+    :param parameters: See :class:`Benchmarks`
+    """
+    benchmarks = Benchmarks(**parameters)
+    results = benchmarks.run(names)
+    return OrderedDict((
+        ('label', label),
+        ('created', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('parameters', benchmarks.parameters),
+        ('benchmarks', results),
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u'Benchmark nti.xapi')
+    parser.add_argument('-n', '--statements', type=int, default=1000,
+                        help=u'The number of statements generated')
+    parser.add_argument('--shape', choices=SHAPES, default=SIMPLE,
+                        help=u'The shape of the statements generated')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help=u'The number of runs of each benchmark')
+    parser.add_argument('--requests', type=int, default=100,
+                        help=u'The requests sent by the transport benchmarks')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help=u'The statements sent in a request')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help=u'The statements in a page of results')
+    parser.add_argument('--documents', type=int, default=100,
+                        help=u'The number of documents saved and retrieved')
+    parser.add_argument('--document-size', type=int, default=1024,
+                        help=u'The size of the documents, in bytes')
+    parser.add_argument('--attachment-size', type=int, default=16 * 1024,
+                        help=u'The size of the attachments, in bytes')
+    parser.add_argument('--seed', type=int, default=0,
+                        help=u'The seed of the generated statements')
+    parser.add_argument('--codec', choices=list(CODECS),
+                        help=u'The JSON codec, by default the client\'s')
+    parser.add_argument('--compression', choices=list(COMPRESSORS),
+                        help=u'Compress the bodies sent, by default not')
+    parser.add_argument('--only', action='append', choices=Benchmarks.names,
+                        help=u'Run this benchmark; may be repeated')
+    parser.add_argument('--label', help=u'A label for the run, such as a commit')
+    parser.add_argument('-o', '--output',
+                        help=u'The file the JSON results are written to, '
+                             u'by default standard output')
+    args = parser.parse_args(argv)
+    report = run_benchmarks(names=args.only, label=args.label,
+                            statements=args.statements, shape=args.shape,
+                            repeat=args.repeat, requests=args.requests,
+                            batch_size=args.batch_size,
+                            page_size=args.page_size, documents=args.documents,
+                            document_size=args.document_size,
+                            attachment_size=args.attachment_size,
+                            seed=args.seed, codec=args.codec,
+                            compression=args.compression)
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(data)
+    else:
+        print(data)
+    return report
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A circuit breaker failing calls to an unavailable LRS fast.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import threading
+
+from zope import interface
+
+from nti.xapi.interfaces import ICircuitBreaker
+from nti.xapi.interfaces import CircuitOpenException
+
+from nti.xapi.retry import RETRY_ERRORS
+
+logger = __import__('logging').getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+@interface.implementer(ICircuitBreaker)
+class CircuitBreaker(object):
+    """
+    Opens after ``failure_threshold`` consecutive failed calls. While
+    open, calls raise :class:`CircuitOpenException` without being
+    made. Once ``reset_timeout`` seconds have passed, the next call
+    turns it half-open and runs the ``probe``: the breaker closes if
+    it succeeds and opens for another ``reset_timeout`` otherwise.
+    Calls made during the probe fail fast. Without a probe, the calls
+    made while half-open are the trials.
+
+    Give each endpoint its own breaker; the clients of an endpoint
+    may share one.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, probe=None,
+                 on_change=None, clock=time.time):
+        """
+        :param failure_threshold: Consecutive failures opening the breaker
+        :type failure_threshold: int
+        :param reset_timeout: Seconds the breaker stays open before probing
+        :type reset_timeout: float
+        :param probe: Called to check the LRS is healthy again; an
+            :class:`nti.xapi.client.LRSClient` sets its ``about``
+        :param on_change: Called with the old and new state on changes
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.on_change = on_change
+        self.clock = clock
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self.opened_at = None
+        self._state = CLOSED
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def state(self):
+        state = self._state
+        if state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return state
+
+    def _set_state(self, state):
+        # call with the lock held
+        old, self._state = self._state, state
+        if state == OPEN:
+            self.opened_at = self.clock()
+            if old != OPEN:
+                self.opened += 1
+        if old != state:
+            logger.info("Circuit breaker %s -> %s", old, state)
+            if self.on_change is not None:
+                self.on_change(old, state)
+
+    def metrics(self):
+        return {'state': self.state, 'failures': self.failures,
+                'opened': self.opened, 'rejected': self.rejected}
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        raise CircuitOpenException('Circuit breaker is open')
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state != CLOSED or self.failures >= self.failure_threshold:
+                self._set_state(OPEN)
+
+    def _trial(self):
+        """
+        Run the probe of a half-open breaker, returning True if calls
+        may go through.
+        """
+        if not self._probe_lock.acquire(False):
+            return False  # another thread is probing
+        try:
+            if self.state != HALF_OPEN:
+                return self._state == CLOSED
+            with self._lock:
+                self._set_state(HALF_OPEN)
+            if self.probe is None:
+                return True
+            self._local.probing = True
+            try:
+                healthy = self.probe()
+            except Exception:  # pylint: disable=broad-except
+                healthy = False
+            finally:
+                self._local.probing = False
+            if healthy:
+                self.record_success()
+            else:
+                self.record_failure()
+            return bool(healthy)
+        finally:
+            self._probe_lock.release()
+
+    def call(self, func):
+        if not getattr(self._local, 'probing', False):
+            state = self.state
+            if state == OPEN or (state == HALF_OPEN and not self._trial()):
+                self._reject()
+        try:
+            response = func()
+        except RETRY_ERRORS:
+            self.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+        return response
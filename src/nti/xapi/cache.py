@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Bounded caches for objects read from an LRS.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import threading
+
+from collections import OrderedDict
+from collections import namedtuple
+
+from zope import interface
+
+from nti.xapi.interfaces import IDocumentCache
+from nti.xapi.interfaces import IStatementCache
+
+logger = __import__('logging').getLogger(__name__)
+
+#: A cached state or profile document: its content and the lower-cased
+#: ``etag``, ``last-modified`` and ``content-type`` response headers
+CachedDocument = namedtuple('CachedDocument', ('content', 'headers'))
+
+
+class LRUCache(object):
+    """
+    A thread-safe mapping holding at most ``maxsize`` entries, evicting
+    the least recently used first. With a ``ttl``, entries also expire
+    that many seconds after they are set.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._lock = threading.Lock()
+        # key -> (value, expiry time or None)
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def _weigh(self, unused_value):
+        return 0
+
+    def _full(self):
+        return len(self._data) > self.maxsize
+
+    def _remove(self, key):
+        value = self._data.pop(key)[0]
+        self.weight -= self._weigh(value)
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                entry = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                self.weight -= self._weigh(value)
+                self.misses += 1
+                return default
+            self._data[key] = entry
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires)
+            self.weight += self._weigh(value)
+            while self._data and self._full():
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._remove(key)
+
+    def discard(self, predicate):
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+
+@interface.implementer(IDocumentCache)
+class DocumentCache(LRUCache):
+    """
+    Holds :class:`CachedDocument` entries, bounded by their number and
+    by the total size of their content.
+    """
+
+    def __init__(self, maxsize=1024, max_bytes=32 * 1024 * 1024):
+        """
+        :param maxsize: Maximum number of documents
+        :type maxsize: int
+        :param max_bytes: Maximum total size of the documents' content,
+            or None for no limit
+        :type max_bytes: int
+        """
+        super(DocumentCache, self).__init__(maxsize)
+        self.max_bytes = max_bytes
+
+    def _weigh(self, value):
+        return len(value.content or b'')
+
+    def _full(self):
+        return (super(DocumentCache, self)._full()
+                or (self.max_bytes is not None and self.weight > self.max_bytes))
+
+
+@interface.implementer(IStatementCache)
+class StatementCache(LRUCache):
+    """
+    Holds statements, bounded by their number and, by default, by
+    how long they are kept.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        """
+        :param maxsize: Maximum number of statements
+        :type maxsize: int
+        :param ttl: Seconds a statement is kept, or None to keep it
+            until evicted
+        :type ttl: float
+        """
+        super(StatementCache, self).__init__(maxsize, ttl)
@@ -8,10 +8,24 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import json
+import time
+import threading
+
+from functools import partial
+
+from collections import OrderedDict
+from collections import namedtuple
+
+from multiprocessing.pool import ThreadPool
+
 from requests import Session
 from requests import Request, HTTPError
+from requests import Timeout
 
-import simplejson as json
+from requests.adapters import HTTPAdapter
+from requests.adapters import DEFAULT_RETRIES
+from requests.adapters import DEFAULT_POOLSIZE
 
 import six
 from six.moves import urllib_parse
@@ -26,6 +40,21 @@ from nti.externalization import update_from_external_object
 
 from nti.xapi.about import About
 
+from nti.xapi.attachment import verify_attachment
+
+from nti.xapi.cache import CachedDocument
+
+from nti.xapi.codec import get_codec
+
+from nti.xapi.compact import CompactStatement
+from nti.xapi.compact import CompactStatementResult
+
+from nti.xapi.deadline import Deadline
+from nti.xapi.deadline import current_deadline
+from nti.xapi.deadline import deadline as scoped_deadline
+
+from nti.xapi.compression import RequestCompression
+
 from nti.xapi.documents.document import StateDocument
 from nti.xapi.documents.document import AgentProfileDocument
 from nti.xapi.documents.document import ActivityProfileDocument
@@ -34,18 +63,72 @@ from nti.xapi.documents.interfaces import IStateDocument
 from nti.xapi.documents.interfaces import IAgentProfileDocument
 from nti.xapi.documents.interfaces import IActivityProfileDocument
 
+from nti.xapi.externalization import externalize
+from nti.xapi.externalization import internalize
+
+from nti.xapi.ids import RANDOM
+from nti.xapi.ids import assign_ids
+from nti.xapi.ids import get_id_generator
+
+from nti.xapi.instrumentation import timed
+from nti.xapi.instrumentation import observed
+from nti.xapi.instrumentation import instrumented
+from nti.xapi.instrumentation import current_event
+
+from nti.xapi.interning import Interner
+
 from nti.xapi.interfaces import IAgent
 from nti.xapi.interfaces import Version
 from nti.xapi.interfaces import IActivity
 from nti.xapi.interfaces import ILRSClient
 from nti.xapi.interfaces import IStatement
+from nti.xapi.interfaces import LRSTimeoutException
+from nti.xapi.interfaces import CircuitOpenException
 from nti.xapi.interfaces import MissingAttachmentDataException
 
+from nti.xapi.multipart import SPOOL_SIZE
+from nti.xapi.multipart import MultipartEncoder
+from nti.xapi.multipart import get_boundary
+from nti.xapi.multipart import iter_multipart
+
+from nti.xapi.retry import RETRY_ERRORS
+
 from nti.xapi.statement import Statement
 from nti.xapi.statement import StatementResult
 
+from nti.xapi.streaming import StatementResultParser
+from nti.xapi.streaming import iter_statement_result
+
 logger = __import__('logging').getLogger(__name__)
 
+#: Bytes read at a time when parsing a response incrementally
+STREAM_CHUNK_SIZE = 64 * 1024
+
+#: The response headers kept with a cached document
+_DOCUMENT_HEADERS = ('etag', 'last-modified', 'content-type')
+
+_STATE_RESOURCE = 'activities/state'
+_ACTIVITY_PROFILE_RESOURCE = 'activities/profile'
+_AGENT_PROFILE_RESOURCE = 'agents/profile'
+
+#: The verb of statements voiding another
+VOIDED_VERB = 'http://adlnet.gov/expapi/verbs/voided'
+
+#: The errors after which statements are spilled
+_UNAVAILABLE_ERRORS = RETRY_ERRORS + (CircuitOpenException,)
+
+
+def _unavailable(status):
+    """
+    Whether statements answered with a status may be delivered later.
+    """
+    return status >= 500 or status in (408, 429)
+
+
+#: The outcome of one retrieval of a bulk call: the document, or None
+#: if there is none, and the exception raised, if any
+BulkResult = namedtuple('BulkResult', ('value', 'error'))
+
 # Date parsing lifted from webob.datetime_utils
 # for dealing with http header to datetime conversions
 # https://github.com/Pylons/webob/blob/master/src/webob/datetime_utils.py
@@ -90,11 +173,79 @@ def _parse_date(value):
     return datetime.fromtimestamp(t, UTC)
 
 
+class _Prefetch(object):
+    """
+    Runs a call on a background thread, holding its result. The call
+    keeps the deadline of the thread starting it.
+    """
+
+    def __init__(self, func, *args):
+        self._func = func
+        self._args = args
+        self._deadline = current_deadline()
+        self._result = self._error = None
+        self._thread = threading.Thread(target=self._run, name='Prefetch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            with scoped_deadline(self._deadline):
+                self._result = self._func(*self._args)
+        except Exception as e:  # pylint: disable=broad-except
+            self._error = e
+
+    def get(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error  # pylint: disable=raising-bad-type
+        return self._result
+
+
+def _positions(streams):
+    """
+    Return the (stream, position) of each stream, or None if one
+    can't be rewound.
+    """
+    result = []
+    for stream in streams or ():
+        if not hasattr(stream, 'seek'):
+            return None
+        try:
+            result.append((stream, stream.tell()))
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+    return result
+
+
+def _close_parts(parts):
+    for part in (parts or {}).values():
+        part.close()
+
+
 @interface.implementer(ILRSClient)
 class LRSClient(object):
 
     def __init__(self, endpoint, auth=None,
-                 version=Version.latest):
+                 version=Version.latest,
+                 pool_connections=DEFAULT_POOLSIZE,
+                 pool_maxsize=DEFAULT_POOLSIZE,
+                 max_retries=DEFAULT_RETRIES,
+                 keep_alive=True,
+                 fast_decode=False,
+                 codec=None,
+                 document_cache=None,
+                 statement_cache=None,
+                 verify_attachments=False,
+                 attachment_spool_size=SPOOL_SIZE,
+                 retry_policy=None,
+                 circuit_breaker=None,
+                 spill=None,
+                 statement_ids=None,
+                 compression=None,
+                 timeout=None,
+                 compact=False,
+                 interner=None):
         """
         LRSClient Constructor
 
@@ -104,6 +255,76 @@ class LRSClient(object):
         :type version: str
         :param auth: Authentication for interacting with the lrs
         :type auth: see requests.auth
+        :param pool_connections: Number of connection pools to cache
+        :type pool_connections: int
+        :param pool_maxsize: Maximum number of connections kept in a pool
+        :type pool_maxsize: int
+        :param max_retries: Retries for failed connections, see
+            :class:`requests.adapters.HTTPAdapter`
+        :type max_retries: int
+        :param keep_alive: Reuse connections between requests
+        :type keep_alive: bool
+        :param fast_decode: Build statements read from the LRS with
+            :func:`nti.xapi.externalization.internalize`
+        :type fast_decode: bool
+        :param codec: The JSON codec, or its name, see
+            :func:`nti.xapi.codec.get_codec`
+        :type codec: :class:`nti.xapi.interfaces.IJSONCodec`
+        :param document_cache: Cache for the state and profile documents
+            read, revalidated with conditional requests. It may be
+            shared by clients.
+        :type document_cache: :class:`nti.xapi.interfaces.IDocumentCache`
+        :param statement_cache: Cache for the statements retrieved,
+            saved and queried, consulted before retrieving a statement.
+            It may be shared by clients.
+        :type statement_cache: :class:`nti.xapi.interfaces.IStatementCache`
+        :param verify_attachments: Check the data of each attachment
+            against its declared hash and length before sending it, or
+            after receiving it, see
+            :func:`nti.xapi.attachment.verify_attachment`
+        :type verify_attachments: bool
+        :param attachment_spool_size: Largest attachment received kept
+            in memory; larger ones are spooled to a temporary file
+        :type attachment_spool_size: int
+        :param retry_policy: Retries failed idempotent calls: GETs,
+            statements sent with their ids and PUTs of documents with
+            an etag. It may be shared by clients, along with its
+            budget and metrics.
+        :type retry_policy: :class:`nti.xapi.interfaces.IRetryPolicy`
+        :param circuit_breaker: Fails calls fast, raising
+            :class:`nti.xapi.interfaces.CircuitOpenException`, while
+            the endpoint is failing. Without a probe of its own, it
+            probes with :meth:`about`.
+        :type circuit_breaker: :class:`nti.xapi.interfaces.ICircuitBreaker`
+        :param spill: Keeps the statements that can't be delivered
+            because the LRS is unreachable or fails, which are then
+            returned as saved. Statements are given ids before they
+            are sent, so replaying them is idempotent; see
+            :class:`nti.xapi.spill.SpillDrainer`.
+        :type spill: :class:`nti.xapi.interfaces.ISpillBuffer`
+        :param statement_ids: Give statements without an id one before
+            they are sent, making every write safe to retry: a
+            generator or its name, see
+            :func:`nti.xapi.ids.get_id_generator`. Random ids are
+            given by default when there is a ``spill`` buffer.
+        :param compression: Compresses the bodies of the statements
+            and documents sent, but not those with attachments; or
+            the content encoding to compress them with
+        :type compression: :class:`nti.xapi.compression.RequestCompression`
+        :param timeout: The timeout of each request, in seconds, or a
+            (connect, read) pair, as passed to :mod:`requests`. It may
+            be changed, and bounded by a deadline, for the calls
+            within a :func:`nti.xapi.deadline.deadline` block. A call
+            timing out raises
+            :class:`nti.xapi.interfaces.LRSTimeoutException`.
+        :param compact: Build the statements read from the LRS with
+            the compact classes of :mod:`nti.xapi.compact`, with the
+            fast internalization
+        :type compact: bool
+        :param interner: Shares the verbs, activities and agents of the
+            statements read, with the fast internalization; or True
+            for a new one
+        :type interner: :class:`nti.xapi.interning.Interner`
         """
         if endpoint and not endpoint.endswith('/'):
             endpoint = endpoint + '/'
@@ -111,12 +332,146 @@ class LRSClient(object):
         self.version = version
         self.endpoint = endpoint
         self.auth = auth
-
-    def session(self):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive
+        self.fast_decode = fast_decode
+        self.codec = get_codec(codec)
+        self.document_cache = document_cache
+        self.statement_cache = statement_cache
+        self.verify_attachments = verify_attachments
+        self.attachment_spool_size = attachment_spool_size
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.spill = spill
+        if statement_ids is None and spill is not None:
+            statement_ids = RANDOM
+        self.id_generator = get_id_generator(statement_ids) if statement_ids else None
+        if isinstance(compression, six.string_types):
+            compression = RequestCompression(compression)
+        self.compression = compression
+        self.timeout = timeout
+        self.compact = compact
+        self.interner = Interner() if interner is True else interner
+        if circuit_breaker is not None and circuit_breaker.probe is None:
+            circuit_breaker.probe = self.about
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def new_session(self):
+        """
+        Create a new session configured for this client.
+        """
         s = Session()
         s.headers.update({'X-Experience-API-Version': self.version})
+        if not self.keep_alive:
+            s.headers['Connection'] = 'close'
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              max_retries=self.max_retries)
+        s.mount('https://', adapter)
+        s.mount('http://', adapter)
         return s
 
+    def session(self):
+        """
+        Return the connection-pooled session shared by all the calls
+        made by this client, creating it if needed.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self.new_session()
+        return self._session
+
+    def close(self):
+        """
+        Close the pooled session and its connections. A new session
+        is created on the next call.
+        """
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def _request(self, method, url, **kwargs):
+        """
+        Send a request to the LRS through the pooled session, retrying
+        it if it is idempotent.
+        """
+        idempotent = kwargs.pop('idempotent', None)
+        if idempotent is None:
+            idempotent = (method in ('GET', 'HEAD')
+                          or (method == 'PUT' and 'If-Match' in (kwargs.get('headers') or ())))
+        timeout = kwargs.pop('timeout', None)
+        kwargs.setdefault('auth', self.auth)
+        session = self.session()
+        # dispatch through the verb helpers (get, put, delete)
+        send = partial(getattr(session, method.lower()), url)
+        if self.compression is None or kwargs.get('data') is None:
+            return self._retrying(partial(send, **kwargs), idempotent, timeout)
+
+        def attempt(data, headers):
+            sent = dict(kwargs, data=data, headers=headers)
+            return self._retrying(partial(send, **sent), idempotent, timeout)
+        return self.compression.send(attempt, kwargs['data'],
+                                     kwargs.get('headers') or {})
+
+    def _retrying(self, send, idempotent, timeout=None):
+        """
+        Make a call sending a request, which takes a ``timeout``
+        keyword, through the circuit breaker and retry policy.
+
+        :raises LRSTimeoutException: If the request times out
+        """
+        breaker = self.circuit_breaker
+
+        def attempt():
+            sent = partial(send, timeout=self._timeout(timeout))
+            event = current_event()
+            if event is not None:
+                sent = partial(self._observed, event, sent)
+            if breaker is None:
+                return sent()
+            return breaker.call(sent)
+        try:
+            if self.retry_policy is None or not idempotent:
+                return attempt()
+            return self.retry_policy.call(attempt)
+        except LRSTimeoutException:
+            raise
+        except Timeout as e:
+            six.raise_from(LRSTimeoutException(e, request=e.request,
+                                               response=e.response), e)
+
+    @staticmethod
+    def _observed(event, send):
+        start = time.time()
+        try:
+            response = send()
+        finally:
+            event.network += time.time() - start
+            event.attempts += 1
+        event.record_response(response)
+        return response
+
+    def _timeout(self, timeout=None):
+        """
+        Return the timeout of a request: the one given, that of the
+        deadline or that of this client, lowered to the time left
+        before the deadline.
+        """
+        current = current_deadline()
+        if timeout is None and current is not None:
+            timeout = current.timeout
+        if timeout is None:
+            timeout = self.timeout
+        return timeout if current is None else current.cap(timeout)
+
+    def _json_param(self, obj):
+        return self.codec.dumps(obj).decode('utf-8')
+
     @classmethod
     def prepare_json_text(cls, data):
         if isinstance(data, six.binary_type):
@@ -125,68 +480,150 @@ class LRSClient(object):
 
     # about
 
+    @instrumented
     def about(self):
         result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "about")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = self.read_about(data)
-            else:
-                logger.error("Invalid server response [%s] while getting about.",
-                             response.status_code)
-            return result
+        url = urllib_parse.urljoin(self.endpoint, "about")
+        response = self._request('GET', url)
+        if response.ok:
+            data = self.prepare_json_text(response.text)
+            result = self.read_about(data)
+        else:
+            logger.error("Invalid server response [%s] while getting about.",
+                         response.status_code)
+        return result
 
     def read_about(self, data):
-        result = About()
-        data = json.loads(data, "utf-8")
-        update_from_external_object(result, data)
+        with timed('parsing'):
+            result = About()
+            data = self.codec.loads(data)
+            update_from_external_object(result, data)
         return result
 
     # statements
 
+    @instrumented
     def save_statement(self, statement, attachments=None):
         statement = IStatement(statement, statement)
-        with self.session() as session:
-            sid = statement.id
-            params = {"statementId": sid} if sid else None
-            method = 'PUT' if sid else 'POST'
-            response = self.send_statement_request_helper(method, session, [statement], attachments, params)
-            try:
-                response.raise_for_status()
-                data = self.prepare_json_text(response.text)
-                data = (sid,) if sid else json.loads(data, "utf-8")
-                statement.id = data[0]
-            except HTTPError:
-                logger.error("Invalid server response [%s] while saving statement.", response.status_code)
-                statement = None
-            return statement
-
-    def save_statements(self, statements, attachments=None):
-        with self.session() as session:
-            method = 'POST'
-            response = self.send_statement_request_helper(method, session, statements, attachments)
-            try:
-                response.raise_for_status()
+        if self.id_generator is not None:
+            assign_ids((statement,), self.id_generator)
+        sid = statement.id
+        params = {"statementId": sid} if sid else None
+        method = 'PUT' if sid else 'POST'
+        response, spilled = self._send_statements(method, [statement], attachments,
+                                                  params, self.spill)
+        if response is None:
+            return statement if spilled else None
+        try:
+            response.raise_for_status()
+            data = self.prepare_json_text(response.text)
+            with timed('parsing'):
+                data = (sid,) if sid else self.codec.loads(data)
+            statement.id = data[0]
+            self._cache_statements((statement,))
+        except HTTPError:
+            logger.error("Invalid server response [%s] while saving statement.", response.status_code)
+            statement = None
+        return statement
+
+    @instrumented
+    def save_statements(self, statements, attachments=None, encoded=None):
+        """
+        :param encoded: The JSON of each statement, sent as it is
+            rather than encoded again when no ids are to be assigned
+        :type encoded: list of bytes
+        """
+        return self._save_statements(statements, attachments, self.spill,
+                                     encoded=encoded)
+
+    @instrumented
+    def replay_statements(self, statements, attachments=None):
+        """
+        Save statements read back from a spill queue. Unlike
+        :meth:`save_statements`, they are not spilled again when they
+        can't be delivered, and an error response raises
+        :class:`requests.HTTPError`.
+        """
+        return self._save_statements(statements, attachments, None, True)
+
+    def _save_statements(self, statements, attachments, spill, raise_errors=False,
+                         encoded=None):
+        if self.id_generator is not None and not all(s.id for s in statements):
+            assign_ids(statements, self.id_generator)
+            encoded = None
+        response, spilled = self._send_statements('POST', statements, attachments,
+                                                  spill=spill, encoded=encoded)
+        if response is None:
+            return statements if spilled else None
+        try:
+            response.raise_for_status()
+            # the ids are only read back when the LRS assigned some
+            if not all(s.id for s in statements):
                 data = self.prepare_json_text(response.text)
-                data = json.loads(data, "utf-8")
+                with timed('parsing'):
+                    data = self.codec.loads(data)
                 for s, statement_id in zip(statements, data):
                     s.id = statement_id
-            except HTTPError:
-                logger.error("Invalid server response [%s] while saving statement.", response.status_code)
-                statements = None
-            return statements
+            self._cache_statements(statements)
+        except HTTPError:
+            if raise_errors:
+                raise
+            logger.error("Invalid server response [%s] while saving statement.", response.status_code)
+            statements = None
+        return statements
+
+    def _send_statements(self, method, statements, attachments, params=None,
+                         spill=None, encoded=None):
+        """
+        Send statements, handing them to the spill buffer instead when
+        the LRS can't be reached or answers with a server error.
 
-    def send_statement_request_helper(self, method, session, statements, attachments, params=None):
+        :return: The response and False, or None and whether the
+            statements were spilled
+        """
+        session = self.session()
+        positions = None
+        if spill is not None:
+            positions = _positions([data for data in (attachments or {}).values()
+                                    if hasattr(data, 'read')])
+        try:
+            response = self.send_statement_request_helper(method, session, statements,
+                                                          attachments, params,
+                                                          encoded)
+        except _UNAVAILABLE_ERRORS as e:
+            if spill is None:
+                raise
+            logger.warning("Could not send %s statement(s): %s", len(statements), e)
+            return None, self._spill(spill, statements, attachments, positions)
+        if spill is not None and _unavailable(response.status_code):
+            logger.warning("Invalid server response [%s] while saving statement.",
+                           response.status_code)
+            return None, self._spill(spill, statements, attachments, positions)
+        return response, False
+
+    def _spill(self, spill, statements, attachments, positions):
+        # the attachment data is kept from where it was first sent
+        for stream, position in positions or ():
+            stream.seek(position)
+        if spill.put(list(statements), attachments) is False:
+            logger.error("Spill buffer full, dropping %s statement(s)", len(statements))
+            return False
+        return True
+
+    def send_statement_request_helper(self, method, session, statements, attachments, params=None,
+                                      encoded=None):
         url = urllib_parse.urljoin(self.endpoint, "statements")
-        payload = to_external_object(statements)
-        if not attachments:
-            r = Request(method, url, params=params, json=payload, auth=self.auth)
-            prepped = session.prepare_request(r)
-        else:
-            files = {'json': ('json', json.dumps(payload), 'application/json')}
+        with timed('serialization'):
+            if encoded is not None:
+                body = b'[' + b','.join(encoded) + b']'
+            else:
+                payload = externalize(statements)
+                body = self.codec.dumps(payload)
+        parts = streams = None
+        if attachments:
+            parts = [((('Content-Type', 'application/json'),), body)]
+            streams = []
+            sent = set()
             for statement in statements:
                 for attachment in statement.attachments or ():
                     if not attachment.fileUrl:  # This is not a url based attachment.
@@ -195,53 +632,88 @@ class LRSClient(object):
                         if not attachment_file:
                             err_msg = 'Provided attachment hash is not a reference to an Attachment in this Statement'
                             raise MissingAttachmentDataException(err_msg, file_hash)
-                        files[file_hash] = (file_hash, attachment_file, attachment.contentType,
-                                            {'X-Experience-API-Hash': file_hash,
-                                             'Content-Transfer-Encoding': 'binary'})
-
-            # send request, if request has an attachment, we must manually update the content header
-            prepped = session.prepare_request(
-                Request(method, url, files=files, params=params, json=payload, auth=self.auth))
-            # xapi requires the content-type of requests with attachments to be 'mutlipart/mixed'
-            prepped.headers['Content-type'] = prepped.headers['Content-type']\
-                .replace('multipart/form-data', 'multipart/mixed')
-        return session.send(prepped)
+                        if file_hash in sent:
+                            continue
+                        sent.add(file_hash)
+                        if self.verify_attachments:
+                            verify_attachment(attachment, attachment_file)
+                        parts.append(((('Content-Type', attachment.contentType),
+                                       ('Content-Transfer-Encoding', 'binary'),
+                                       ('X-Experience-API-Hash', file_hash)),
+                                      attachment_file))
+                        if hasattr(attachment_file, 'read'):
+                            streams.append(attachment_file)
+
+        # a statement with an id is stored once, however often it is
+        # sent; attachment files are read again from where they were
+        positions = None
+        if all(s.id for s in statements):
+            positions = _positions(streams)
+
+        def send(data, headers, timeout=None):
+            for stream, position in positions or ():
+                stream.seek(position)
+            if parts is not None:
+                # xapi requires requests with attachments to be 'multipart/mixed';
+                # the body is read from the attachment files as it is sent
+                data = MultipartEncoder(parts)
+                headers = {'Content-Type': data.content_type}
+            r = Request(method, url, params=params, data=data,
+                        headers=headers, auth=self.auth)
+            prepped = session.prepare_request(r)
+            # pick up the same verify/proxy settings Session.request would
+            # use so the prepared request shares the pooled connections
+            settings = session.merge_environment_settings(prepped.url, {}, None, None, None)
+            return session.send(prepped, timeout=timeout, **settings)
+
+        def attempt(data, headers):
+            return self._retrying(partial(send, data, headers), positions is not None)
 
+        headers = {'Content-Type': 'application/json'}
+        if parts is None and self.compression is not None:
+            return self.compression.send(attempt, body, headers)
+        return attempt(body, headers)
+
+    @instrumented
     def retrieve_statement(self, statement_id):
-        result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "statements")
-            # pylint: disable=too-many-function-args
-            payload = {"statementId": statement_id}
-            response = session.get(url, auth=self.auth,
-                                   params=payload)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = self.read_statement(data)
-            else:
-                logger.error("Invalid server response [%s] while getting statement %s",
-                             response.status_code, statement_id)
+        key = self._statement_key(statement_id)
+        result = self._cached_statement(key)
+        if result is not None:
             return result
+        url = urllib_parse.urljoin(self.endpoint, "statements")
+        payload = {"statementId": statement_id}
+        response = self._request('GET', url, params=payload)
+        if response.ok:
+            data = self.prepare_json_text(response.text)
+            result = self.read_statement(data)
+            self._cache_statement(key, result)
+        else:
+            logger.error("Invalid server response [%s] while getting statement %s",
+                         response.status_code, statement_id)
+        return result
     statement = get_statement = retrieve_statement
 
+    @instrumented
     def retrieve_voided_statement(self, statement_id):
-        result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "statements")
-            # pylint: disable=too-many-function-args
-            payload = {"voidedStatementId": statement_id}
-            response = session.get(url, auth=self.auth,
-                                   params=payload)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = self.read_statement(data)
-            else:
-                logger.error("Invalid server response [%s] while getting voided statement %s",
-                             response.status_code, statement_id)
+        key = self._statement_key(statement_id, voided=True)
+        result = self._cached_statement(key)
+        if result is not None:
             return result
+        url = urllib_parse.urljoin(self.endpoint, "statements")
+        payload = {"voidedStatementId": statement_id}
+        response = self._request('GET', url, params=payload)
+        if response.ok:
+            data = self.prepare_json_text(response.text)
+            result = self.read_statement(data)
+            self._cache_statement(key, result)
+        else:
+            logger.error("Invalid server response [%s] while getting voided statement %s",
+                         response.status_code, statement_id)
+        return result
     get_voided_statement = retrieve_voided_statement
 
-    def query_statements(self, query):
+    @instrumented
+    def query_statements(self, query, callback=None):
         params = {}
         param_keys = (
             "registration",
@@ -262,51 +734,288 @@ class LRSClient(object):
                 elif k in param_keys:
                     params[k] = to_external_object(v)
                 elif k == 'agent':
-                    params[k] = json.dumps(to_external_object(v))
+                    params[k] = self._json_param(externalize(v))
 
         result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "statements")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth, params=query)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = self.read_statement_result(data)
-            else:
-                logger.error("Invalid server response [%s] while querying statements",
-                             response.status_code)
-            return result
+        cache = self._caches_query(query)
+        if cache and callback is not None:
+            callback = self._caching_callback(callback)
+        url = urllib_parse.urljoin(self.endpoint, "statements")
+        response = self._request('GET', url, params=query,
+                                 stream=callback is not None)
+        if response.ok:
+            result = self._read_statement_result_response(response, callback)
+            if cache:
+                self._cache_statements(result.statements or ())
+        else:
+            logger.error("Invalid server response [%s] while querying statements",
+                         response.status_code)
+        return result
 
-    def more_statements(self, more_url):
+    @instrumented
+    def more_statements(self, more_url, callback=None):
         result = None
         more_url = getattr(more_url, "more", more_url)
         more_url = urllib_parse.urljoin(self._get_endpoint_server_root(),
                                         more_url)
-        with self.session() as session:
-            # pylint: disable=too-many-function-args
-            response = session.get(more_url, auth=self.auth)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = self.read_statement_result(data)
-            else:
-                logger.error("Invalid server response [%s] while getting more statements",
-                             response.status_code)
-            return result
+        response = self._request('GET', more_url,
+                                 stream=callback is not None)
+        if response.ok:
+            result = self._read_statement_result_response(response, callback)
+        else:
+            logger.error("Invalid server response [%s] while getting more statements",
+                         response.status_code)
+        return result
+
+    def _read_statement_result_response(self, response, callback):
+        if callback is not None or self._multipart_boundary(response):
+            return self.read_statement_result_stream(response, callback)
+        data = self.prepare_json_text(response.text)
+        return self.read_statement_result(data)
+
+    def iter_statements(self, query, max_statements=None, prefetch=True,
+                        stream=False, deadline=None):
+        # the iteration keeps the deadline it was started under, as
+        # the pages are fetched as it goes
+        budget = current_deadline()
+        if deadline is not None:
+            if not isinstance(deadline, Deadline):
+                deadline = Deadline(deadline)
+            budget = deadline if budget is None else deadline.within(budget)
+        if stream:
+            return self._iter_streamed_statements(query, max_statements, budget)
+        return self._iter_paged_statements(query, max_statements, prefetch, budget)
+
+    def _iter_paged_statements(self, query, max_statements, prefetch, budget=None):
+        cache = self._caches_query(query)
+        with scoped_deadline(budget):
+            result = self.query_statements(query)
+        count = 0
+        first = True
+        while result is not None:
+            more = result.more
+            statements, result = result.statements or (), None
+            if cache and not first:
+                self._cache_statements(statements)
+            first = False
+            if max_statements is not None:
+                statements = statements[:max_statements - count]
+                if count + len(statements) >= max_statements:
+                    more = None  # no page is fetched past the last wanted
+            pending = None
+            if more and prefetch:
+                with scoped_deadline(budget):
+                    pending = _Prefetch(self.more_statements, more)
+            for statement in statements:
+                count += 1
+                yield statement
+            if pending is not None:
+                result = pending.get()
+            elif more:
+                with scoped_deadline(budget):
+                    result = self.more_statements(more)
+
+    def _iter_streamed_statements(self, query, max_statements, budget=None):
+        url = urllib_parse.urljoin(self.endpoint, "statements")
+        params = query
+        cache = self._caches_query(query)
+        count = 0
+        operation = 'query_statements'
+        while url and (max_statements is None or count < max_statements):
+            # observed as the paged iteration is; the page is parsed
+            # as it is consumed, outside of the event
+            with observed(operation, self.endpoint), scoped_deadline(budget):
+                response = self._request('GET', url, params=params, stream=True)
+            operation = 'more_statements'
+            result = StatementResult()
+            try:
+                if not response.ok:
+                    logger.error("Invalid server response [%s] while iterating statements",
+                                 response.status_code)
+                    return
+                for statement in self.iter_statement_result(response, result):
+                    if max_statements is not None and count >= max_statements:
+                        return
+                    if cache:
+                        self._cache_statements((statement,))
+                    count += 1
+                    yield statement
+            finally:
+                response.close()
+                _close_parts(result.attachments)
+            params = None
+            url = result.more and urllib_parse.urljoin(self._get_endpoint_server_root(),
+                                                       result.more)
 
     def read_statement(self, data):
-        data = json.loads(data, "utf-8")
+        with timed('parsing'):
+            data = self.codec.loads(data)
+            return self.read_statement_external(data)
+
+    def read_statement_external(self, data):
+        if self.compact:
+            return internalize(data, CompactStatement, self.interner)
+        if self.fast_decode or self.interner is not None:
+            return internalize(data, Statement, self.interner)
         stmt = Statement()
         update_from_external_object(stmt, data)
         return stmt
 
     def read_statement_result(self, data):
-        data = json.loads(data, "utf-8")
+        with timed('parsing'):
+            data = self.codec.loads(data)
+            if self.compact:
+                return internalize(data, CompactStatementResult, self.interner)
+            if self.fast_decode or self.interner is not None:
+                return internalize(data, StatementResult, self.interner)
+            result = StatementResult()
+            update_from_external_object(result, data)
+        return result
+
+    def iter_statement_result(self, response, result=None):
+        """
+        Incrementally parse a statement result response, yielding each
+        statement as soon as its JSON element has been read. Once
+        exhausted, the ``more`` link is set on the given result.
+
+        A ``multipart/mixed`` response, sent when attachments are
+        queried, is read whole first, spooling its attachment parts,
+        which are then set on the given result as well; see
+        :meth:`read_multipart_statements`.
+
+        :param response: A response requested with ``stream=True``
+        :param result: The result to update
+        :type result: :class:`nti.xapi.interfaces.IStatementResult`
+        """
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        boundary = self._multipart_boundary(response)
+        first = attachments = None
+        if boundary:
+            first, attachments = self.read_multipart_statements(chunks, boundary)
+            chunks = iter(lambda: first.read(STREAM_CHUNK_SIZE), b'')
+        parser = StatementResultParser(response.encoding or 'utf-8',
+                                       self.codec.loads)
+        complete = False
+        try:
+            for data in iter_statement_result(chunks, parser):
+                yield self.read_statement_external(data)
+            complete = True
+        finally:
+            if first is not None:
+                first.close()
+            # attachments nobody will see are released
+            if attachments and (not complete or result is None):
+                _close_parts(attachments)
+        if result is not None:
+            result.more = parser.more
+            if attachments is not None:
+                result.attachments = attachments
+
+    def read_statement_result_stream(self, response, callback=None):
+        """
+        Incrementally parse a statement result response. Each statement
+        is passed to the callback as soon as it is read, otherwise they
+        are collected in the returned result.
+        """
         result = StatementResult()
-        update_from_external_object(result, data)
+        statements = []
+        # reading the response counts, as it is read as it is parsed
+        with timed('parsing'):
+            for statement in self.iter_statement_result(response, result):
+                if callback is None:
+                    statements.append(statement)
+                else:
+                    callback(statement)
+        result.statements = statements
+        return result
+
+    @staticmethod
+    def _multipart_boundary(response):
+        content_type = response.headers.get('Content-Type') or ''
+        if content_type.lower().startswith('multipart/mixed'):
+            return get_boundary(content_type)
+        return None
+
+    def read_multipart_statements(self, chunks, boundary):
+        """
+        Read a ``multipart/mixed`` statements response, returning its
+        first part, the statements, and a mapping of its attachment
+        parts by their ``X-Experience-API-Hash``. Parts larger than
+        :attr:`attachment_spool_size` are spooled to temporary files,
+        released when the parts are closed.
+
+        :param chunks: An iterable of the bytes of the response body
+        :param boundary: The boundary of the parts
+        :type boundary: str
+        :rtype: tuple of (:class:`nti.xapi.multipart.MultipartPart`, dict)
+        :raises AttachmentMismatchException: If :attr:`verify_attachments`
+            is set and a part does not match its hash
+        """
+        parts = iter_multipart(chunks, boundary, self.attachment_spool_size)
+        first = next(parts, None)
+        if first is None:
+            raise ValueError('Multipart statements response without parts')
+        attachments = {}
+        try:
+            for part in parts:
+                attachments[part.sha2] = part
+                if self.verify_attachments:
+                    verify_attachment(part, part.file)
+        except Exception:
+            first.close()
+            _close_parts(attachments)
+            raise
+        return first, attachments
+
+    # statement cache
+
+    def _statement_key(self, statement_id, voided=False):
+        return (self.endpoint, voided, statement_id)
+
+    def _cached_statement(self, key):
+        cache = self.statement_cache
+        if cache is None:
+            return None
+        result = cache.get(key)
+        event = current_event()
+        if event is not None:
+            event.cache = 'miss' if result is None else 'hit'
         return result
 
+    def _cache_statement(self, key, statement):
+        if self.statement_cache is not None and statement is not None:
+            self.statement_cache.set(key, statement)
+
+    def _cache_statements(self, statements):
+        cache = self.statement_cache
+        if cache is None:
+            return
+        for statement in statements:
+            if statement.id:
+                cache.set(self._statement_key(statement.id), statement)
+            # the target of a voiding statement is only retrieved as voided
+            verb = getattr(statement.verb, 'id', None)
+            target = getattr(statement.object, 'id', None)
+            if verb == VOIDED_VERB and target:
+                cache.pop(self._statement_key(target))
+
+    def _caches_query(self, query):
+        """
+        Whether the statements a query returns are cached. Only those
+        in the ``exact`` format are complete.
+        """
+        return (self.statement_cache is not None
+                and (query or {}).get('format') in (None, 'exact'))
+
+    def _caching_callback(self, callback):
+        def caching(statement):
+            self._cache_statements((statement,))
+            callback(statement)
+        return caching
+
     # states
 
+    @instrumented
     def retrieve_state_ids(self, activity, agent, registration=None, since=None):
         agent = IAgent(agent, agent)
         activity = IActivity(activity, activity)
@@ -314,7 +1023,7 @@ class LRSClient(object):
         # set params
         params = {
             "activityId": activity.id,
-            "agent": json.dumps(to_external_object(agent))
+            "agent": self._json_param(externalize(agent))
         }
         if registration is not None:
             params["registration"] = registration
@@ -323,20 +1032,21 @@ class LRSClient(object):
 
         # query
         result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/state")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth, params=params)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = json.loads(data)
-            else:
-                logger.error("Invalid server response [%s] while getting state ids",
-                             response.status_code)
-            return result
+        url = urllib_parse.urljoin(self.endpoint, _STATE_RESOURCE)
+        response = self._request('GET', url, params=params)
+        if response.ok:
+            data = self.prepare_json_text(response.text)
+            with timed('parsing'):
+                result = self.codec.loads(data)
+        else:
+            logger.error("Invalid server response [%s] while getting state ids",
+                         response.status_code)
+        return result
     get_state_ids = retrieve_state_ids
 
-    def retrieve_state(self, activity, agent, state_id, registration=None):
+    @instrumented
+    def retrieve_state(self, activity, agent, state_id, registration=None,
+                       timeout=None):
         agent = IAgent(agent, agent)
         activity = IActivity(activity, activity)
 
@@ -344,31 +1054,46 @@ class LRSClient(object):
         params = {
             'stateId': state_id,
             "activityId": activity.id,
-            "agent": json.dumps(to_external_object(agent))
+            "agent": self._json_param(externalize(agent))
         }
         if registration is not None:
             params["registration"] = registration
 
         # query
-        result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/state")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth, params=params)
-            if response.ok:
-                data = response.content
-                result = StateDocument(id=state_id,
-                                       content=data,
-                                       activity=activity,
-                                       agent=agent)
-                self._set_document_headers(result, response.headers)
-            elif response.status_code != 404:
-                logger.error("Invalid server response [%s] while getting state %s",
-                             response.status_code, state_id)
+        key = self._document_key(_STATE_RESOURCE, activity, agent,
+                                 registration, state_id)
+        url = urllib_parse.urljoin(self.endpoint, _STATE_RESOURCE)
+        result, response = self._retrieve_document(url, params, key,
+                                                   StateDocument, timeout,
+                                                   id=state_id,
+                                                   activity=activity,
+                                                   agent=agent)
+        if result is None and response.status_code != 404:
+            logger.error("Invalid server response [%s] while getting state %s",
+                         response.status_code, state_id)
 
-            return result
+        return result
     get_state = retrieve_state
 
+    def retrieve_states(self, requests, max_workers=None, timeout=None):
+        """
+        Retrieve many states concurrently over the pooled connections.
+
+        :param requests: The (activity, agent, state_id) or (activity,
+            agent, state_id, registration) tuples of the states
+        :param max_workers: Most states retrieved at once, by default
+            the connection pool size
+        :type max_workers: int
+        :param timeout: Seconds to wait for each response
+        :type timeout: float
+        :return: A :class:`BulkResult` by request, in order
+        :rtype: :class:`collections.OrderedDict`
+        """
+        calls = OrderedDict((request, (self.retrieve_state, request))
+                            for request in requests)
+        return self._fan_out(calls, max_workers, timeout)
+
+    @instrumented
     def save_state(self, state):
         state = IStateDocument(state, state)
 
@@ -377,7 +1102,7 @@ class LRSClient(object):
         params = {
             'stateId': state.id,
             "activityId": state.activity.id,
-            "agent": json.dumps(to_external_object(state.agent))
+            "agent": self._json_param(externalize(state.agent))
         }
         headers = {
             "Content-Type": state.content_type or "application/octet-stream"
@@ -386,15 +1111,15 @@ class LRSClient(object):
             headers["If-Match"] = state.etag
 
         result = state
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/state")
-            # pylint: disable=too-many-function-args
-            response = session.put(url, auth=self.auth, params=params,
-                                   data=state.content, headers=headers)
-            if not (200 <= response.status_code < 300):
-                logger.error("Invalid server response [%s] while saving state %s",
-                             response.status_code, state.id)
-                result = None
+        self._invalidate_documents(_STATE_RESOURCE, state.activity,
+                                   state.agent, document_id=state.id)
+        url = urllib_parse.urljoin(self.endpoint, _STATE_RESOURCE)
+        response = self._request('PUT', url, params=params,
+                                 data=state.content, headers=headers)
+        if not (200 <= response.status_code < 300):
+            logger.error("Invalid server response [%s] while saving state %s",
+                         response.status_code, state.id)
+            result = None
         return result
 
     def _delete_state(self, activity, agent, state_id=None, registration=None, etag=None):
@@ -420,7 +1145,7 @@ class LRSClient(object):
         # pylint: disable=no-member
         params = {
             "activityId": activity.id,
-            "agent": json.dumps(to_external_object(agent))
+            "agent": self._json_param(externalize(agent))
         }
         if state_id is not None:
             params["stateId"] = state_id
@@ -431,17 +1156,18 @@ class LRSClient(object):
         headers = {"If-Match": etag} if etag else None
 
         result = True
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/state")
-            # pylint: disable=too-many-function-args
-            response = session.delete(url, auth=self.auth, params=params,
-                                      headers=headers)
-            if not (200 <= response.status_code < 300):
-                logger.error("Invalid server response [%s] while deleting state %s",
-                             response.status_code, state_id)
-                result = False
+        self._invalidate_documents(_STATE_RESOURCE, activity, agent,
+                                   registration, state_id)
+        url = urllib_parse.urljoin(self.endpoint, _STATE_RESOURCE)
+        response = self._request('DELETE', url, params=params,
+                                 headers=headers)
+        if not (200 <= response.status_code < 300):
+            logger.error("Invalid server response [%s] while deleting state %s",
+                         response.status_code, state_id)
+            result = False
         return result
 
+    @instrumented
     def delete_state(self, state):
         return self._delete_state(
             activity=state.activity,
@@ -450,6 +1176,7 @@ class LRSClient(object):
             etag=state.etag
         )
 
+    @instrumented
     def clear_state(self, activity, agent, registration=None):
         return self._delete_state(
             activity=activity,
@@ -459,6 +1186,7 @@ class LRSClient(object):
 
     # activity profiles
 
+    @instrumented
     def retrieve_activity_profile_ids(self, activity, since=None):
         activity = IActivity(activity, activity)
 
@@ -471,20 +1199,20 @@ class LRSClient(object):
             params["since"] = since
 
         result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/profile")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth, params=params)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = json.loads(data)
-            else:
-                logger.error("Invalid server response [%s] while activity profile ids",
-                             response.status_code)
+        url = urllib_parse.urljoin(self.endpoint, _ACTIVITY_PROFILE_RESOURCE)
+        response = self._request('GET', url, params=params)
+        if response.ok:
+            data = self.prepare_json_text(response.text)
+            with timed('parsing'):
+                result = self.codec.loads(data)
+        else:
+            logger.error("Invalid server response [%s] while activity profile ids",
+                         response.status_code)
         return result
     get_activity_profile_ids = retrieve_activity_profile_ids
 
-    def retrieve_activity_profile(self, activity, profile_id):
+    @instrumented
+    def retrieve_activity_profile(self, activity, profile_id, timeout=None):
         activity = IActivity(activity, activity)
 
         # set params
@@ -495,24 +1223,36 @@ class LRSClient(object):
         }
 
         # query
-        result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/profile")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth, params=params)
-            if response.ok:
-                data = response.content
-                result = ActivityProfileDocument(id=profile_id,
-                                                 content=data,
-                                                 activity=activity)
-                self._set_document_headers(result, response.headers)
-            elif response.status_code != 404:
-                logger.error("Invalid server response [%s] while getting activity profile %s",
-                             response.status_code, profile_id)
+        key = self._document_key(_ACTIVITY_PROFILE_RESOURCE, activity,
+                                 document_id=profile_id)
+        url = urllib_parse.urljoin(self.endpoint, _ACTIVITY_PROFILE_RESOURCE)
+        result, response = self._retrieve_document(url, params, key,
+                                                   ActivityProfileDocument,
+                                                   timeout,
+                                                   id=profile_id,
+                                                   activity=activity)
+        if result is None and response.status_code != 404:
+            logger.error("Invalid server response [%s] while getting activity profile %s",
+                         response.status_code, profile_id)
 
-            return result
+        return result
     get_activity_profile = retrieve_activity_profile
 
+    def retrieve_activity_profiles(self, activity, profile_ids,
+                                   max_workers=None, timeout=None):
+        """
+        Retrieve many profiles of an activity concurrently, see
+        :meth:`retrieve_states`.
+
+        :return: A :class:`BulkResult` by profile id, in order
+        :rtype: :class:`collections.OrderedDict`
+        """
+        calls = OrderedDict((profile_id,
+                             (self.retrieve_activity_profile, (activity, profile_id)))
+                            for profile_id in profile_ids)
+        return self._fan_out(calls, max_workers, timeout)
+
+    @instrumented
     def save_activity_profile(self, profile):
         profile = IActivityProfileDocument(profile, profile)
 
@@ -529,17 +1269,18 @@ class LRSClient(object):
             headers["If-Match"] = profile.etag
 
         result = profile
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/profile")
-            # pylint: disable=too-many-function-args
-            response = session.put(url, auth=self.auth, params=params,
-                                   data=profile.content, headers=headers)
-            if not (200 <= response.status_code < 300):
-                logger.error("Invalid server response [%s] while saving activity profile %s",
-                             response.status_code, profile.id)
-                result = None
+        self._invalidate_documents(_ACTIVITY_PROFILE_RESOURCE,
+                                   profile.activity, document_id=profile.id)
+        url = urllib_parse.urljoin(self.endpoint, _ACTIVITY_PROFILE_RESOURCE)
+        response = self._request('PUT', url, params=params,
+                                 data=profile.content, headers=headers)
+        if not (200 <= response.status_code < 300):
+            logger.error("Invalid server response [%s] while saving activity profile %s",
+                         response.status_code, profile.id)
+            result = None
         return result
 
+    @instrumented
     def delete_activity_profile(self, profile):
         profile = IActivityProfileDocument(profile, profile)
 
@@ -554,73 +1295,116 @@ class LRSClient(object):
         headers = {"If-Match": profile.etag} if profile.etag else None
 
         result = True
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "activities/profile")
-            # pylint: disable=too-many-function-args
-            response = session.delete(url, auth=self.auth, params=params,
-                                      headers=headers)
-            if not (200 <= response.status_code < 300):
-                logger.error("Invalid server response [%s] while deleting activity profile %s",
-                             response.status_code, profile.id)
-                result = False
+        self._invalidate_documents(_ACTIVITY_PROFILE_RESOURCE,
+                                   profile.activity, document_id=profile.id)
+        url = urllib_parse.urljoin(self.endpoint, _ACTIVITY_PROFILE_RESOURCE)
+        response = self._request('DELETE', url, params=params,
+                                 headers=headers)
+        if not (200 <= response.status_code < 300):
+            logger.error("Invalid server response [%s] while deleting activity profile %s",
+                         response.status_code, profile.id)
+            result = False
         return result
 
     # agent profiles
 
+    @instrumented
     def retrieve_agent_profile_ids(self, agent, since=None):
         agent = IAgent(agent, agent)
 
         # set params
         params = {
-            "agent": json.dumps(to_external_object(agent))
+            "agent": self._json_param(externalize(agent))
         }
         if since is not None:
             params["since"] = to_external_object(since)
 
         # query
         result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "agents/profile")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth, params=params)
-            if response.ok:
-                data = self.prepare_json_text(response.text)
-                result = json.loads(data)
-            else:
-                logger.error("Invalid server response [%s] while getting agent profile ids",
-                             response.status_code)
-            return result
+        url = urllib_parse.urljoin(self.endpoint, _AGENT_PROFILE_RESOURCE)
+        response = self._request('GET', url, params=params)
+        if response.ok:
+            data = self.prepare_json_text(response.text)
+            with timed('parsing'):
+                result = self.codec.loads(data)
+        else:
+            logger.error("Invalid server response [%s] while getting agent profile ids",
+                         response.status_code)
+        return result
     get_agent_profile_ids = retrieve_agent_profile_ids
 
-    def retrieve_agent_profile(self, agent, profile_id):
+    @instrumented
+    def retrieve_agent_profile(self, agent, profile_id, timeout=None):
         agent = IAgent(agent, agent)
 
         # set params
         # pylint: disable=no-member
         params = {
             "profileId": profile_id,
-            "agent": json.dumps(to_external_object(agent))
+            "agent": self._json_param(externalize(agent))
         }
 
         # query
-        result = None
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "agents/profile")
-            # pylint: disable=too-many-function-args
-            response = session.get(url, auth=self.auth, params=params)
-            if response.ok:
-                data = response.content
-                result = AgentProfileDocument(id=profile_id,
-                                              content=data,
-                                              agent=agent)
-                self._set_document_headers(result, response.headers)
-            elif response.status_code != 404:
-                logger.error("Invalid server response [%s] while getting agent profile %s",
-                             response.status_code, profile_id)
+        key = self._document_key(_AGENT_PROFILE_RESOURCE, agent=agent,
+                                 document_id=profile_id)
+        url = urllib_parse.urljoin(self.endpoint, _AGENT_PROFILE_RESOURCE)
+        result, response = self._retrieve_document(url, params, key,
+                                                   AgentProfileDocument,
+                                                   timeout,
+                                                   id=profile_id,
+                                                   agent=agent)
+        if result is None and response.status_code != 404:
+            logger.error("Invalid server response [%s] while getting agent profile %s",
+                         response.status_code, profile_id)
 
-            return result
+        return result
     get_agent_profile = retrieve_agent_profile
 
+    def retrieve_agent_profiles(self, agent, profile_ids,
+                                max_workers=None, timeout=None):
+        """
+        Retrieve many profiles of an agent concurrently, see
+        :meth:`retrieve_states`.
+
+        :return: A :class:`BulkResult` by profile id, in order
+        :rtype: :class:`collections.OrderedDict`
+        """
+        calls = OrderedDict((profile_id,
+                             (self.retrieve_agent_profile, (agent, profile_id)))
+                            for profile_id in profile_ids)
+        return self._fan_out(calls, max_workers, timeout)
+
+    def _fan_out(self, calls, max_workers, timeout):
+        """
+        Make calls on a pool of threads, keeping the result or the
+        error of each.
+
+        :param calls: The (function, args) to call by key; the
+            functions take a ``timeout`` keyword
+        """
+        current = current_deadline()
+
+        def call(item):
+            key, (func, args) = item
+            try:
+                with scoped_deadline(current):
+                    return key, BulkResult(func(*args, timeout=timeout), None)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.debug("Bulk retrieval of %r failed: %s", key, e)
+                return key, BulkResult(None, e)
+
+        items = list(calls.items())
+        workers = min(max_workers or self.pool_maxsize, len(items))
+        if workers < 2:
+            return OrderedDict(call(item) for item in items)
+        pool = ThreadPool(workers)
+        try:
+            return OrderedDict(pool.map(call, items))
+        finally:
+            pool.close()
+            pool.join()
+
+    @instrumented
     def save_agent_profile(self, profile):
         profile = IAgentProfileDocument(profile, profile)
 
@@ -628,7 +1412,7 @@ class LRSClient(object):
         # pylint: disable=no-member
         params = {
             "profileId": profile.id,
-            "agent": json.dumps(to_external_object(profile.agent))
+            "agent": self._json_param(externalize(profile.agent))
         }
         headers = {
             "Content-Type": profile.content_type or "application/octet-stream"
@@ -637,17 +1421,18 @@ class LRSClient(object):
             headers["If-Match"] = profile.etag
 
         result = profile
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "agents/profile")
-            # pylint: disable=too-many-function-args
-            response = session.put(url, auth=self.auth, params=params,
-                                   data=profile.content, headers=headers)
-            if not (200 <= response.status_code < 300):
-                logger.error("Invalid server response [%s] while saving agent profile %s",
-                             response.status_code, profile.id)
-                result = None
+        self._invalidate_documents(_AGENT_PROFILE_RESOURCE,
+                                   agent=profile.agent, document_id=profile.id)
+        url = urllib_parse.urljoin(self.endpoint, _AGENT_PROFILE_RESOURCE)
+        response = self._request('PUT', url, params=params,
+                                 data=profile.content, headers=headers)
+        if not (200 <= response.status_code < 300):
+            logger.error("Invalid server response [%s] while saving agent profile %s",
+                         response.status_code, profile.id)
+            result = None
         return result
 
+    @instrumented
     def delete_agent_profile(self, profile):
         profile = IAgentProfileDocument(profile, profile)
 
@@ -655,24 +1440,104 @@ class LRSClient(object):
         # pylint: disable=no-member
         params = {
             "profileId": profile.id,
-            "agent": json.dumps(to_external_object(profile.agent))
+            "agent": self._json_param(externalize(profile.agent))
         }
 
         # headers
         headers = {"If-Match": profile.etag} if profile.etag else None
 
         result = True
-        with self.session() as session:
-            url = urllib_parse.urljoin(self.endpoint, "agents/profile")
-            # pylint: disable=too-many-function-args
-            response = session.delete(url, auth=self.auth, params=params,
-                                      headers=headers)
-            if not (200 <= response.status_code < 300):
-                logger.error("Invalid server response [%s] while deleting activity profile %s",
-                             response.status_code, profile.id)
-                result = False
+        self._invalidate_documents(_AGENT_PROFILE_RESOURCE,
+                                   agent=profile.agent, document_id=profile.id)
+        url = urllib_parse.urljoin(self.endpoint, _AGENT_PROFILE_RESOURCE)
+        response = self._request('DELETE', url, params=params,
+                                 headers=headers)
+        if not (200 <= response.status_code < 300):
+            logger.error("Invalid server response [%s] while deleting activity profile %s",
+                         response.status_code, profile.id)
+            result = False
         return result
 
+    # document cache
+
+    def _document_key(self, resource, activity=None, agent=None,
+                      registration=None, document_id=None):
+        if self.document_cache is None:
+            return None
+        if agent is not None:
+            # agents are identified by their inverse functional
+            # identifier, not their name
+            agent = externalize(agent)
+            agent.pop('name', None)
+            agent = json.dumps(agent, sort_keys=True)
+        activity = getattr(activity, 'id', None)
+        return (self.endpoint, resource, activity, agent, registration,
+                document_id)
+
+    def _invalidate_documents(self, resource, activity=None, agent=None,
+                              registration=None, document_id=None):
+        """
+        Drop the cached documents a write may change. Without a
+        registration or id, the documents of every registration or id
+        in the scope are dropped.
+        """
+        cache = self.document_cache
+        if cache is None:
+            return
+        scope = self._document_key(resource, activity, agent)[:4]
+
+        def matches(key):
+            return (key[:4] == scope
+                    and registration in (None, key[4])
+                    and document_id in (None, key[5]))
+        cache.discard(matches)
+
+    def _retrieve_document(self, url, params, key, factory, timeout=None,
+                           **kwargs):
+        """
+        GET a state or profile document. A copy held in the document
+        cache is revalidated with ``If-None-Match`` and
+        ``If-Modified-Since`` and returned on a 304 response. The
+        ``timeout`` is passed on to :mod:`requests`.
+
+        :return: The document, or None if it was not read, and the
+            response
+        """
+        cache = self.document_cache
+        cached = cache.get(key) if cache is not None else None
+        headers = None
+        if cached is not None:
+            headers = {}
+            if 'etag' in cached.headers:
+                headers['If-None-Match'] = cached.headers['etag']
+            if 'last-modified' in cached.headers:
+                headers['If-Modified-Since'] = cached.headers['last-modified']
+        response = self._request('GET', url, params=params, headers=headers,
+                                 timeout=timeout)
+        event = current_event()
+        if event is not None and cache is not None:
+            event.cache = 'hit' if response.status_code == 304 else 'miss'
+        if cached is not None and response.status_code == 304:
+            content, headers = cached
+        elif response.ok:
+            content, headers = response.content, response.headers
+            if cache is not None:
+                self._cache_document(cache, key, content, headers)
+        else:
+            return None, response
+        result = factory(content=content, **kwargs)
+        self._set_document_headers(result, headers)
+        return result, response
+
+    def _cache_document(self, cache, key, content, headers):
+        headers = {name: headers[name] for name in _DOCUMENT_HEADERS
+                   if headers.get(name) is not None}
+        if 'etag' in headers or 'last-modified' in headers:
+            cache.set(key, CachedDocument(content, headers))
+        else:
+            # nothing to revalidate with
+            cache.pop(key)
+
     # misc
 
     def _set_document_headers(self, doc, headers):
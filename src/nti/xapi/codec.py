@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+JSON codecs used to read and write LRS documents.
+
+:mod:`simplejson` and the standard library :mod:`json` are always
+available; the faster :mod:`orjson` and :mod:`ujson` backends are used
+when they are installed. Every codec encodes to UTF-8 bytes and writes
+datetimes and timedeltas in the ISO 8601 forms the xAPI model uses.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+import datetime
+
+from collections import OrderedDict
+
+import simplejson
+
+from zope import interface
+
+from nti.xapi.externalization import externalize
+
+from nti.xapi.interfaces import IJSONCodec
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The codec used when none is given
+DEFAULT_CODEC = 'simplejson'
+
+#: Picks the fastest installed codec
+AUTO = 'auto'
+
+_SEPARATORS = (',', ':')
+
+
+def _default(obj):
+    if isinstance(obj, (datetime.date, datetime.timedelta)):
+        return externalize(obj)
+    raise TypeError('Object of type %s is not JSON serializable'
+                    % type(obj).__name__)
+
+
+def _to_bytes(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+
+@interface.implementer(IJSONCodec)
+class SimpleJSONCodec(object):
+
+    name = 'simplejson'
+
+    def loads(self, data):
+        return simplejson.loads(data)
+
+    def dumps(self, obj):
+        return _to_bytes(simplejson.dumps(obj, default=_default,
+                                          ensure_ascii=False,
+                                          separators=_SEPARATORS))
+
+
+@interface.implementer(IJSONCodec)
+class StdlibJSONCodec(object):
+
+    name = 'json'
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return _to_bytes(json.dumps(obj, default=_default,
+                                    ensure_ascii=False,
+                                    separators=_SEPARATORS))
+
+
+@interface.implementer(IJSONCodec)
+class UJSONCodec(object):
+
+    name = 'ujson'
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def dumps(self, obj):
+        return _to_bytes(ujson.dumps(obj, default=_default,
+                                     ensure_ascii=False,
+                                     escape_forward_slashes=False))
+
+
+@interface.implementer(IJSONCodec)
+class OrjsonCodec(object):
+
+    name = 'orjson'
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        # let _default write datetimes as the model does
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+#: The codecs by name, fastest first
+CODECS = OrderedDict((
+    (OrjsonCodec.name, OrjsonCodec),
+    (UJSONCodec.name, UJSONCodec),
+    (SimpleJSONCodec.name, SimpleJSONCodec),
+    (StdlibJSONCodec.name, StdlibJSONCodec),
+))
+
+_MODULES = {
+    OrjsonCodec.name: lambda: orjson,
+    UJSONCodec.name: lambda: ujson,
+}
+
+
+def available_codecs():
+    """
+    Return the names of the codecs that can be used, fastest first.
+    """
+    return [name for name in CODECS
+            if name not in _MODULES or _MODULES[name]() is not None]
+
+
+def get_codec(codec=None):
+    """
+    Return a codec.
+
+    :param codec: A codec, the name of a codec, :data:`AUTO` for the
+        fastest installed one, or None for :data:`DEFAULT_CODEC`
+    :raises ValueError: If the codec is unknown or not installed
+    """
+    if IJSONCodec.providedBy(codec):
+        return codec
+    name = codec or DEFAULT_CODEC
+    available = available_codecs()
+    if name == AUTO:
+        name = available[0]
+    if name not in available:
+        raise ValueError('JSON codec %r is not available' % (name,))
+    return CODECS[name]()
@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compact versions of the xAPI model classes, for holding many
+statements in memory.
+
+Each class provides the same interface as its counterpart, but keeps
+its fields in ``__slots__`` rather than an instance ``__dict__``, and
+the language maps and extensions keep their entries in a tuple.
+
+They are built from parsed JSON by
+:func:`nti.xapi.externalization.internalize`, which validates the
+values as it does for the standard classes::
+
+    statement = internalize(ext, CompactStatement)
+
+or read from an LRS by an :class:`nti.xapi.client.LRSClient` created
+with ``compact=True``. Input the fast path of ``internalize`` leaves
+to the standard internalization is read into the standard classes,
+raising the same errors, and copied with :func:`from_standard`.
+They externalize as their counterparts do.
+Unlike those, values assigned to their attributes are not validated,
+and they can't be given interfaces of their own with
+:func:`zope.interface.alsoProvides`.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
+
+from zope import interface
+
+from nti.xapi.activity import Activity
+from nti.xapi.activity import ActivityDefinition
+
+from nti.xapi.attachment import Attachment
+
+from nti.xapi.context import Context
+from nti.xapi.context import ContextActivities
+
+from nti.xapi.entities import Agent
+from nti.xapi.entities import AgentAccount
+from nti.xapi.entities import AnonymousGroup
+from nti.xapi.entities import IdentifiedGroup
+from nti.xapi.entities import _is_ifientity
+
+from nti.xapi.extensions import Extensions
+from nti.xapi.extensions import _check_key
+
+from nti.xapi.externalization import _schema_for
+from nti.xapi.externalization import _field_names
+
+from nti.xapi.interfaces import IAgent
+from nti.xapi.interfaces import IScore
+from nti.xapi.interfaces import IVerb
+from nti.xapi.interfaces import IResult
+from nti.xapi.interfaces import IContext
+from nti.xapi.interfaces import IActivity
+from nti.xapi.interfaces import IStatement
+from nti.xapi.interfaces import IAttachment
+from nti.xapi.interfaces import IExtensions
+from nti.xapi.interfaces import ILanguageMap
+from nti.xapi.interfaces import IAgentAccount
+from nti.xapi.interfaces import IStatementRef
+from nti.xapi.interfaces import ISubStatement
+from nti.xapi.interfaces import IAnonymousGroup
+from nti.xapi.interfaces import IIdentifiedGroup
+from nti.xapi.interfaces import IContextActivities
+from nti.xapi.interfaces import IActivityDefinition
+
+from nti.xapi.language_map import LanguageMap
+from nti.xapi.language_map import _check_lang_value
+
+from nti.xapi.result import Score
+from nti.xapi.result import Result
+
+from nti.xapi.statement import Statement
+from nti.xapi.statement import SubStatement
+from nti.xapi.statement import StatementRef
+from nti.xapi.statement import StatementResult
+
+from nti.xapi.verb import Verb
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def _slots(schema):
+    return tuple(sorted(n for n in _field_names(schema) if not n.startswith('_')))
+
+
+class CompactBase(object):
+    """
+    The base of the compact classes. Keyword arguments set fields, the
+    others start with the default of their schema field.
+    """
+
+    __slots__ = ()
+
+    #: The (name, default) of each field, set by :func:`_compact`
+    _ext_defaults = ()
+
+    #: Factories for the objects of fields, by field name, used by
+    #: :func:`~nti.xapi.externalization.internalize` in place of the
+    #: ``anonymousObjectFactory`` registrations
+    _ext_field_factories = {}
+
+    #: The standard class, which reads the input the fast
+    #: internalization doesn't
+    _ext_standard_factory = None
+
+    def __init__(self, **kwargs):
+        for name, default in self._ext_defaults:
+            setattr(self, name, kwargs.pop(name, default))
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ', '.join('%s=%r' % (name, getattr(self, name))
+                           for name, _ in self._ext_defaults
+                           if getattr(self, name) is not None)
+        return '%s(%s)' % (type(self).__name__, fields)
+
+    @classmethod
+    def _ext_from_standard(cls, obj):
+        return from_standard(obj)
+
+
+#: The compact class of each standard one
+COMPACT_CLASSES = {}
+
+
+def _compact(standard):
+    def compact(cls):
+        schema = _schema_for(interface.implementedBy(cls))
+        cls._ext_defaults = tuple((name, schema[name].default)
+                                  for name in _slots(schema))
+        cls._ext_standard_factory = standard
+        COMPACT_CLASSES[standard] = cls
+        return cls
+    return compact
+
+
+def from_standard(obj):
+    """
+    Return a compact copy of a standard model object, or of a list of
+    them; other values are returned as they are.
+    """
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(from_standard(x) for x in obj)
+    cls = COMPACT_CLASSES.get(type(obj))
+    if cls is None:
+        return obj
+    if issubclass(cls, _CompactMapping):
+        return cls(obj)
+    result = cls()
+    for name, _ in cls._ext_defaults:
+        setattr(result, name, from_standard(getattr(obj, name, None)))
+    return result
+
+
+class _CompactMapping(MutableMapping):
+    """
+    A mapping kept in a flat tuple of keys and values. Language maps
+    and extensions hold a few entries, for which a scan is as fast as
+    a hash lookup, and a tuple is a fraction of the size of a dict.
+    """
+
+    __slots__ = ('_items',)
+
+    def __init__(self, *args, **kwargs):
+        self._items = ()
+        self.update(*args, **kwargs)
+
+    def _validate_key_value(self, key, value):
+        raise NotImplementedError  # pragma: no cover
+
+    def _index(self, key):
+        items = self._items
+        for index in range(0, len(items), 2):
+            if items[index] == key:
+                return index
+        return -1
+
+    def __getitem__(self, key):
+        index = self._index(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._items[index + 1]
+
+    def __setitem__(self, key, value):
+        key = self._validate_key_value(key, value)
+        index = self._index(key)
+        if index < 0:
+            self._items += (key, value)
+        else:
+            items = self._items
+            self._items = items[:index + 1] + (value,) + items[index + 2:]
+
+    def __delitem__(self, key):
+        index = self._index(key)
+        if index < 0:
+            raise KeyError(key)
+        self._items = self._items[:index] + self._items[index + 2:]
+
+    def __iter__(self):
+        return iter(self._items[::2])
+
+    def __len__(self):
+        return len(self._items) // 2
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, dict(self))
+
+
+@interface.implementer(ILanguageMap)
+class CompactLanguageMap(_CompactMapping):
+
+    __slots__ = ()
+
+    _ext_standard_factory = LanguageMap
+
+    def _validate_key_value(self, key, value):
+        _check_lang_value(value)
+        return key
+
+
+@interface.implementer(IExtensions)
+class CompactExtensions(_CompactMapping):
+
+    __slots__ = ()
+
+    _ext_standard_factory = Extensions
+
+    def _validate_key_value(self, key, value):
+        return _check_key(self, key)
+
+
+@_compact(AgentAccount)
+@interface.implementer(IAgentAccount)
+class CompactAgentAccount(CompactBase):
+    __slots__ = _slots(IAgentAccount)
+
+
+_ENTITY_FACTORIES = {'account': CompactAgentAccount}
+
+
+@_compact(Agent)
+@interface.implementer(IAgent)
+class CompactAgent(CompactBase):
+
+    __slots__ = _slots(IAgent)
+
+    _ext_field_factories = _ENTITY_FACTORIES
+
+    objectType = 'Agent'
+
+
+_GROUP_FACTORIES = {'account': CompactAgentAccount, 'member': CompactAgent}
+
+
+@_compact(AnonymousGroup)
+@interface.implementer(IAnonymousGroup)
+class CompactAnonymousGroup(CompactBase):
+
+    __slots__ = _slots(IAnonymousGroup)
+
+    _ext_field_factories = _GROUP_FACTORIES
+
+    objectType = 'Group'
+
+
+@_compact(IdentifiedGroup)
+@interface.implementer(IIdentifiedGroup)
+class CompactIdentifiedGroup(CompactBase):
+
+    __slots__ = _slots(IIdentifiedGroup)
+
+    _ext_field_factories = _GROUP_FACTORIES
+
+    objectType = 'Group'
+
+
+def _group_factory(ext):
+    if _is_ifientity(ext):
+        return CompactIdentifiedGroup()
+    return CompactAnonymousGroup()
+
+
+_group_factory.__external_factory_wants_arg__ = True
+
+
+def _entity_factory(ext):
+    object_type = ext.get('objectType', 'Agent')
+    if object_type == 'Group':
+        return _group_factory(ext)
+    return CompactAgent()
+
+
+_entity_factory.__external_factory_wants_arg__ = True
+
+
+@_compact(Verb)
+@interface.implementer(IVerb)
+class CompactVerb(CompactBase):
+
+    __slots__ = _slots(IVerb)
+
+    _ext_field_factories = {'display': CompactLanguageMap}
+
+
+@_compact(ActivityDefinition)
+@interface.implementer(IActivityDefinition)
+class CompactActivityDefinition(CompactBase):
+
+    __slots__ = _slots(IActivityDefinition)
+
+    _ext_field_factories = {'name': CompactLanguageMap,
+                            'description': CompactLanguageMap,
+                            'extensions': CompactExtensions}
+
+
+@_compact(Activity)
+@interface.implementer(IActivity)
+class CompactActivity(CompactBase):
+
+    __slots__ = _slots(IActivity)
+
+    _ext_field_factories = {'definition': CompactActivityDefinition}
+
+    objectType = 'Activity'
+
+
+@_compact(StatementRef)
+@interface.implementer(IStatementRef)
+class CompactStatementRef(CompactBase):
+
+    __slots__ = _slots(IStatementRef)
+
+    objectType = 'StatementRef'
+
+
+@_compact(ContextActivities)
+@interface.implementer(IContextActivities)
+class CompactContextActivities(CompactBase):
+
+    __slots__ = _slots(IContextActivities)
+
+    _ext_field_factories = dict.fromkeys(__slots__, CompactActivity)
+
+
+@_compact(Context)
+@interface.implementer(IContext)
+class CompactContext(CompactBase):
+
+    __slots__ = _slots(IContext)
+
+    _ext_field_factories = {'instructor': _entity_factory,
+                            'team': _group_factory,
+                            'contextActivities': CompactContextActivities,
+                            'statement': CompactStatementRef,
+                            'extensions': CompactExtensions}
+
+
+@_compact(Attachment)
+@interface.implementer(IAttachment)
+class CompactAttachment(CompactBase):
+
+    __slots__ = _slots(IAttachment)
+
+    _ext_field_factories = {'display': CompactLanguageMap,
+                            'description': CompactLanguageMap}
+
+
+@_compact(Score)
+@interface.implementer(IScore)
+class CompactScore(CompactBase):
+    __slots__ = _slots(IScore)
+
+
+@_compact(Result)
+@interface.implementer(IResult)
+class CompactResult(CompactBase):
+
+    __slots__ = _slots(IResult)
+
+    _ext_field_factories = {'score': CompactScore,
+                            'extensions': CompactExtensions}
+
+
+_STATEMENT_FACTORIES = {'actor': _entity_factory,
+                        'verb': CompactVerb,
+                        'context': CompactContext,
+                        'attachments': CompactAttachment}
+
+
+@_compact(SubStatement)
+@interface.implementer(ISubStatement)
+class CompactSubStatement(CompactBase):
+
+    __slots__ = _slots(ISubStatement)
+
+    objectType = 'SubStatement'
+
+
+@_compact(Statement)
+@interface.implementer(IStatement)
+class CompactStatement(CompactBase):
+    __slots__ = _slots(IStatement)
+
+
+OBJECT_FACTORIES = {
+    'Agent': lambda x: CompactAgent(),
+    'Group': _group_factory,
+    'Activity': lambda x: CompactActivity(),
+    'StatementRef': lambda x: CompactStatementRef(),
+    'SubStatement': lambda x: CompactSubStatement(),
+}
+
+
+def _statement_object_factory(ext):
+    object_type = ext.get('objectType', 'Activity')
+    return OBJECT_FACTORIES[object_type](ext)
+
+
+_statement_object_factory.__external_factory_wants_arg__ = True
+
+
+CompactSubStatement._ext_field_factories = dict(_STATEMENT_FACTORIES,
+                                                object=_statement_object_factory)
+
+CompactStatement._ext_field_factories = dict(_STATEMENT_FACTORIES,
+                                             object=_statement_object_factory,
+                                             result=CompactResult,
+                                             authority=_entity_factory)
+
+
+COMPACT_CLASSES[LanguageMap] = CompactLanguageMap
+COMPACT_CLASSES[Extensions] = CompactExtensions
+
+
+@_compact(StatementResult)
+class CompactStatementResult(StatementResult):
+    """
+    A statement result whose statements are compact.
+    """
+
+    _ext_field_factories = {'statements': CompactStatement}
+
+    @classmethod
+    def _ext_from_standard(cls, obj):
+        return from_standard(obj)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compression of the bodies of requests sent to an LRS.
+
+Statement batches repeat the same verbs, actors and activities, and
+compress well. An LRS need not accept compressed requests, so the
+first compressed request also finds out whether it does; see
+:class:`RequestCompression`.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import zlib
+import threading
+
+from collections import OrderedDict
+
+import six
+
+from zope import interface
+
+from nti.xapi.interfaces import IRequestCompressor
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The gzip content encoding
+GZIP = 'gzip'
+
+#: The deflate content encoding, a zlib stream
+DEFLATE = 'deflate'
+
+
+@interface.implementer(IRequestCompressor)
+class GzipCompressor(object):
+
+    encoding = GZIP
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        # a window of 16 + 15 bits writes a gzip header and trailer
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+
+@interface.implementer(IRequestCompressor)
+class DeflateCompressor(object):
+
+    encoding = DEFLATE
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+
+#: The compressors, by content encoding
+COMPRESSORS = OrderedDict((
+    (GZIP, GzipCompressor),
+    (DEFLATE, DeflateCompressor),
+))
+
+
+def get_compressor(compressor=None, level=6):
+    """
+    Return a compressor.
+
+    :param compressor: A compressor, a content encoding in
+        :data:`COMPRESSORS`, or None for :data:`GZIP`
+    :param level: The compression level of a new compressor, from 1,
+        fastest, to 9, smallest
+    :raises ValueError: If the content encoding is unknown
+    """
+    if IRequestCompressor.providedBy(compressor):
+        return compressor
+    encoding = compressor or GZIP
+    if encoding not in COMPRESSORS:
+        raise ValueError('Unknown content encoding %r' % (encoding,))
+    return COMPRESSORS[encoding](level)
+
+
+class RequestCompression(object):
+    """
+    Compresses the request bodies of at least ``threshold`` bytes.
+
+    Whether the LRS accepts them is not known until it answers one.
+    A 415 response, or a 400 response to the first compressed request
+    that the same request uncompressed does not get, means it does
+    not; the request is sent again uncompressed and no other request
+    is compressed. Any other response means it does.
+    """
+
+    def __init__(self, compressor=None, level=6, threshold=1024):
+        """
+        :param compressor: The compressor, or its content encoding,
+            see :func:`get_compressor`
+        :param level: The compression level of a new compressor
+        :type level: int
+        :param threshold: Smallest body compressed, in bytes
+        :type threshold: int
+        """
+        self.compressor = get_compressor(compressor, level)
+        self.threshold = threshold
+        #: Whether the LRS accepts compressed requests, None if unknown
+        self.supported = None
+        self.compressed = 0
+        self.fallbacks = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ratio(self):
+        """
+        The size of the bodies compressed over their compressed size.
+        """
+        return self.bytes_in / self.bytes_out if self.bytes_out else None
+
+    def metrics(self):
+        return {
+            'supported': self.supported,
+            'compressed': self.compressed,
+            'fallbacks': self.fallbacks,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+        }
+
+    def compress(self, data):
+        """
+        Return a compressed body, or None if it is not to be.
+        """
+        if self.supported is False:
+            return None
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        if not isinstance(data, bytes) or len(data) < self.threshold:
+            return None  # streams, and bodies too small to gain from it
+        result = self.compressor.compress(data)
+        with self._lock:
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(result)
+        return result
+
+    def send(self, send, data, headers):
+        """
+        Send a request body, compressed if it is to be.
+
+        :param send: Sends a request with a body and its headers,
+            returning the response
+        :param data: The request body
+        :param headers: The request headers
+        :type headers: dict
+        :return: The response
+        """
+        compressed = self.compress(data)
+        if compressed is None:
+            return send(data, headers)
+        encoded = dict(headers)
+        encoded['Content-Encoding'] = self.compressor.encoding
+        probing = self.supported is None
+        response = send(compressed, encoded)
+        status = response.status_code
+        if status == 415 or (probing and status == 400):
+            result = send(data, headers)
+            if status == 415 or result.status_code < 400:
+                logger.warning("LRS does not accept %s requests [%s], "
+                               "sending them uncompressed",
+                               self.compressor.encoding, status)
+                self.supported = False
+                self.fallbacks += 1
+            return result
+        if probing and status < 400:
+            self.supported = True
+        return response
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Deadlines bounding the calls made to an LRS.
+
+A deadline is set for the calls made on a thread within a
+:func:`deadline` block, such as those a higher-level operation makes
+on behalf of its caller. Each request waits no longer than the time
+left, and no request is made once it has passed::
+
+    with deadline(5):
+        client.save_statements(statements)
+        client.save_state(state)
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import threading
+
+from contextlib import contextmanager
+
+from nti.xapi.interfaces import DeadlineExceededException
+
+logger = __import__('logging').getLogger(__name__)
+
+_local = threading.local()
+
+
+class Deadline(object):
+    """
+    A point in time after which no more requests are made, and the
+    timeout of the requests made until then.
+    """
+
+    def __init__(self, seconds=None, timeout=None, clock=time.time):
+        """
+        :param seconds: Seconds from now until the deadline, or None
+            for no deadline
+        :type seconds: float
+        :param timeout: The timeout of each request, as passed to
+            :mod:`requests`, or None for the client's
+        :param clock: Returns the current time in seconds
+        """
+        self.clock = clock
+        self.timeout = timeout
+        self.expires = None if seconds is None else clock() + seconds
+
+    def remaining(self):
+        """
+        Return the seconds left, or None if there is no deadline.
+        """
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - self.clock())
+
+    @property
+    def expired(self):
+        return self.remaining() == 0.0
+
+    def check(self):
+        """
+        :raises DeadlineExceededException: If the deadline has passed
+        """
+        if self.expired:
+            raise DeadlineExceededException('Deadline exceeded')
+
+    def cap(self, timeout):
+        """
+        Return a request timeout, a number or a (connect, read) pair,
+        lowered to the time left.
+
+        :raises DeadlineExceededException: If the deadline has passed
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        self.check()
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if t is None else min(t, remaining)
+                         for t in timeout)
+        return min(timeout, remaining)
+
+    def within(self, outer):
+        """
+        Return this deadline nested within another: the earlier of
+        the two, with this timeout if it has one.
+        """
+        result = Deadline(timeout=self.timeout, clock=self.clock)
+        if result.timeout is None:
+            result.timeout = outer.timeout
+        expires = [d.expires for d in (self, outer) if d.expires is not None]
+        result.expires = min(expires) if expires else None
+        return result
+
+
+def current_deadline():
+    """
+    Return the deadline of the calls made on this thread, or None.
+    """
+    return getattr(_local, 'current', None)
+
+
+@contextmanager
+def deadline(seconds=None, timeout=None):
+    """
+    Bound the calls made on this thread within the block. Within
+    another block, the earlier deadline applies.
+
+    :param seconds: Seconds until the deadline, None for no deadline,
+        or a :class:`Deadline`, such as one carried over from another
+        thread
+    :param timeout: The timeout of each request, as passed to
+        :mod:`requests`, instead of the client's
+    :return: The :class:`Deadline` in effect
+    """
+    current = seconds
+    if not isinstance(current, Deadline):
+        current = Deadline(seconds, timeout)
+    outer = current_deadline()
+    if outer is not None:
+        current = current.within(outer)
+    _local.current = current
+    try:
+        yield current
+    finally:
+        _local.current = outer
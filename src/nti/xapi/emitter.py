@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import threading
+
+from six.moves import queue
+
+from zope import interface
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.codec import get_codec
+
+from nti.xapi.externalization import externalize
+
+from nti.xapi.interfaces import IStatementEmitter
+from nti.xapi.interfaces import CircuitOpenException
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class _Flush(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+_STOP = object()
+_LINGER = object()
+
+
+@interface.implementer(IStatementEmitter)
+class StatementEmitter(object):
+    """
+    Buffers statements emitted from any thread and saves them with
+    :meth:`nti.xapi.interfaces.ILRSClient.save_statements` on a
+    background thread.
+
+    A batch is sent when it holds ``max_count`` statements, when adding
+    a statement would take its payload past ``max_bytes``, or when its
+    oldest statement has waited ``max_linger`` seconds.
+
+    Batches refused by the client's circuit breaker go to the
+    ``spill`` buffer, when there is one. Those it can't keep are
+    dropped, and counted as failed.
+
+    The JSON of the statements measured for ``max_bytes`` is sent as
+    it is by an :class:`nti.xapi.client.LRSClient`.
+    """
+
+    def __init__(self, client, max_count=100, max_bytes=None,
+                 max_linger=1.0, max_queue=0, on_error=None, spill=None):
+        """
+        :param client: The client used to save the statements
+        :type client: :class:`nti.xapi.interfaces.ILRSClient`
+        :param max_count: Maximum number of statements in a batch
+        :type max_count: int
+        :param max_bytes: Maximum size of a batch's JSON payload, or None
+            to not measure statements
+        :type max_bytes: int
+        :param max_linger: Maximum seconds a statement waits for its batch
+        :type max_linger: float
+        :param max_queue: Maximum number of statements waiting to be
+            batched before :meth:`emit` blocks, 0 for no limit
+        :type max_queue: int
+        :param on_error: Called with the list of statements of a batch
+            that could not be saved
+        :param spill: Keeps the batches not sent while the circuit
+            breaker of the client is open
+        :type spill: :class:`nti.xapi.interfaces.ISpillBuffer`
+        """
+        self.client = client
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_linger = max_linger
+        self.on_error = on_error
+        self.spill = spill
+        self.sent = 0
+        self.failed = 0
+        self.spilled = 0
+        self.batches = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._codec = get_codec(getattr(client, 'codec', None))
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run,
+                                        name='StatementEmitter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, statement):
+        with self._lock:
+            if self._closed:
+                raise ValueError('Emitter is closed')
+            self._queue.put(statement)
+
+    def flush(self, timeout=None):
+        with self._lock:
+            if not self._closed:
+                marker = _Flush()
+                self._queue.put(marker)
+        if self._closed:
+            # everything emitted is sent once the worker stops
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return marker.event.wait(timeout)
+
+    def close(self, timeout=None):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # worker
+
+    def _encode(self, statement):
+        return self._codec.dumps(externalize(statement))
+
+    def _run(self):
+        batch, encoded = [], []
+        size = 0
+        deadline = None
+        while True:
+            timeout = max(deadline - time.time(), 0) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _LINGER
+
+            if item is _LINGER or item is _STOP or isinstance(item, _Flush):
+                self._send(batch, encoded)
+                batch, encoded, size = [], [], 0
+                if item is _STOP:
+                    break
+                if item is not _LINGER:
+                    item.event.set()
+                continue
+
+            if self.max_bytes:
+                try:
+                    data = self._encode(item)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Error while encoding a statement")
+                    self._failed([item])
+                    continue
+                if batch and size + len(data) + 1 > self.max_bytes:
+                    self._send(batch, encoded)
+                    batch, encoded, size = [], [], 0
+                encoded.append(data)
+                size += len(data) + 1
+            if not batch:
+                deadline = time.time() + self.max_linger
+            batch.append(item)
+            if len(batch) >= self.max_count:
+                self._send(batch, encoded)
+                batch, encoded, size = [], [], 0
+
+    def _send(self, batch, encoded=None):
+        if not batch:
+            return
+        self.batches += 1
+        try:
+            if encoded and isinstance(self.client, LRSClient):
+                result = self.client.save_statements(batch, encoded=encoded)
+            else:
+                result = self.client.save_statements(batch)
+        except CircuitOpenException:
+            if self._spill(batch):
+                logger.warning("LRS unavailable, spilled %s statement(s)", len(batch))
+                self.spilled += len(batch)
+                return
+            logger.error("LRS unavailable, dropping %s statement(s)", len(batch))
+            result = None
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error while saving %s statement(s)", len(batch))
+            result = None
+        if result is None:
+            self._failed(batch)
+        else:
+            self.sent += len(batch)
+
+    def _spill(self, batch):
+        if self.spill is None:
+            return False
+        try:
+            return self.spill.put(batch) is not False
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error while spilling %s statement(s)", len(batch))
+            return False
+
+    def _failed(self, batch):
+        self.failed += len(batch)
+        if self.on_error is not None:
+            try:
+                self.on_error(batch)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Error while reporting %s failed statement(s)",
+                                 len(batch))
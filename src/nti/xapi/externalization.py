@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fast paths for externalizing and internalizing the xAPI object model.
+
+:func:`externalize` produces the same external form as
+:func:`nti.externalization.to_external_object` does through the
+adapters registered in this package's ``configure.zcml``
+(:class:`~nti.xapi.datastructures.XAPIBaseIO`,
+:class:`~nti.xapi.result.ResultIO` and the mapping IO adapters), but
+without consulting the adapter registry for each object. The fields
+written for a class are looked up from its schema once and cached.
+
+Objects that are not part of the xAPI model, or that provide
+interfaces beyond those of their class, are handed to
+:func:`~nti.externalization.to_external_object`. External object
+decorators are not applied.
+
+:func:`internalize` builds model objects from parsed JSON with the
+results :func:`nti.externalization.update_from_external_object` gives
+through the ``anonymousObjectFactory`` registrations of
+``configure.zcml``, validating and converting each value with its
+schema field, but resolving the factories and fields of a class once.
+Input it does not accept is handed to
+:func:`~nti.externalization.update_from_external_object`, so invalid
+data raises the same errors. No events are notified. Given an
+:class:`~nti.xapi.interning.Interner`, it shares the verbs, activities
+and agents it builds, and their IRIs, with the objects built before.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import datetime
+
+import isodate
+
+import six
+
+from zope import component
+
+from zope.interface import providedBy
+from zope.interface import implementedBy
+
+from zope.interface.common.idatetime import IDateTime
+
+from zope.interface.interfaces import IMethod
+
+from zope.schema.fieldproperty import FieldProperty
+
+from zope.schema.interfaces import IURI
+from zope.schema.interfaces import IBool
+from zope.schema.interfaces import IField
+from zope.schema.interfaces import IObject
+from zope.schema.interfaces import ISequence
+
+from nti.externalization import to_external_object
+from nti.externalization import update_from_external_object
+
+from nti.externalization.datetime import datetime_to_string
+from nti.externalization.datetime import datetime_from_string
+
+from nti.externalization.interfaces import StandardExternalFields
+from nti.externalization.interfaces import IAnonymousObjectFactory
+
+from nti.schema.interfaces import find_most_derived_interface
+
+from nti.xapi.interfaces import IResult
+from nti.xapi.interfaces import IActivity
+from nti.xapi.interfaces import IXAPIBase
+from nti.xapi.interfaces import IExtensions
+from nti.xapi.interfaces import ILanguageMap
+
+from nti.xapi.interning import INTERNED
+from nti.xapi.interning import interned
+
+logger = __import__('logging').getLogger(__name__)
+
+_PRIMITIVES = frozenset(six.string_types + six.integer_types
+                        + (six.text_type, bytes, float, bool, type(None)))
+
+
+def _schema_for(spec):
+    return find_most_derived_interface(None, IXAPIBase,
+                                       possibilities=list(spec))
+
+
+def _field_names(schema):
+    # the keys InterfaceObjectIO reads and writes
+    return frozenset([
+        n for n in schema.names(all=True)
+        if (not IMethod.providedBy(schema[n])
+            and not schema[n].queryTaggedValue('_ext_excluded_out', False))
+    ])
+
+
+class _ObjectPlan(object):
+    """
+    The fields written for instances of an :class:`IXAPIBase` class, as
+    :class:`~nti.xapi.datastructures.XAPIBaseIO` finds them.
+    """
+
+    __slots__ = ('spec', 'names')
+
+    def __init__(self, cls):
+        self.spec = implementedBy(cls)
+        names = _field_names(_schema_for(self.spec))
+        self.names = tuple(n for n in names if not n.startswith('_'))
+
+    def __call__(self, obj):
+        if providedBy(obj) is not self.spec:
+            return to_external_object(obj)
+        result = {}
+        for name in self.names:
+            value = getattr(obj, name)
+            if value is not None:
+                if type(value) not in _PRIMITIVES:
+                    value = externalize(value)
+                result[name] = value
+        object_type = getattr(obj, 'objectType', None)
+        if object_type is not None:
+            result['objectType'] = object_type
+        return result
+
+
+class _MappingPlan(object):
+    """
+    Externalizes language maps and extensions as
+    :class:`~nti.xapi.datastructures.MappingIO` does.
+    """
+
+    __slots__ = ('spec',)
+
+    def __init__(self, cls):
+        self.spec = implementedBy(cls)
+
+    def __call__(self, obj):
+        if providedBy(obj) is not self.spec:
+            return to_external_object(obj)
+        return {k: obj[k] for k in obj if not k.startswith('_')}
+
+
+def _identity(value):
+    return value
+
+
+def _sequence(value):
+    return [externalize(x) for x in value]
+
+
+def _datetime(value):
+    return datetime_to_string(value).toExternalObject()
+
+
+def _duration(value):
+    return isodate.duration_isoformat(value)
+
+
+_PLANS = dict.fromkeys(_PRIMITIVES, _identity)
+_PLANS.update({
+    list: _sequence,
+    tuple: _sequence,
+    datetime.datetime: _datetime,
+    datetime.timedelta: _duration,
+})
+
+
+def _plan_for(cls):
+    if issubclass(cls, datetime.datetime):
+        plan = _datetime
+    elif issubclass(cls, datetime.timedelta):
+        plan = _duration
+    elif ILanguageMap.implementedBy(cls) or IExtensions.implementedBy(cls):
+        plan = _MappingPlan(cls)
+    elif IXAPIBase.implementedBy(cls):
+        plan = _ObjectPlan(cls)
+    else:
+        plan = to_external_object
+    _PLANS[cls] = plan
+    return plan
+
+
+def externalize(obj):
+    """
+    Return the external form of an xAPI object, or of a list of them,
+    as :func:`nti.externalization.to_external_object` would.
+    """
+    cls = type(obj)
+    try:
+        plan = _PLANS[cls]
+    except KeyError:
+        plan = _plan_for(cls)
+    return plan(obj)
+
+
+# internalization
+
+
+class _Unsupported(Exception):
+    """
+    Raised for input left to the standard internalization.
+    """
+
+
+#: Keys of external objects that need the standard internalization
+_STANDARD_KEYS = frozenset((StandardExternalFields.CLASS,
+                            StandardExternalFields.MIMETYPE,
+                            StandardExternalFields.CONTAINER_ID,
+                            StandardExternalFields.CREATOR,
+                            StandardExternalFields.ID))
+
+_TYPE_KEYS = (StandardExternalFields.CLASS, StandardExternalFields.MIMETYPE)
+
+_CONVERTERS = (
+    ('fromUnicode', six.text_type),
+    ('fromBytes', bytes),
+    ('fromObject', object)
+)
+
+
+def _check_typed(value):
+    # values the standard internalization would create objects for
+    if type(value) is dict:
+        for key in _TYPE_KEYS:
+            if key in value:
+                raise _Unsupported(key)
+    elif type(value) is list:
+        for item in value:
+            if type(item) is dict:
+                _check_typed(item)
+
+
+class _Field(object):
+    """
+    Converts, validates and sets the external value of a schema field,
+    as :func:`nti.externalization.internalization.validate_field_value`
+    does.
+    """
+
+    __slots__ = ('name', 'field', 'converters', 'direct', 'factory',
+                 'schemas', 'sequence', 'datetime', 'bool', 'iri',
+                 'internable')
+
+    def __init__(self, cls, name, field):
+        self.name = name
+        self.field = field
+        self.converters = tuple((kind, getattr(field, meth))
+                                for meth, kind in _CONVERTERS
+                                if getattr(field, meth, None) is not None)
+        self.direct = type(getattr(cls, name, None)) is FieldProperty
+        self.datetime = getattr(field, 'schema', None) is IDateTime
+        # Bool.set stores integers as booleans
+        self.bool = IBool.providedBy(field)
+        # classes may name their own factories, as the compact ones do
+        factory = getattr(cls, '_ext_field_factories', {}).get(name)
+        if factory is None:
+            factory = field.queryTaggedValue('__external_factory__')
+        if isinstance(factory, str):
+            factory = component.getUtility(IAnonymousObjectFactory, factory)
+        self.factory = factory
+        self.sequence = ISequence.providedBy(field)
+        # the schemas one of which the created objects must provide,
+        # when that is all the validation the field does
+        self.schemas = None
+        value_field = field.value_type if self.sequence else field
+        candidates = getattr(value_field, 'fields', None) or (value_field,)
+        if (all(IObject.providedBy(x) for x in candidates)
+                and not getattr(field, 'min_length', None)
+                and getattr(field, 'max_length', None) is None):
+            self.schemas = tuple(x.schema for x in candidates)
+        # the values an interner shares
+        self.iri = IURI.providedBy(field) or field is IActivity['id']
+        self.internable = any(i.isOrExtends(schema)
+                              for schema in self.schemas or ()
+                              for i in INTERNED)
+
+    def _create(self, value, interner=None):
+        if type(value) is not dict:
+            raise _Unsupported(self.name)
+        _check_typed(value)
+        factory = self.factory
+        key = None
+        if interner is not None and self.internable:
+            key = interner.key(factory, value)
+            obj = interner.get(key) if key is not None else None
+            if obj is not None:
+                return obj
+        if getattr(factory, '__external_factory_wants_arg__', False):
+            obj = factory(value)
+        else:
+            obj = factory()
+        obj = _internalize(obj, value, interner)
+        if key is not None and interned(obj):
+            interner.set(key, obj)
+        return obj
+
+    def _provided(self, obj):
+        for schema in self.schemas:
+            if schema.providedBy(obj):
+                return
+        raise _Unsupported(self.name)
+
+    def _convert(self, value):
+        if self.datetime and isinstance(value, six.string_types):
+            value = datetime_from_string(value)
+        for kind, converter in self.converters:
+            if isinstance(value, kind):
+                return converter(value)
+        self.field.validate(value)
+        if self.bool and isinstance(value, six.integer_types):
+            value = bool(value)
+        return value
+
+    def __call__(self, obj, value, interner=None):
+        if self.factory is not None and value is not None:
+            if self.schemas is None:  # pragma: no cover
+                raise _Unsupported(self.name)
+            if self.sequence:
+                if type(value) is not list:
+                    raise _Unsupported(self.name)
+                value = [self._create(x, interner) for x in value]
+                for item in value:
+                    self._provided(item)
+            else:
+                value = self._create(value, interner)
+                self._provided(value)
+        else:
+            _check_typed(value)
+            value = self._convert(value)
+            if interner is not None and self.iri and value is not None:
+                value = interner.string(value)
+        if self.direct:
+            obj.__dict__[self.name] = value
+        else:
+            setattr(obj, self.name, value)
+
+
+class _ObjectUpdater(object):
+    """
+    Updates new instances of an :class:`IXAPIBase` class as
+    :class:`~nti.xapi.datastructures.XAPIBaseIO` does.
+    """
+
+    __slots__ = ('spec', 'fields', 'required', 'duration')
+
+    def __init__(self, cls):
+        self.spec = implementedBy(cls)
+        schema = _schema_for(self.spec)
+        self.fields = {}
+        self.required = []
+        for name in _field_names(schema):
+            field = schema[name]
+            if not IField.providedBy(field):  # pragma: no cover
+                raise _Unsupported(name)
+            self.fields[name] = _Field(cls, name, field)
+            if field.required:
+                self.required.append(name)
+        # ResultIO parses the duration
+        self.duration = IResult.implementedBy(cls)
+
+    def __call__(self, obj, ext, interner=None):
+        if providedBy(obj) is not self.spec:
+            raise _Unsupported(obj)
+        fields = self.fields
+        for key, value in ext.items():
+            if key in _STANDARD_KEYS:
+                raise _Unsupported(key)
+            field = fields.get(key)
+            if field is None:
+                _check_typed(value)
+                continue
+            if self.duration and key == 'duration':
+                if not value:
+                    continue
+                try:
+                    value = isodate.parse_duration(value)
+                except TypeError:
+                    continue
+            field(obj, value, interner)
+        for name in self.required:
+            if getattr(obj, name, None) is None:
+                raise _Unsupported(name)
+        return obj
+
+
+class _MappingUpdater(object):
+    """
+    Updates new language maps and extensions as
+    :class:`~nti.xapi.datastructures.MappingIO` does.
+    """
+
+    __slots__ = ('spec',)
+
+    def __init__(self, cls):
+        self.spec = implementedBy(cls)
+
+    def __call__(self, obj, ext, interner=None):
+        if providedBy(obj) is not self.spec:
+            raise _Unsupported(obj)
+        for key, value in ext.items():
+            _check_typed(value)
+            if not key.startswith('_'):
+                if interner is not None:
+                    key = interner.string(key)
+                obj[key] = value
+        return obj
+
+
+_UPDATERS = {}
+
+
+def _updater_for(cls):
+    if ILanguageMap.implementedBy(cls) or IExtensions.implementedBy(cls):
+        updater = _MappingUpdater(cls)
+    elif IXAPIBase.implementedBy(cls):
+        updater = _ObjectUpdater(cls)
+    else:
+        raise _Unsupported(cls)
+    _UPDATERS[cls] = updater
+    return updater
+
+
+def _internalize(obj, ext, interner=None):
+    cls = type(obj)
+    try:
+        updater = _UPDATERS[cls]
+    except KeyError:
+        updater = _updater_for(cls)
+    return updater(obj, ext, interner)
+
+
+def internalize(ext, factory, interner=None):
+    """
+    Create an object with the factory and update it from the parsed
+    external data, with the same result, or error, as
+    :func:`nti.externalization.update_from_external_object`.
+
+    :param ext: The parsed JSON
+    :type ext: dict
+    :param factory: The model class, such as
+        :class:`nti.xapi.statement.Statement`
+    :param interner: Shares the entities built with those built before
+    :type interner: :class:`nti.xapi.interfaces.IInterner`
+    """
+    try:
+        return _internalize(factory(), ext, interner)
+    except Exception:  # pylint: disable=broad-except
+        # let the standard path produce the object or the error; the
+        # compact classes copy the standard object it produced
+        standard = getattr(factory, '_ext_standard_factory', None)
+        obj = (standard or factory)()
+        update_from_external_object(obj, ext)
+        if standard is not None:
+            obj = factory._ext_from_standard(obj)
+        return obj
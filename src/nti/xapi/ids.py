@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Statement ids assigned by the client, so that sending a statement
+again never stores it twice.
+
+Both generators make version 4 UUIDs, the kind the xAPI model accepts,
+from :func:`os.urandom`, so processes generating ids at the same time
+don't collide. Time-ordered ones start with the milliseconds since the
+epoch, as version 7 UUIDs do, and sort in the order they are made,
+which keeps the inserts of an LRS indexing them by id together.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+import uuid
+import struct
+import threading
+
+from collections import OrderedDict
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Random ids
+RANDOM = 'random'
+
+#: Ids ordered by the time they were made
+TIME_ORDERED = 'time'
+
+_VERSION = 0x4 << 76
+_VARIANT = 0x2 << 62
+_RANDOM_BITS = (1 << 62) - 1
+_SEQUENCE_MAX = 0xfff
+
+
+def random_uuid():
+    """
+    Return a random UUID string.
+    """
+    return str(uuid.uuid4())
+
+
+class _Clock(object):
+    """
+    The milliseconds and the 12-bit sequence of the last time-ordered
+    id. Within a millisecond the sequence is incremented, starting
+    from a random point, and it carries over to the next millisecond
+    when exhausted, so ids made by a process never go backwards.
+    """
+
+    def __init__(self):
+        self.millis = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        millis = int(time.time() * 1000)
+        with self.lock:
+            if millis > self.millis:
+                self.millis = millis
+                self.sequence = struct.unpack('>B', os.urandom(1))[0] << 2
+            else:
+                self.sequence += 1
+                if self.sequence > _SEQUENCE_MAX:
+                    self.millis += 1
+                    self.sequence = 0
+            return self.millis, self.sequence
+
+
+_clock = _Clock()
+
+
+def time_ordered_uuid():
+    """
+    Return a UUID string starting with the current time.
+    """
+    millis, sequence = _clock.next()
+    value = struct.unpack('>Q', os.urandom(8))[0]
+    value = ((millis & 0xffffffffffff) << 80 | _VERSION | sequence << 64
+             | _VARIANT | value & _RANDOM_BITS)
+    text = '%032x' % value
+    return '%s-%s-%s-%s-%s' % (text[:8], text[8:12], text[12:16],
+                               text[16:20], text[20:])
+
+
+#: The id generators, by name
+ID_GENERATORS = OrderedDict((
+    (RANDOM, random_uuid),
+    (TIME_ORDERED, time_ordered_uuid),
+))
+
+
+def get_id_generator(generator=None):
+    """
+    Return an id generator, a callable returning a UUID string.
+
+    :param generator: A generator, the name of one in
+        :data:`ID_GENERATORS`, or None for :data:`RANDOM`
+    :raises ValueError: If the generator is unknown
+    """
+    if callable(generator):
+        return generator
+    name = generator or RANDOM
+    if name not in ID_GENERATORS:
+        raise ValueError('Unknown id generator %r' % (name,))
+    return ID_GENERATORS[name]
+
+
+def assign_ids(statements, generator=random_uuid):
+    """
+    Give the statements without an id one from the generator.
+    """
+    for statement in statements:
+        if not statement.id:
+            statement.id = generator()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the calls made to an LRS.
+
+Every :class:`nti.xapi.interfaces.ILRSCallObserver` utility registered
+receives an :class:`LRSCallEvent` for each call to an
+:class:`nti.xapi.client.LRSClient` operation, telling the time spent
+encoding the request, waiting on the LRS and reading the response
+apart. :class:`HistogramCollector` keeps their latency percentiles::
+
+    <utility factory="nti.xapi.instrumentation.HistogramCollector"
+             provides="nti.xapi.interfaces.ILRSCallObserver" />
+
+Nothing is measured while no observer is registered.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import bisect
+import threading
+import functools
+
+from contextlib import contextmanager
+
+import six
+
+from zope import component
+from zope import interface
+
+from nti.xapi.interfaces import ILRSCallEvent
+from nti.xapi.interfaces import ILRSCallObserver
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The measured phases of a call
+PHASES = ('serialization', 'network', 'parsing')
+
+_local = threading.local()
+
+
+@interface.implementer(ILRSCallEvent)
+class LRSCallEvent(object):
+
+    def __init__(self, operation, endpoint=None):
+        self.operation = operation
+        self.endpoint = endpoint
+        self.method = self.path = self.status = None
+        self.bytes_sent = self.bytes_received = 0
+        self.serialization = self.network = self.parsing = 0.0
+        self.duration = 0.0
+        self.attempts = 0
+        self.cache = None
+        self.error = None
+
+    @property
+    def retries(self):
+        return max(0, self.attempts - 1)
+
+    def record_response(self, response):
+        """
+        Record the request and the response of an attempt.
+        """
+        request = response.request
+        self.method = request.method
+        self.path = request.path_url.split('?')[0]
+        self.status = response.status_code
+        body = request.body
+        if isinstance(body, (bytes, six.text_type)):
+            self.bytes_sent += len(body)
+        elif getattr(body, 'len', None) is not None:
+            self.bytes_sent += body.len  # multipart bodies
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            self.bytes_received += int(length)
+
+
+def current_event():
+    """
+    Return the event of the call in progress on this thread, or None.
+    """
+    return getattr(_local, 'event', None)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the time spent in the block to a phase of the current event.
+    """
+    event = current_event()
+    if event is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        setattr(event, phase, getattr(event, phase) + time.time() - start)
+
+
+@contextmanager
+def observed(operation, endpoint=None):
+    """
+    Notify the observers of the call made in the block, unless it is
+    part of another call.
+    """
+    if current_event() is not None:
+        yield
+        return
+    observers = component.getAllUtilitiesRegisteredFor(ILRSCallObserver)
+    if not observers:
+        yield
+        return
+    event = _local.event = LRSCallEvent(operation, endpoint)
+    start = time.time()
+    try:
+        yield
+    except Exception as e:
+        event.error = e
+        raise
+    finally:
+        _local.event = None
+        event.duration = time.time() - start
+        for observer in observers:
+            try:
+                observer.notify(event)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Observer %r failed", observer)
+
+
+def instrumented(func):
+    """
+    Decorate a client method, notifying the observers of each call.
+    The calls it makes to other decorated methods are part of it.
+    """
+    operation = func.__name__
+
+    @functools.wraps(func)
+    def call(self, *args, **kwargs):
+        with observed(operation, self.endpoint):
+            return func(self, *args, **kwargs)
+    return call
+
+
+class Histogram(object):
+    """
+    Counts values in buckets growing by ``factor`` from ``smallest``,
+    estimating percentiles within that factor.
+    """
+
+    def __init__(self, smallest=0.0001, largest=600.0, factor=1.2):
+        bounds = [smallest]
+        while bounds[-1] < largest:
+            bounds.append(bounds[-1] * factor)
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Return the value below which ``percent`` of the values fall,
+        or None if there are none.
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):  # pragma: no branch
+            seen += count
+            if seen >= rank:
+                break
+        bound = self.bounds[index] if index < len(self.bounds) else self.max
+        return min(bound, self.max)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+@interface.implementer(ILRSCallObserver)
+class HistogramCollector(object):
+    """
+    Keeps a histogram of the duration of the calls to each operation,
+    and the totals of their phases, bytes, retries, cache hits and
+    errors.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def notify(self, event):
+        with self._lock:
+            stats = self._operations.get(event.operation)
+            if stats is None:
+                stats = self._operations[event.operation] = {
+                    'histogram': Histogram(),
+                    'errors': 0, 'retries': 0, 'hits': 0, 'misses': 0,
+                    'bytes_sent': 0, 'bytes_received': 0,
+                    'serialization': 0.0, 'network': 0.0, 'parsing': 0.0,
+                }
+            stats['histogram'].record(event.duration)
+            stats['errors'] += (event.error is not None
+                                or (event.status or 0) >= 400)
+            stats['retries'] += event.retries
+            stats['hits'] += event.cache == 'hit'
+            stats['misses'] += event.cache == 'miss'
+            for name in ('bytes_sent', 'bytes_received') + PHASES:
+                stats[name] += getattr(event, name)
+
+    def operations(self):
+        with self._lock:
+            return sorted(self._operations)
+
+    def percentile(self, operation, percent):
+        """
+        Return a percentile of the duration of the calls to an
+        operation, in seconds, or None if there were none.
+        """
+        with self._lock:
+            stats = self._operations.get(operation)
+            return stats['histogram'].percentile(percent) if stats else None
+
+    def summary(self):
+        """
+        Return the calls, their p50, p99 and mean durations and the
+        totals kept, by operation.
+        """
+        result = {}
+        with self._lock:
+            for operation, stats in self._operations.items():
+                histogram = stats['histogram']
+                summary = dict((k, v) for k, v in stats.items()
+                               if k != 'histogram')
+                summary.update(calls=histogram.count,
+                               p50=histogram.percentile(50),
+                               p99=histogram.percentile(99),
+                               mean=histogram.mean)
+                result[operation] = summary
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
@@ -12,6 +12,8 @@ from __future__ import absolute_import
 
 import re
 
+from requests.exceptions import Timeout
+
 from zope import interface
 
 from zope.interface import Attribute
@@ -376,6 +378,34 @@ class MissingAttachmentDataException(Exception):
     """
 
 
+class AttachmentMismatchException(ValueError):
+    """
+    An exception raised when the data sent for an attachment does not
+    match the SHA-2 hash or length the attachment declares.
+    """
+
+
+class CircuitOpenException(Exception):
+    """
+    An exception raised, without contacting the LRS, for calls made
+    while the circuit breaker around its endpoint is open.
+    """
+
+
+class LRSTimeoutException(Timeout):
+    """
+    An exception raised when a call to the LRS times out, connecting or
+    waiting for its response.
+    """
+
+
+class DeadlineExceededException(LRSTimeoutException):
+    """
+    An exception raised, without contacting the LRS, for calls made
+    once their deadline has passed.
+    """
+
+
 class IAttachment(IXAPIBase):
     """
     In some cases an Attachment is logically an important part of a Learning Record.
@@ -629,12 +659,15 @@ class ILRSClient(interface.Interface):
         :rtype: :class:`nti.xapi.interfaces.IStatement`
         """
 
-    def query_statements(query):
+    def query_statements(query, callback=None):
         """
         Query the LRS for statements with specified parameters
 
         :param query: Dictionary of query parameters and their values
         :type query: dict
+        :param callback: If given, the response is parsed incrementally and
+            each statement is passed to this callable as soon as it is read
+            instead of being collected in the result
         :return: The returned StatementsResult object
         :rtype: :class:`nti.xapi.interfaces.IStatementResult`
 
@@ -666,16 +699,42 @@ class ILRSClient(interface.Interface):
                stored time (oldest first)
         """
 
-    def more_statements(more_url):
+    def more_statements(more_url, callback=None):
         """
         Query the LRS for more statements
 
         :param more_url: URL from a StatementsResult object used to retrieve more statements
         :type more_url: str
+        :param callback: See :meth:`query_statements`
         :return: The returned StatementsResult object
         :rtype: :class:`nti.xapi.interfaces.IStatementResult`
         """
 
+    def iter_statements(query, max_statements=None, prefetch=True, stream=False,
+                        deadline=None):
+        """
+        Lazily iterate the statements matching a query, following the
+        ``more`` links of each result.
+
+        :param query: Dictionary of query parameters and their values,
+            see :meth:`query_statements`
+        :type query: dict
+        :param max_statements: Stop after this many statements
+        :type max_statements: int
+        :param prefetch: Fetch the next page in the background while the
+            current one is consumed
+        :type prefetch: bool
+        :param stream: Parse each page incrementally, yielding statements
+            as they are read rather than once their page is complete.
+            Pages are then fetched one after the other.
+        :type stream: bool
+        :param deadline: Seconds, or a
+            :class:`nti.xapi.deadline.Deadline`, until no more pages
+            are fetched; fetching one then raises
+            :class:`DeadlineExceededException`
+        :return: An iterator of :class:`nti.xapi.interfaces.IStatement`
+        """
+
     # states
 
     def retrieve_state_ids(activity, agent, registration=None, since=None):
@@ -693,7 +752,7 @@ class ILRSClient(interface.Interface):
         :return: The retrieved state id's
         """
 
-    def retrieve_state(activity, agent, state_id, registration=None):
+    def retrieve_state(activity, agent, state_id, registration=None, timeout=None):
         """
         Retrieve state from LRS with the provided parameters
 
@@ -705,10 +764,26 @@ class ILRSClient(interface.Interface):
         :type state_id: str
         :param registration: registration UUID of desired state
         :type registration: str
+        :param timeout: Seconds to wait for the response
+        :type timeout: float
         :return: State document
         :rtype: :class:`nti.xapi.document.interfaces.IStateDocument`
         """
 
+    def retrieve_states(requests, max_workers=None, timeout=None):
+        """
+        Retrieve many states concurrently
+
+        :param requests: The (activity, agent, state_id) or (activity,
+            agent, state_id, registration) tuples of the states
+        :param max_workers: Most states retrieved at once
+        :type max_workers: int
+        :param timeout: Seconds to wait for each response
+        :type timeout: float
+        :return: The (value, error) pair of each request, keyed by request
+        :rtype: dict
+        """
+
     def save_state(state):
         """
         Save a state doc to the LRS
@@ -755,7 +830,7 @@ class ILRSClient(interface.Interface):
         :return: List of retrieved activity profile ids
         """
 
-    def retrieve_activity_profile(activity, profile_id):
+    def retrieve_activity_profile(activity, profile_id, timeout=None):
         """
         Retrieve activity profile with the specified parameters
 
@@ -763,10 +838,27 @@ class ILRSClient(interface.Interface):
         :type activity: :class:`nti.xapi.interfaces.IActivity`
         :param profile_id: UUID of the desired profile
         :type profile_id: str
+        :param timeout: Seconds to wait for the response
+        :type timeout: float
         :return: Activity profile doc
         :rtype: :class:`nti.xapi.interfaces.IActivityProfileDocument`
         """
 
+    def retrieve_activity_profiles(activity, profile_ids, max_workers=None, timeout=None):
+        """
+        Retrieve many profiles of an activity concurrently
+
+        :param activity: Activity object of the desired profiles
+        :type activity: :class:`nti.xapi.interfaces.IActivity`
+        :param profile_ids: The ids of the desired profiles
+        :param max_workers: Most profiles retrieved at once
+        :type max_workers: int
+        :param timeout: Seconds to wait for each response
+        :type timeout: float
+        :return: The (value, error) pair of each profile, keyed by id
+        :rtype: dict
+        """
+
     def save_activity_profile(profile):
         """
         Save an activity profile doc to the LRS
@@ -800,7 +892,7 @@ class ILRSClient(interface.Interface):
         :return: List of retrieved agent profile ids
         """
 
-    def retrieve_agent_profile(agent, profile_id):
+    def retrieve_agent_profile(agent, profile_id, timeout=None):
         """
         Retrieve agent profile with the specified parameters
 
@@ -808,10 +900,27 @@ class ILRSClient(interface.Interface):
         :type agent: :class:`nti.xapi.interfaces.IAgent`
         :param profile_id: UUID of the desired agent profile
         :type profile_id: str
+        :param timeout: Seconds to wait for the response
+        :type timeout: float
         :return: An agent profile document
         :rtype: :class:`nti.xapi.interfaces.IAgentProfileDocument`
         """
 
+    def retrieve_agent_profiles(agent, profile_ids, max_workers=None, timeout=None):
+        """
+        Retrieve many profiles of an agent concurrently
+
+        :param agent: Agent object of the desired profiles
+        :type agent: :class:`nti.xapi.interfaces.IAgent`
+        :param profile_ids: The ids of the desired profiles
+        :param max_workers: Most profiles retrieved at once
+        :type max_workers: int
+        :param timeout: Seconds to wait for each response
+        :type timeout: float
+        :return: The (value, error) pair of each profile, keyed by id
+        :rtype: dict
+        """
+
     def save_agent_profile(profile):
         """
         Save an agent profile doc to the LRS
@@ -831,3 +940,344 @@ class ILRSClient(interface.Interface):
         :return: True if object was deleted
         :rtype: bool
         """
+
+
+class IAsyncLRSClient(interface.Interface):
+    """
+    An LRS client providing every :class:`ILRSClient` operation
+    as a coroutine.
+    """
+
+    max_concurrency = Attribute(u'The maximum number of calls in flight at once.')
+
+    def close():
+        """
+        Release the worker threads and pooled connections.
+        """
+
+
+class IStatementEmitter(interface.Interface):
+    """
+    Buffers statements and saves them to an LRS in batches.
+    """
+
+    def emit(statement):
+        """
+        Queue a statement to be saved. Once its batch is saved the
+        statement id is set to the one assigned by the LRS.
+
+        :param statement: Statement object to be saved
+        :type statement: :class:`nti.xapi.interfaces.IStatement`
+        """
+
+    def flush(timeout=None):
+        """
+        Block until every statement emitted before this call is sent.
+
+        :param timeout: Maximum seconds to wait
+        :type timeout: float
+        :return: False if the timeout expired
+        :rtype: bool
+        """
+
+    def close(timeout=None):
+        """
+        Send any buffered statements and stop accepting new ones.
+
+        :param timeout: Maximum seconds to wait
+        :type timeout: float
+        """
+
+
+class IJSONCodec(interface.Interface):
+    """
+    Encodes and decodes the JSON documents exchanged with an LRS.
+    """
+
+    name = Attribute(u'The name the codec is selected by.')
+
+    def loads(data):
+        """
+        Parse a JSON document.
+
+        :param data: The document, as UTF-8 bytes or text
+        """
+
+    def dumps(obj):
+        """
+        Encode an object as a JSON document. Datetimes and timedeltas
+        are written as ISO 8601 strings.
+
+        :return: The UTF-8 encoded document
+        :rtype: bytes
+        """
+
+
+class IRequestCompressor(interface.Interface):
+    """
+    Compresses the bodies of requests sent to an LRS.
+    """
+
+    encoding = Attribute(u'The Content-Encoding of the compressed bodies.')
+
+    def compress(data):
+        """
+        Compress a request body.
+
+        :param data: The body
+        :type data: bytes
+        :rtype: bytes
+        """
+
+
+class ICache(interface.Interface):
+    """
+    A bounded, thread-safe cache of objects read from an LRS.
+    """
+
+    hits = Attribute(u'The number of lookups that found an entry.')
+
+    misses = Attribute(u'The number of lookups that found nothing.')
+
+    def get(key, default=None):
+        """
+        Return the entry for a key, marking it recently used.
+        """
+
+    def set(key, value):
+        """
+        Store an entry, evicting the least recently used ones to stay
+        within the cache bounds.
+        """
+
+    def pop(key, default=None):
+        """
+        Remove and return the entry for a key.
+        """
+
+    def discard(predicate):
+        """
+        Remove the entries whose key the predicate accepts.
+
+        :return: The number of entries removed
+        :rtype: int
+        """
+
+    def clear():
+        """
+        Remove every entry.
+        """
+
+
+class IDocumentCache(ICache):
+    """
+    A cache of the state and profile documents read from an LRS, kept
+    to revalidate them with conditional requests.
+    """
+
+
+class IStatementCache(ICache):
+    """
+    A cache of the statements read from or saved to an LRS, by
+    endpoint and statement id. Statements are immutable once stored,
+    so cached ones are returned without asking the LRS; they are
+    shared and must not be modified.
+    """
+
+
+class IRetryPolicy(interface.Interface):
+    """
+    Decides whether and when a failed idempotent call to an LRS is
+    made again, and counts what it did.
+    """
+
+    calls = Attribute(u'The number of calls made under the policy.')
+
+    retries = Attribute(u'The number of times a call was made again.')
+
+    recovered = Attribute(u'The number of calls that succeeded after a retry.')
+
+    exhausted = Attribute(u'The number of calls that failed after every attempt.')
+
+    throttled = Attribute(u'The number of 429 and 503 responses with a Retry-After.')
+
+    denied = Attribute(u'The number of retries refused by the retry budget.')
+
+    def call(func):
+        """
+        Call a function sending a request until it returns a response
+        that need not be retried, or retrying stops.
+
+        :return: The last response
+        :raises: The last connection error or timeout, if no response
+            was received
+        """
+
+    def metrics():
+        """
+        Return the counters as a dictionary.
+        """
+
+
+class ICircuitBreaker(interface.Interface):
+    """
+    Fails calls to an LRS fast once it keeps failing, and lets calls
+    through again once a health probe succeeds.
+    """
+
+    state = Attribute(u'One of closed, open or half-open.')
+
+    failures = Attribute(u'The number of consecutive failed calls.')
+
+    opened = Attribute(u'The number of times the breaker opened.')
+
+    rejected = Attribute(u'The number of calls failed fast.')
+
+    probe = Attribute(u'Called with no arguments to check the LRS is healthy '
+                      u'again; a true result closes the breaker.')
+
+    def call(func):
+        """
+        Call a function sending a request, counting a connection error,
+        a timeout or a 5xx response as a failure.
+
+        :raises CircuitOpenException: If the breaker is open
+        """
+
+    def metrics():
+        """
+        Return the state and counters as a dictionary.
+        """
+
+
+class ISpillBuffer(interface.Interface):
+    """
+    Keeps statements that could not be delivered to an LRS.
+    """
+
+    def __len__():
+        """
+        Return the number of statements kept.
+        """
+
+    def put(statements, attachments=None):
+        """
+        Keep a batch of statements and, when the buffer can, the data
+        of their attachments.
+
+        :param attachments: The attachment data by SHA-2 hash, see
+            :meth:`ILRSClient.save_statements`
+        :return: False if the buffer is full and the batch was not kept
+        :rtype: bool
+        """
+
+    def drain():
+        """
+        Remove and return the statements kept, oldest first.
+        """
+
+
+class ISpillQueue(ISpillBuffer):
+    """
+    A spill buffer replaying its batches, with their attachments, in
+    the order they were kept. It has a single consumer.
+    """
+
+    def peek():
+        """
+        Return the oldest batch kept as a (statements, attachments)
+        pair, or None if there is none.
+        """
+
+    def ack():
+        """
+        Remove the batch returned by :meth:`peek`, once delivered.
+        """
+
+
+class ILRSCallEvent(interface.Interface):
+    """
+    What happened during a call to an LRS client operation.
+    """
+
+    operation = Attribute(u'The name of the client method called.')
+
+    endpoint = Attribute(u'The LRS endpoint of the client.')
+
+    method = Attribute(u'The HTTP method of the last request, or None if none was sent.')
+
+    path = Attribute(u'The URL path of the last request.')
+
+    status = Attribute(u'The status of the last response, or None if none was received.')
+
+    bytes_sent = Attribute(u'The size of the request bodies, when known.')
+
+    bytes_received = Attribute(u'The size of the response bodies, when known.')
+
+    serialization = Attribute(u'Seconds spent encoding request bodies.')
+
+    network = Attribute(u'Seconds spent sending requests and receiving responses.')
+
+    parsing = Attribute(u'Seconds spent reading objects from response bodies.')
+
+    duration = Attribute(u'Seconds the whole call took.')
+
+    attempts = Attribute(u'The number of requests sent.')
+
+    retries = Attribute(u'The number of requests sent again.')
+
+    cache = Attribute(u'hit or miss when a cache was consulted, otherwise None.')
+
+    error = Attribute(u'The exception the call raised, or None.')
+
+
+class ILRSCallObserver(interface.Interface):
+    """
+    Receives an event for every call made to an LRS client operation.
+    Register observers as utilities; every one registered is notified.
+    """
+
+    def notify(event):
+        """
+        Called once the call is over, on the thread that made it.
+
+        :param event: The call
+        :type event: :class:`ILRSCallEvent`
+        """
+
+
+class IInterner(interface.Interface):
+    """
+    Shares the verbs, activities and agents, and the IRI strings, built
+    while reading statements, so that equal ones are one object.
+    """
+
+    hits = Attribute(u'The number of objects found already built.')
+
+    misses = Attribute(u'The number of objects that had to be built.')
+
+    def string(value):
+        """
+        Return the string equal to the value seen first.
+        """
+
+    def key(factory, ext):
+        """
+        Return the key of the object the factory builds from external
+        data, or None if it can't be shared.
+        """
+
+    def get(key, default=None):
+        """
+        Return the object built for a key.
+        """
+
+    def set(key, value):
+        """
+        Keep the object built for a key.
+        """
+
+    def clear():
+        """
+        Forget every object and string.
+        """
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Interning of the entities statements repeat, while they are read.
+
+The statements of a page commonly share a few verbs, activities and
+agents. Reading them with an :class:`Interner`, one object is built
+for each distinct verb, activity and agent, and its language maps and
+definition with it, and shared by every statement that names it;
+equal IRI strings are shared as well. The memory statements take then
+grows with the number of distinct entities rather than the number of
+statements.
+
+The shared objects must not be changed, as a change shows in every
+statement holding them.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import hashlib
+
+import simplejson as json
+
+from zope import interface
+
+from nti.xapi.cache import LRUCache
+
+from nti.xapi.interfaces import IAgent
+from nti.xapi.interfaces import IVerb
+from nti.xapi.interfaces import IActivity
+from nti.xapi.interfaces import IInterner
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The interfaces of the objects shared
+INTERNED = (IVerb, IActivity, IAgent)
+
+
+def interned(obj):
+    """
+    Return whether the object is one an :class:`Interner` shares.
+    """
+    for iface in INTERNED:
+        if iface.providedBy(obj):
+            return True
+    return False
+
+
+@interface.implementer(IInterner)
+class Interner(object):
+    """
+    Keeps the ``maxsize`` most recently used entities, keyed by their
+    IRI and the hash of their canonical JSON, and up to
+    ``max_strings`` strings, forgotten all at once when exceeded. It
+    may be shared between threads.
+    """
+
+    def __init__(self, maxsize=10000, max_strings=100000):
+        self.max_strings = max_strings
+        self._objects = LRUCache(maxsize)
+        self._strings = {}
+
+    @property
+    def maxsize(self):
+        return self._objects.maxsize
+
+    @property
+    def hits(self):
+        return self._objects.hits
+
+    @property
+    def misses(self):
+        return self._objects.misses
+
+    def __len__(self):
+        return len(self._objects)
+
+    def string(self, value):
+        strings = self._strings
+        try:
+            return strings[value]
+        except KeyError:
+            if len(strings) >= self.max_strings:
+                strings.clear()
+            return strings.setdefault(value, value)
+
+    def key(self, factory, ext):
+        try:
+            canonical = json.dumps(ext, sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+        digest = hashlib.sha1(canonical.encode('utf-8')).digest()
+        return factory, ext.get('id'), digest
+
+    def get(self, key, default=None):
+        return self._objects.get(key, default)
+
+    def set(self, key, value):
+        self._objects.set(key, value)
+
+    def clear(self):
+        self._objects.clear()
+        self._strings.clear()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Streaming ``multipart/mixed`` bodies, used to send statements with
+their attachments and to read them back.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import uuid
+import tempfile
+
+import six
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Bytes read at a time from a part's file
+CHUNK_SIZE = 64 * 1024
+
+#: Part bodies larger than this are spooled to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+_CRLF = b'\r\n'
+
+
+def _to_bytes(value):
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def _body_length(body):
+    """
+    Return the number of bytes left to read from a part body, or None
+    if that can't be known without reading it.
+    """
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, six.text_type):
+        return len(body.encode('utf-8'))
+    if 'b' not in getattr(body, 'mode', 'b'):
+        return None  # text files
+    try:
+        position = body.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    try:
+        size = os.fstat(body.fileno()).st_size
+    except (AttributeError, IOError, OSError, ValueError):
+        try:
+            body.seek(0, os.SEEK_END)
+            size = body.tell()
+            body.seek(position)
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+    if isinstance(body.read(0), six.text_type):
+        return None  # text streams, such as StringIO
+    return max(0, size - position)
+
+
+class MultipartEncoder(object):
+    """
+    A ``multipart/mixed`` request body produced as it is sent. The
+    bodies of the parts, bytes or file objects, are read in chunks,
+    never held in memory whole.
+
+    Pass it as the ``data`` of a :mod:`requests` request along with
+    its :attr:`content_type`. When the size of every part is known,
+    :attr:`len` is the size of the body and the request carries a
+    ``Content-Length``; otherwise it is None and the body is sent with
+    chunked transfer encoding.
+    """
+
+    def __init__(self, parts, boundary=None, chunk_size=CHUNK_SIZE):
+        """
+        :param parts: The (headers, body) pairs of the parts; headers
+            is a sequence of (name, value) pairs
+        :param boundary: The part boundary, random by default
+        :type boundary: str
+        :param chunk_size: Bytes read at a time from a file
+        :type chunk_size: int
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._parts = []
+        boundary = _to_bytes(self.boundary)
+        length = 0
+        for headers, body in parts:
+            head = [b'--' + boundary]
+            head.extend(_to_bytes('%s: %s' % header) for header in headers)
+            head = _CRLF.join(head) + _CRLF + _CRLF
+            size = _body_length(body)
+            if length is not None:
+                length = None if size is None else length + len(head) + size + 2
+            self._parts.append((head, body, size))
+        self._tail = b'--' + boundary + b'--' + _CRLF
+        self.len = None if length is None else length + len(self._tail)
+        self._chunks = None
+        self._buffer = b''
+
+    @property
+    def content_type(self):
+        return 'multipart/mixed; boundary=%s' % self.boundary
+
+    def _read_body(self, body, size):
+        if not hasattr(body, 'read'):
+            yield _to_bytes(body)
+            return
+        # stop at the announced size should the file grow
+        remaining = size
+        while remaining is None or remaining > 0:
+            count = self.chunk_size
+            if remaining is not None:
+                count = min(count, remaining)
+            data = body.read(count)
+            if not data:
+                break
+            data = _to_bytes(data)
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+    def __iter__(self):
+        for head, body, size in self._parts:
+            yield head
+            for data in self._read_body(body, size):
+                yield data
+            yield _CRLF
+        yield self._tail
+
+    def read(self, size=-1):
+        """
+        Read up to ``size`` bytes of the body, all of it if negative.
+        """
+        if self._chunks is None:
+            self._chunks = iter(self)
+        result = [self._buffer]
+        available = len(self._buffer)
+        while size < 0 or available < size:
+            data = next(self._chunks, None)
+            if data is None:
+                break
+            result.append(data)
+            available += len(data)
+        data = b''.join(result)
+        if size < 0:
+            size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def get_boundary(content_type):
+    """
+    Return the boundary of a ``multipart`` content type, or None.
+    """
+    for param in (content_type or '').split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'boundary':
+            return value.strip().strip('"') or None
+    return None
+
+
+class MultipartPart(object):
+    """
+    A part read from a ``multipart/mixed`` body. Its body is in
+    :attr:`file`, positioned at the start; close the part when done
+    with it to release a spooled temporary file.
+    """
+
+    def __init__(self, headers, fp, length):
+        #: The part headers, keyed by lower-cased name
+        self.headers = headers
+        self.file = fp
+        self.length = length
+
+    @property
+    def content_type(self):
+        return self.headers.get('content-type', 'text/plain')
+
+    @property
+    def sha2(self):
+        return self.headers.get('x-experience-api-hash')
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+class _ChunkBuffer(object):
+
+    def __init__(self, chunks, data=b''):
+        self._chunks = iter(chunks)
+        self.data = data
+
+    def fill(self):
+        """
+        Append the next chunk to the buffered data, returning False
+        once the chunks are exhausted.
+        """
+        for chunk in self._chunks:
+            if chunk:
+                self.data += chunk
+                return True
+        return False
+
+    def line(self):
+        """
+        Remove and return the next line, without its CRLF, or None
+        if the chunks end first.
+        """
+        index = self.data.find(_CRLF)
+        while index < 0:
+            if not self.fill():
+                return None
+            index = self.data.find(_CRLF)
+        result, self.data = self.data[:index], self.data[index + 2:]
+        return result
+
+    def skip_to(self, delimiter):
+        """
+        Discard data up to and including the delimiter, returning
+        False if it is not found.
+        """
+        keep = len(delimiter) - 1
+        while True:
+            index = self.data.find(delimiter)
+            if index >= 0:
+                self.data = self.data[index + len(delimiter):]
+                return True
+            self.data = self.data[-keep:]
+            if not self.fill():
+                return False
+
+    def copy_to(self, delimiter, fp):
+        """
+        Write data up to the delimiter to the file, discarding the
+        delimiter, and return the number of bytes written.
+        """
+        keep = len(delimiter) - 1
+        written = 0
+        while True:
+            index = self.data.find(delimiter)
+            if index >= 0:
+                fp.write(self.data[:index])
+                self.data = self.data[index + len(delimiter):]
+                return written + index
+            if len(self.data) > keep:
+                fp.write(self.data[:-keep])
+                written += len(self.data) - keep
+                self.data = self.data[-keep:]
+            if not self.fill():
+                raise ValueError('Multipart body ended within a part')
+
+
+def _parse_headers(lines):
+    result = {}
+    for line in lines:
+        name, _, value = line.decode('latin-1').partition(':')
+        result[name.strip().lower()] = value.strip()
+    return result
+
+
+def iter_multipart(chunks, boundary, spool_size=SPOOL_SIZE):
+    """
+    Parse a ``multipart/mixed`` body as it is read, yielding a
+    :class:`MultipartPart` once each part has been read. Part bodies
+    are kept in memory up to ``spool_size`` bytes and in a temporary
+    file past that.
+
+    :param chunks: An iterable of the bytes of the body
+    :param boundary: The boundary, see :func:`get_boundary`
+    :type boundary: str
+    :param spool_size: Largest part body kept in memory
+    :type spool_size: int
+    """
+    # a leading CRLF lets the first boundary match the delimiter
+    delimiter = _CRLF + b'--' + _to_bytes(boundary)
+    buf = _ChunkBuffer(chunks, _CRLF)
+    if not buf.skip_to(delimiter):
+        raise ValueError('Multipart body without a boundary')
+    while True:
+        line = buf.line()
+        if line is None and buf.data.startswith(b'--'):
+            line = buf.data  # close delimiter without a CRLF
+        if line is None:
+            raise ValueError('Multipart body ended after a boundary')
+        if line.startswith(b'--'):
+            return  # the close delimiter; the epilogue is ignored
+        headers = []
+        line = buf.line()
+        while line:
+            headers.append(line)
+            line = buf.line()
+        if line is None:
+            raise ValueError('Multipart body ended within part headers')
+        fp = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        try:
+            length = buf.copy_to(delimiter, fp)
+        except ValueError:
+            fp.close()
+            raise
+        fp.seek(0)
+        yield MultipartPart(_parse_headers(headers), fp, length)
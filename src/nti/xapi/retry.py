@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Retries of failed idempotent calls to an LRS, with exponential
+backoff and jitter, ``Retry-After`` handling and a retry budget.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import random
+import threading
+
+from email.utils import mktime_tz
+from email.utils import parsedate_tz
+
+from requests.exceptions import Timeout
+from requests.exceptions import ConnectionError  # pylint: disable=redefined-builtin
+
+from zope import interface
+
+from nti.xapi.deadline import current_deadline
+
+from nti.xapi.interfaces import IRetryPolicy
+from nti.xapi.interfaces import DeadlineExceededException
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The response statuses retried by default
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+#: The response statuses whose ``Retry-After`` is honored
+RETRY_AFTER_STATUSES = (429, 503)
+
+#: The errors retried, raised when no response was received
+RETRY_ERRORS = (ConnectionError, Timeout)
+
+
+def parse_retry_after(value, now=None):
+    """
+    Return the seconds to wait given a ``Retry-After`` header, either
+    a number of seconds or an HTTP date, or None if it can't be read.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, mktime_tz(parsed) - now)
+
+
+class RetryBudget(object):
+    """
+    Limits retries to a share of the calls made, so that a failing LRS
+    is not sent more requests than it otherwise would.
+
+    Each call deposits ``ratio`` of a retry, up to ``reserve`` retries
+    and each retry withdraws one. The budget starts full, allowing
+    ``reserve`` retries before any call is made.
+    """
+
+    def __init__(self, ratio=0.2, reserve=10):
+        """
+        :param ratio: Retries earned per call
+        :type ratio: float
+        :param reserve: Most retries that can be saved up
+        :type reserve: int
+        """
+        self.ratio = ratio
+        self.reserve = reserve
+        self.balance = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.reserve, self.balance + self.ratio)
+
+    def withdraw(self):
+        """
+        Take a retry from the budget, returning False if there is none.
+        """
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+@interface.implementer(IRetryPolicy)
+class RetryPolicy(object):
+    """
+    Makes a call up to ``max_attempts`` times while it fails with a
+    connection error, a timeout or one of the ``statuses``. Attempts
+    are spaced by an exponential backoff with full jitter, or by the
+    ``Retry-After`` of 429 and 503 responses. A shared policy also
+    shares its budget and counters.
+
+    The client only applies it to idempotent calls. No retry is made
+    that would start after the deadline of the call, see
+    :mod:`nti.xapi.deadline`.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=30.0,
+                 jitter=True, statuses=RETRY_STATUSES, max_retry_after=60.0,
+                 budget=None, sleep=time.sleep):
+        """
+        :param max_attempts: Most times a call is made
+        :type max_attempts: int
+        :param backoff: Seconds before the first retry, doubled for
+            each one after
+        :type backoff: float
+        :param max_backoff: Most seconds between attempts
+        :type max_backoff: float
+        :param jitter: Wait a random time up to the backoff
+        :type jitter: bool
+        :param statuses: The response statuses retried
+        :param max_retry_after: Give up on a response asking to wait
+            longer than this many seconds
+        :type max_retry_after: float
+        :param budget: The budget retries are taken from, by default
+            a new :class:`RetryBudget`; False disables it
+        :type budget: :class:`RetryBudget`
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.max_retry_after = max_retry_after
+        self.budget = RetryBudget() if budget is None else (budget or None)
+        self.sleep = sleep
+        self.calls = 0
+        self.retries = 0
+        self.recovered = 0
+        self.exhausted = 0
+        self.throttled = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def metrics(self):
+        return dict((name, getattr(self, name))
+                    for name in ('calls', 'retries', 'recovered',
+                                 'exhausted', 'throttled', 'denied'))
+
+    def backoff_delay(self, attempt):
+        """
+        Return the seconds to wait after the given failed attempt.
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def delay(self, attempt, response=None):
+        """
+        Return the seconds to wait before retrying, or None when the
+        LRS asks to wait longer than :attr:`max_retry_after`.
+        """
+        retry_after = None
+        if response is not None and response.status_code in RETRY_AFTER_STATUSES:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is None:
+            return self.backoff_delay(attempt)
+        self._count('throttled')
+        if retry_after > self.max_retry_after:
+            return None
+        return retry_after
+
+    def call(self, func):
+        self._count('calls')
+        if self.budget is not None:
+            self.budget.deposit()
+        attempt = 1
+        while True:
+            response = error = None
+            try:
+                response = func()
+            except DeadlineExceededException:
+                raise
+            except RETRY_ERRORS as e:
+                error = e
+            if error is None and response.status_code not in self.statuses:
+                if attempt > 1:
+                    self._count('recovered')
+                return response
+            delay = None
+            if attempt < self.max_attempts:
+                delay = self.delay(attempt, response)
+            current = current_deadline()
+            remaining = current.remaining() if current is not None else None
+            if delay is not None and remaining is not None and delay >= remaining:
+                delay = None
+            if (delay is not None and self.budget is not None
+                    and not self.budget.withdraw()):
+                self._count('denied')
+                delay = None
+            if delay is None:
+                self._count('exhausted')
+                if error is not None:
+                    raise error
+                return response
+            logger.debug("Retrying in %.2fs after attempt %s failed with %s",
+                         delay, attempt,
+                         error if error is not None else response.status_code)
+            if response is not None:
+                response.close()
+            self._count('retries')
+            self.sleep(delay)
+            attempt += 1
@@ -0,0 +1,540 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Buffers for statements that could not be delivered to an LRS, in
+memory or in a durable queue on disk.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+import zlib
+import struct
+import threading
+
+from collections import deque
+
+from requests.exceptions import HTTPError
+
+from zope import interface
+
+from nti.xapi.client import _unavailable
+
+from nti.xapi.codec import get_codec
+
+from nti.xapi.externalization import externalize
+from nti.xapi.externalization import internalize
+
+from nti.xapi.interfaces import ISpillQueue
+from nti.xapi.interfaces import ISpillBuffer
+
+from nti.xapi.statement import Statement
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Force every batch to disk
+FSYNC_ALWAYS = 'always'
+
+#: Force batches to disk at most every so often
+FSYNC_INTERVAL = 'interval'
+
+#: Leave writing batches to disk to the operating system
+FSYNC_NEVER = 'never'
+
+#: Bytes read at a time from attachment data and segments
+CHUNK_SIZE = 64 * 1024
+
+
+@interface.implementer(ISpillBuffer)
+class MemorySpillBuffer(object):
+    """
+    Keeps at most ``maxlen`` statements in memory, dropping the oldest
+    ones first. Attachment data is not kept.
+    """
+
+    def __init__(self, maxlen=10000):
+        self.dropped = 0
+        self._statements = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._statements)
+
+    def put(self, statements, unused_attachments=None):
+        with self._lock:
+            for statement in statements:
+                if len(self._statements) == self._statements.maxlen:
+                    self.dropped += 1
+                self._statements.append(statement)
+        return True
+
+    def drain(self):
+        with self._lock:
+            result = list(self._statements)
+            self._statements.clear()
+        return result
+
+
+# A record is the length and CRC-32 of its payload, then the payload:
+# the length of its JSON header, the header, and the length and data of
+# each attachment, in the order the header lists their hashes.
+_FRAME = struct.Struct('>QI')
+_HEADER_LENGTH = struct.Struct('>I')
+_DATA_LENGTH = struct.Struct('>Q')
+
+_SEGMENT = 'segment-%012d.log'
+_CURSOR = 'cursor'
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _chunks(data, chunk_size=CHUNK_SIZE):
+    if not hasattr(data, 'read'):
+        yield data if isinstance(data, bytes) else data.encode('utf-8')
+        return
+    while True:
+        chunk = data.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+
+
+class SpilledAttachment(object):
+    """
+    The data of an attachment kept in a spill segment, a read-only
+    file object reading it from the segment as it is consumed.
+    """
+
+    def __init__(self, path, offset, size):
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self._position = 0
+        self._fp = None
+
+    def read(self, size=-1):
+        remaining = self.size - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        if self._fp is None:
+            self._fp = open(self.path, 'rb')
+        self._fp.seek(self.offset + self._position)
+        data = self._fp.read(size)
+        self._position += len(data)
+        return data
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self._position
+        elif whence == os.SEEK_END:
+            position += self.size
+        self._position = max(0, min(position, self.size))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+@interface.implementer(ISpillQueue)
+class DiskSpillQueue(object):
+    """
+    A write-ahead queue of statement batches, with the data of their
+    attachments, in append-only segment files in a directory.
+
+    Batches are appended to the newest segment, a new one started once
+    it holds ``segment_size`` bytes. A cursor file records where the
+    oldest undelivered batch starts; segments before it are deleted.
+    Once the segments hold ``max_bytes``, new batches are refused.
+    Every record carries a checksum, and a record torn by a crash is
+    discarded when the queue is opened again.
+
+    The ``fsync`` policy decides when writes are forced to disk:
+    :data:`FSYNC_ALWAYS` after every batch, :data:`FSYNC_INTERVAL` at
+    most every ``fsync_interval`` seconds, or :data:`FSYNC_NEVER`,
+    leaving it to the operating system.
+    """
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024,
+                 max_bytes=1024 * 1024 * 1024, fsync=FSYNC_INTERVAL,
+                 fsync_interval=1.0, codec=None):
+        """
+        :param directory: The directory of the queue, created if needed
+        :type directory: str
+        :param segment_size: Bytes after which a new segment is started
+        :type segment_size: int
+        :param max_bytes: Most bytes of segments kept on disk
+        :type max_bytes: int
+        :param fsync: When writes are forced to disk
+        :type fsync: str
+        :param fsync_interval: Most seconds between forced writes with
+            :data:`FSYNC_INTERVAL`
+        :type fsync_interval: float
+        :param codec: The JSON codec, or its name
+        """
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError('Unknown fsync policy %r' % (fsync,))
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.overflowed = 0
+        self.size = 0
+        self.records = 0
+        self._count = 0
+        self._peeked = None
+        self._synced = time.time()
+        self._codec = get_codec(codec)
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._open()
+
+    def __len__(self):
+        return self._count
+
+    # files
+
+    def _path(self, number):
+        return os.path.join(self.directory, _SEGMENT % number)
+
+    def _segments(self):
+        result = []
+        for name in os.listdir(self.directory):
+            if name.startswith('segment-') and name.endswith('.log'):
+                result.append(int(name[8:-4]))
+        return sorted(result)
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, _CURSOR), 'r') as fp:
+                number, offset = fp.read().split()
+            return int(number), int(offset)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_cursor(self):
+        path = os.path.join(self.directory, _CURSOR)
+        with open(path + '.tmp', 'w') as fp:
+            fp.write('%d %d' % self._cursor)
+            fp.flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(fp.fileno())
+        _replace(path + '.tmp', path)
+
+    def _open(self):
+        segments = self._segments()
+        self._cursor = self._read_cursor() or (segments[0] if segments else 0, 0)
+        for number in segments:
+            if number < self._cursor[0]:
+                os.remove(self._path(number))
+        segments = [n for n in segments if n >= self._cursor[0]]
+        for number in segments:
+            path = self._path(number)
+            start = self._cursor[1] if number == self._cursor[0] else 0
+            end = self._scan(path, start)
+            if end < os.path.getsize(path):
+                logger.warning("Discarding the torn end of spill segment %s", path)
+                with open(path, 'r+b') as fp:
+                    fp.truncate(end)
+            self.size += end
+        self._segment = segments[-1] if segments else self._cursor[0]
+        self._fp = self._create(self._segment)
+
+    def _create(self, number):
+        path = self._path(number)
+        open(path, 'ab').close()
+        fp = open(path, 'r+b')
+        fp.seek(0, os.SEEK_END)
+        return fp
+
+    def _scan(self, path, offset):
+        """
+        Count the batches of a segment from an offset, returning where
+        the last whole record ends.
+        """
+        with open(path, 'rb') as fp:
+            fp.seek(offset)
+            while True:
+                record = self._read(fp, load=False)
+                if record is None:
+                    return offset
+                self.records += 1
+                self._count += len(record[0])
+                offset = fp.tell()
+
+    def _compact(self):
+        """
+        Delete the segments before the cursor, all delivered.
+        """
+        for number in self._segments():
+            if number < self._cursor[0]:
+                path = self._path(number)
+                self.size -= os.path.getsize(path)
+                os.remove(path)
+
+    def _sync(self):
+        self._fp.flush()
+        now = time.time()
+        if (self.fsync == FSYNC_ALWAYS
+                or (self.fsync == FSYNC_INTERVAL and now - self._synced >= self.fsync_interval)):
+            os.fsync(self._fp.fileno())
+            self._synced = now
+
+    def close(self):
+        with self._lock:
+            if self.fsync != FSYNC_NEVER:
+                self._fp.flush()
+                os.fsync(self._fp.fileno())
+            self._fp.close()
+
+    # records
+
+    def _checksum(self, fp, length):
+        result = 0
+        while length > 0:
+            data = fp.read(min(CHUNK_SIZE, length))
+            if not data:
+                return None
+            result = zlib.crc32(data, result)
+            length -= len(data)
+        return result & 0xffffffff
+
+    def _read(self, fp, load=True):
+        """
+        Read the record at the position of a file, returning its
+        statements and, as :class:`SpilledAttachment` objects, its
+        attachments, or None if there is no whole one.
+        """
+        frame = fp.read(_FRAME.size)
+        if len(frame) < _FRAME.size:
+            return None
+        length, crc = _FRAME.unpack(frame)
+        start = fp.tell()
+        if length < _HEADER_LENGTH.size or self._checksum(fp, length) != crc:
+            return None
+        fp.seek(start)
+        size = _HEADER_LENGTH.unpack(fp.read(_HEADER_LENGTH.size))[0]
+        header = self._codec.loads(fp.read(size))
+        attachments = {}
+        for sha2 in header['attachments']:
+            size = _DATA_LENGTH.unpack(fp.read(_DATA_LENGTH.size))[0]
+            if load:
+                attachments[sha2] = SpilledAttachment(fp.name, fp.tell(), size)
+            fp.seek(size, os.SEEK_CUR)
+        fp.seek(start + length)
+        return header['statements'], attachments
+
+    def _write(self, header, attachments):
+        """
+        Append a record, returning its size.
+        """
+        fp = self._fp
+        start = fp.tell()
+        try:
+            fp.write(_FRAME.pack(0, 0))
+            fp.write(_HEADER_LENGTH.pack(len(header)))
+            fp.write(header)
+            for _, data in attachments:
+                at = fp.tell()
+                fp.write(_DATA_LENGTH.pack(0))
+                for chunk in _chunks(data):
+                    fp.write(chunk)
+                end = fp.tell()
+                fp.seek(at)
+                fp.write(_DATA_LENGTH.pack(end - at - _DATA_LENGTH.size))
+                fp.seek(end)
+            end = fp.tell()
+            length = end - start - _FRAME.size
+            fp.seek(start + _FRAME.size)
+            crc = self._checksum(fp, length)
+            fp.seek(start)
+            fp.write(_FRAME.pack(length, crc))
+            fp.seek(end)
+        except Exception:
+            fp.seek(start)
+            fp.truncate()
+            raise
+        return end - start
+
+    # queue
+
+    def put(self, statements, attachments=None):
+        statements = list(statements)
+        attachments = list((attachments or {}).items())
+        header = self._codec.dumps({
+            'statements': externalize(statements),
+            'attachments': [sha2 for sha2, _ in attachments],
+        })
+        with self._lock:
+            if self.size >= self.max_bytes:
+                self.overflowed += len(statements)
+                return False
+            self.size += self._write(header, attachments)
+            self.records += 1
+            self._count += len(statements)
+            self._sync()
+            if self._fp.tell() >= self.segment_size:
+                self._fp.close()
+                self._segment += 1
+                self._fp = self._create(self._segment)
+        return True
+
+    def peek(self):
+        with self._lock:
+            number, offset = self._cursor
+            while True:
+                record = None
+                path = self._path(number)
+                if os.path.exists(path):
+                    with open(path, 'rb') as fp:
+                        fp.seek(offset)
+                        record = self._read(fp)
+                        end = fp.tell()
+                if record is not None:
+                    break
+                if number >= self._segment:
+                    return None
+                number, offset = number + 1, 0
+            self._peeked = (number, end, len(record[0]))
+        statements = [internalize(ext, Statement) for ext in record[0]]
+        return statements, record[1]
+
+    def ack(self):
+        with self._lock:
+            if self._peeked is None:
+                raise ValueError('No batch to acknowledge')
+            number, end, count = self._peeked
+            self._peeked = None
+            self._cursor = (number, end)
+            self.records -= 1
+            self._count -= count
+            self._write_cursor()
+            self._compact()
+
+    def drain(self):
+        result = []
+        while True:
+            batch = self.peek()
+            if batch is None:
+                return result
+            result.extend(batch[0])
+            self.ack()
+
+
+class SpillDrainer(object):
+    """
+    Replays the batches of a spill queue in order through
+    :meth:`nti.xapi.client.LRSClient.replay_statements` on a background
+    thread, every ``interval`` seconds and when woken. It stops at the
+    first batch that can't be delivered for now, because of a
+    connection error, a timeout, an open breaker, a 408, 429 or 5xx
+    response, trying it again next time. A batch the LRS rejects with
+    another error response is moved to the ``dead_letter`` buffer, when
+    there is one, and counted as ``rejected``. Statements keep the ids
+    they were given, so a batch delivered more than once is stored
+    once.
+    """
+
+    def __init__(self, queue, client, interval=5.0, dead_letter=None):
+        """
+        :param queue: The queue replayed
+        :type queue: :class:`nti.xapi.interfaces.ISpillQueue`
+        :param client: The client delivering the batches
+        :type client: :class:`nti.xapi.client.LRSClient`
+        :param interval: Seconds between attempts
+        :type interval: float
+        :param dead_letter: Keeps the batches the LRS rejects, such as
+            a :class:`DiskSpillQueue` of another directory
+        :type dead_letter: :class:`nti.xapi.interfaces.ISpillBuffer`
+        """
+        self.queue = queue
+        self.client = client
+        self.interval = interval
+        self.dead_letter = dead_letter
+        self.replayed = 0
+        self.rejected = 0
+        self.failures = 0
+        self._stopped = False
+        self._event = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='SpillDrainer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wake(self):
+        """
+        Replay the queue now, such as when the LRS is known to be back.
+        """
+        self._event.set()
+
+    def close(self, timeout=None):
+        self._stopped = True
+        self._event.set()
+        self._thread.join(timeout)
+
+    def drain(self):
+        """
+        Replay batches until the queue is empty or one can't be
+        delivered for now.
+
+        :return: True if the queue was emptied
+        """
+        with self._drain_lock:
+            while True:
+                batch = self.queue.peek()
+                if batch is None:
+                    return True
+                statements, attachments = batch
+                try:
+                    self.client.replay_statements(statements, attachments)
+                except HTTPError as e:
+                    if _unavailable(e.response.status_code):
+                        return self._failed(statements, e)
+                    self._reject(statements, attachments, e)
+                except Exception as e:  # pylint: disable=broad-except
+                    return self._failed(statements, e)
+                else:
+                    self.replayed += len(statements)
+                finally:
+                    for data in (attachments or {}).values():
+                        if hasattr(data, 'close'):
+                            data.close()
+                self.queue.ack()
+
+    def _failed(self, statements, e):
+        logger.warning("Could not replay %s statement(s): %s", len(statements), e)
+        self.failures += 1
+        return False
+
+    def _reject(self, statements, attachments, e):
+        logger.error("LRS rejected %s spilled statement(s), %s them: %s",
+                     len(statements),
+                     'moving' if self.dead_letter is not None else 'dropping',
+                     e)
+        self.rejected += len(statements)
+        if self.dead_letter is not None:
+            for data in (attachments or {}).values():
+                if hasattr(data, 'seek'):
+                    data.seek(0)
+            if self.dead_letter.put(statements, attachments) is False:
+                logger.error("Dead letter buffer full, dropping %s statement(s)",
+                             len(statements))
+
+    def _run(self):
+        while not self._stopped:
+            self.drain()
+            self._event.wait(self.interval)
+            self._event.clear()
@@ -67,6 +67,11 @@ class StatementResult(SchemaConfigured):
 
     createDirectFieldProperties(IStatementResult)
 
+    #: The attachment parts of a ``multipart/mixed`` response, keyed
+    #: by their ``X-Experience-API-Hash``; see
+    #: :class:`nti.xapi.multipart.MultipartPart`
+    attachments = None
+
     def __iter__(self):
         # pylint: disable=no-member
         return iter(self.statements or ())
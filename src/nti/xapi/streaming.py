@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Incremental parsing of xAPI StatementResult documents.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import re
+import codecs
+
+import simplejson as json
+
+logger = __import__('logging').getLogger(__name__)
+
+_STRUCTURAL = re.compile(u'["{}\\[\\],:]')
+_STRING_SPECIAL = re.compile(u'["\\\\]')
+
+
+class StatementResultParser(object):
+    """
+    Parses a StatementResult JSON document fed in chunks of bytes.
+
+    :meth:`feed` returns the external (parsed JSON) form of every
+    statement whose element completed within the data seen so far.
+    Only the element being parsed is kept in memory. The other members
+    of the result, such as ``more``, are collected in :attr:`members`.
+    """
+
+    def __init__(self, encoding='utf-8', loads=json.loads):
+        """
+        :param encoding: The encoding of the document
+        :param loads: The function parsing each JSON element
+        """
+        self.members = {}
+        self._loads = loads
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._buf = u''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._expect_key = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._element_start = None
+        self._in_statements = False
+        self.done = False
+
+    @property
+    def more(self):
+        return self.members.get('more')
+
+    def feed(self, data):
+        """
+        Parse the next chunk, returning a list of the statements completed.
+        """
+        text = self._decoder.decode(data) if isinstance(data, bytes) else data
+        self._buf += text
+        statements = []
+        self._scan(statements)
+        self._trim()
+        return statements
+
+    def close(self):
+        """
+        Signal the end of the document.
+        """
+        statements = self.feed(self._decoder.decode(b'', True))
+        if not self.done:
+            raise ValueError('Incomplete StatementResult document')
+        return statements
+
+    def _scan(self, statements):
+        # pylint: disable=too-many-branches
+        buf = self._buf
+        pos = self._pos
+        end = len(buf)
+        while pos < end and not self.done:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buf, pos)
+                if match is None:
+                    pos = end
+                    break
+                if match.group() == u'\\':
+                    if match.end() >= end:
+                        # need the escaped character
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                pos = match.end()
+                self._in_string = False
+                if self._key_start is not None:
+                    self._key = self._loads(buf[self._key_start:pos])
+                    self._key_start = None
+                continue
+
+            match = _STRUCTURAL.search(buf, pos)
+            if match is None:
+                pos = end
+                break
+            token = match.group()
+            pos = match.end()
+            depth = self._depth
+            if token == u'"':
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key_start = match.start()
+            elif token == u':':
+                if depth == 1:
+                    self._expect_key = False
+                    self._value_start = pos
+            elif token in u'{[':
+                self._depth += 1
+                if depth == 0:
+                    self._expect_key = True
+                elif depth == 1 and self._key == u'statements' and token == u'[':
+                    self._in_statements = True
+                    self._value_start = None
+                elif depth == 2 and self._in_statements:
+                    self._element_start = match.start()
+            elif token in u'}]':
+                self._depth -= 1
+                if depth == 3 and self._in_statements:
+                    statements.append(self._loads(buf[self._element_start:pos]))
+                    self._element_start = None
+                elif depth == 2 and self._in_statements:
+                    self._in_statements = False
+                elif depth == 1:
+                    self._end_member(buf, match.start())
+                    self.done = True
+            elif depth == 1:  # a comma between members
+                self._end_member(buf, match.start())
+                self._expect_key = True
+        self._pos = pos
+
+    def _end_member(self, buf, end):
+        if self._value_start is not None:
+            self.members[self._key] = self._loads(buf[self._value_start:end])
+            self._value_start = None
+
+    def _trim(self):
+        # drop the consumed text, keeping anything still being parsed
+        keep = self._pos
+        for start in (self._element_start, self._value_start, self._key_start):
+            if start is not None:
+                keep = min(keep, start)
+        if keep:
+            self._buf = self._buf[keep:]
+            self._pos -= keep
+            if self._element_start is not None:
+                self._element_start -= keep
+            if self._value_start is not None:
+                self._value_start -= keep
+            if self._key_start is not None:
+                self._key_start -= keep
+
+
+def iter_statement_result(chunks, parser=None):
+    """
+    Yield the external form of each statement in a StatementResult
+    document read from an iterable of byte chunks. The remaining
+    members are available from the parser once exhausted.
+    """
+    parser = StatementResultParser() if parser is None else parser
+    for chunk in chunks:
+        for statement in parser.feed(chunk):
+            yield statement
+    for statement in parser.close():
+        yield statement  # pragma: no cover
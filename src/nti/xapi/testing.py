@@ -0,0 +1,570 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A small stand-in for an LRS, useful for exercising
+:class:`nti.xapi.client.LRSClient` over real HTTP connections, with
+no network access.
+
+It runs in-process, or in a process of its own with
+:class:`LocalLRSProcess` or the ``nti_xapi_local_lrs`` script, which
+prints its endpoint and serves until interrupted::
+
+    nti_xapi_local_lrs --port 8080 --latency 0.02 --error-rate 0.01
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import time
+import zlib
+import uuid
+import email
+import random
+import socket
+import hashlib
+import argparse
+import threading
+import subprocess
+
+from email.utils import formatdate
+from email.utils import parsedate_tz
+from email.utils import mktime_tz
+
+from collections import deque
+from collections import OrderedDict
+
+import simplejson as json
+
+from six.moves import socketserver
+from six.moves import urllib_parse
+from six.moves import BaseHTTPServer
+
+from nti.xapi.interfaces import Version
+
+from nti.xapi.multipart import MultipartEncoder
+
+logger = __import__('logging').getLogger(__name__)
+
+_message_from_bytes = getattr(email, 'message_from_bytes',
+                              email.message_from_string)
+
+#: The document resources, with the parameter naming a document and
+#: those naming its scope
+DOCUMENT_RESOURCES = {
+    'activities/state': ('stateId', ('activityId', 'agent', 'registration')),
+    'activities/profile': ('profileId', ('activityId',)),
+    'agents/profile': ('profileId', ('agent',)),
+}
+
+#: The zlib window bits decoding each content encoding
+_WBITS = {'gzip': 31, 'deflate': 15}
+
+
+class LocalLRSRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # buffer the response and send it in one write; headers and body
+    # in separate small segments stall keep-alive connections on
+    # delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.lrs.connection_opened(self.connection)
+
+    def finish(self):
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        finally:
+            self.server.lrs.connection_closed(self.connection)
+
+    def log_message(self, *unused_args):  # pylint: disable=arguments-differ
+        pass
+
+    def _read_body(self):
+        if 'chunked' in (self.headers.get('Transfer-Encoding') or ''):
+            return self._read_chunked_body()
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _read_chunked_body(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if not size:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        # the line ending the body
+        self.rfile.readline()
+        return b''.join(chunks)
+
+    def _handle(self):
+        parsed = urllib_parse.urlparse(self.path)
+        params = dict(urllib_parse.parse_qsl(parsed.query))
+        body = self._read_body()
+        status, headers, content = self.server.lrs.handle(self.command,
+                                                          parsed.path,
+                                                          params,
+                                                          self.headers,
+                                                          body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if content and self.command != 'HEAD':
+            self.wfile.write(content)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _handle
+
+
+class LocalLRSServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, lrs, address):
+        self.lrs = lrs
+        BaseHTTPServer.HTTPServer.__init__(self, address,
+                                           LocalLRSRequestHandler)
+
+    def handle_error(self, request, client_address):
+        # clients that gave up waiting, such as on a timeout
+        if isinstance(sys.exc_info()[1], socket.error):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)  # pragma: no cover
+
+
+class LocalLRS(object):
+    """
+    A threaded HTTP server implementing enough of the xAPI statements,
+    state, profile and about resources to drive an
+    :class:`nti.xapi.client.LRSClient`. Documents carry an ``ETag`` and
+    ``Last-Modified`` and honor conditional requests. Request bodies
+    in one of the ``content_encodings`` are decompressed; others are
+    refused with a 415.
+
+    Every request can be delayed by ``latency`` seconds, plus up to
+    ``jitter`` more, and a fraction ``error_rate`` of them fail with
+    ``error_status``, chosen by a random generator seeded with
+    ``seed`` so that a run can be repeated. :meth:`fail` fails the
+    next requests instead.
+
+    Use it as a context manager, or call :meth:`start` and :meth:`stop`.
+    """
+
+    prefix = '/xapi/'
+
+    def __init__(self, host='127.0.0.1', port=0, page_size=100,
+                 content_encodings=('gzip', 'deflate'), latency=0,
+                 jitter=0, error_rate=0, error_status=503, seed=None):
+        self.host = host
+        self.port = port
+        self.page_size = page_size
+        self.content_encodings = content_encodings
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        #: The number of requests failed on purpose
+        self.errors = 0
+        self._failures = deque()
+        self._random = random.Random(seed)
+        self.bytes_received = 0
+        self.statements = OrderedDict()
+        self.documents = OrderedDict()
+        self.attachments = {}
+        self.connections = 0
+        self.requests = 0
+        self._open = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        return 'http://%s:%s%s' % (self.host, self.port, self.prefix)
+
+    def start(self):
+        self._server = LocalLRSServer(self, (self.host, self.port))
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='LocalLRS')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+            # drop idle keep-alive connections so their threads exit
+            with self._lock:
+                open_connections = list(self._open.items())
+            for connection, thread in open_connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except socket.error:  # pragma: no cover
+                    pass
+                thread.join()
+
+    def join(self, timeout=None):
+        """
+        Wait until the server is stopped, returning False if it is
+        still running after ``timeout`` seconds.
+        """
+        thread = self._thread
+        until = None if timeout is None else time.time() + timeout
+        while thread is not None and thread.is_alive():
+            if until is not None and time.time() >= until:
+                return False
+            thread.join(0.1)
+        return True
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *unused_args):
+        self.stop()
+
+    def connection_opened(self, connection):
+        with self._lock:
+            self.connections += 1
+            self._open[connection] = threading.current_thread()
+
+    def connection_closed(self, connection):
+        with self._lock:
+            self._open.pop(connection, None)
+
+    # faults
+
+    def fail(self, count=1, status=None, retry_after=None):
+        """
+        Fail the next ``count`` requests with ``status``, by default
+        the ``error_status``, and an optional ``Retry-After``.
+        """
+        headers = {} if retry_after is None else {'Retry-After': str(retry_after)}
+        with self._lock:
+            self._failures.extend([(status or self.error_status, headers)] * count)
+
+    def _fault(self):
+        """
+        Return the delay and the failure, if any, of a request.
+        """
+        with self._lock:
+            delay = self.latency
+            if self.jitter:
+                delay += self._random.uniform(0, self.jitter)
+            failure = None
+            if self._failures:
+                failure = self._failures.popleft()
+            elif self.error_rate and self._random.random() < self.error_rate:
+                failure = (self.error_status, {})
+            if failure is not None:
+                self.errors += 1
+            return delay, failure
+
+    # dispatch
+
+    def handle(self, method, path, params, headers, body):
+        """
+        Handle a request, returning a (status, headers, body) tuple.
+        """
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += len(body)
+        delay, failure = self._fault()
+        if delay:
+            time.sleep(delay)
+        if failure is not None:
+            return self._response(failure[0], headers=failure[1])
+        encoding = headers.get('Content-Encoding')
+        if encoding:
+            if encoding not in self.content_encodings:
+                return self._response(415)
+            body = zlib.decompress(body, _WBITS[encoding])
+        resource = path[len(self.prefix):] if path.startswith(self.prefix) else None
+        method = 'GET' if method == 'HEAD' else method
+        if resource in DOCUMENT_RESOURCES:
+            handler = getattr(self, '%s_document' % method.lower(), None)
+            if handler is None:
+                return self._response(405)
+            return handler(resource, params, headers, body)
+        name = '%s_%s' % (method.lower(), (resource or '').replace('/', '_'))
+        handler = getattr(self, name, None)
+        if handler is None:
+            return self._response(404)
+        return handler(params, headers, body)
+
+    def _response(self, status, content=b'', content_type='application/json',
+                  headers=None):
+        result = {
+            'X-Experience-API-Version': Version.latest,
+            'Content-Type': content_type,
+        }
+        result.update(headers or ())
+        return status, result, content
+
+    def _json(self, data, status=200):
+        return self._response(status, json.dumps(data).encode('utf-8'))
+
+    # about
+
+    def get_about(self, unused_params, unused_headers, unused_body):
+        return self._json({'version': list(Version.supported)})
+
+    # statements
+
+    def _store(self, ext):
+        sid = ext.setdefault('id', str(uuid.uuid4()))
+        with self._lock:
+            self.statements[sid] = ext
+        return sid
+
+    def _read_statements(self, headers, body):
+        """
+        Parse a statements request body, keeping the attachments of a
+        ``multipart/mixed`` one.
+        """
+        content_type = headers.get('Content-Type') or ''
+        if not content_type.startswith('multipart/mixed'):
+            return json.loads(body)
+        head = ('Content-Type: %s\r\n\r\n' % content_type).encode('ascii')
+        parts = _message_from_bytes(head + body).get_payload()
+        for part in parts[1:]:
+            self.attachments[part['X-Experience-API-Hash']] = part.get_payload(decode=True)
+        return json.loads(parts[0].get_payload(decode=True))
+
+    def put_statements(self, params, headers, body):
+        sid = params.get('statementId')
+        if not sid:
+            return self._response(400)
+        ext = self._read_statements(headers, body)
+        # LRSClient.save_statement sends a one element list
+        ext = ext[0] if isinstance(ext, list) else ext
+        ext['id'] = sid
+        self._store(ext)
+        return self._response(204)
+
+    def post_statements(self, unused_params, headers, body):
+        ext = self._read_statements(headers, body)
+        ext = ext if isinstance(ext, list) else [ext]
+        return self._json([self._store(x) for x in ext])
+
+    def get_statements(self, params, unused_headers, unused_body):
+        sid = params.get('statementId') or params.get('voidedStatementId')
+        if sid:
+            if sid not in self.statements:
+                return self._response(404)
+            return self._statements_response(self.statements[sid], params)
+        limit = int(params.get('limit') or 0) or self.page_size
+        start = int(params.get('cursor') or 0)
+        with self._lock:
+            page = list(self.statements.values())[start:start + limit]
+            remaining = len(self.statements) - start - len(page)
+        more = ''
+        if remaining > 0:
+            query = [('cursor', start + len(page)), ('limit', limit)]
+            if params.get('attachments'):
+                query.append(('attachments', params['attachments']))
+            more = '%sstatements?%s' % (self.prefix, urllib_parse.urlencode(query))
+        return self._statements_response({'statements': page, 'more': more},
+                                         params)
+
+    def _statements_response(self, data, params):
+        """
+        Return statements as JSON or, when attachments are queried, as
+        ``multipart/mixed`` with the stored data of their attachments.
+        """
+        if str(params.get('attachments')).lower() != 'true':
+            return self._json(data)
+        parts = [((('Content-Type', 'application/json'),),
+                  json.dumps(data).encode('utf-8'))]
+        sent = set()
+        for statement in data.get('statements', [data]):
+            for attachment in statement.get('attachments') or ():
+                sha2 = attachment.get('sha2')
+                if sha2 not in self.attachments or sha2 in sent:
+                    continue
+                sent.add(sha2)
+                headers = (('Content-Type', attachment.get('contentType')),
+                           ('Content-Transfer-Encoding', 'binary'),
+                           ('X-Experience-API-Hash', sha2))
+                parts.append((headers, self.attachments[sha2]))
+        encoder = MultipartEncoder(parts)
+        return self._response(200, b''.join(encoder), encoder.content_type)
+
+    # documents
+
+    def _document_scope(self, resource, params):
+        scope = [resource]
+        for name in DOCUMENT_RESOURCES[resource][1]:
+            value = params.get(name)
+            if name == 'agent' and value:
+                # agents are matched by their identifier
+                value = json.loads(value)
+                value.pop('name', None)
+                value = json.dumps(value, sort_keys=True)
+            scope.append(value)
+        return tuple(scope)
+
+    def _document_key(self, resource, params):
+        document_id = params.get(DOCUMENT_RESOURCES[resource][0])
+        if not document_id:
+            return None
+        return self._document_scope(resource, params) + (document_id,)
+
+    @staticmethod
+    def _validators(document):
+        return {'ETag': document['etag'],
+                'Last-Modified': document['modified']}
+
+    def _modified_since(self, document, headers):
+        if headers.get('If-None-Match'):
+            return headers['If-None-Match'] != document['etag']
+        since = parsedate_tz(headers.get('If-Modified-Since') or '')
+        if since is None:
+            return True
+        return mktime_tz(parsedate_tz(document['modified'])) > mktime_tz(since)
+
+    def get_document(self, resource, params, headers, unused_body):
+        key = self._document_key(resource, params)
+        if key is None:
+            scope = self._document_scope(resource, params)
+            with self._lock:
+                ids = [k[-1] for k in self.documents if k[:-1] == scope]
+            return self._json(ids)
+        document = self.documents.get(key)
+        if document is None:
+            return self._response(404)
+        if not self._modified_since(document, headers):
+            return self._response(304, headers=self._validators(document))
+        return self._response(200, document['content'],
+                              document['content_type'],
+                              self._validators(document))
+
+    def _precondition_failed(self, key, headers):
+        etag = headers.get('If-Match')
+        if not etag:
+            return False
+        document = self.documents.get(key)
+        return document is None or document['etag'] != etag
+
+    def put_document(self, resource, params, headers, body):
+        key = self._document_key(resource, params)
+        if key is None:
+            return self._response(400)
+        with self._lock:
+            if self._precondition_failed(key, headers):
+                return self._response(412)
+            self.documents[key] = {
+                'content': body,
+                'content_type': headers.get('Content-Type') or 'application/octet-stream',
+                'etag': '"%s"' % hashlib.sha1(body).hexdigest(),
+                'modified': formatdate(time.time(), usegmt=True),
+            }
+        return self._response(204)
+
+    def delete_document(self, resource, params, headers, unused_body):
+        key = self._document_key(resource, params)
+        with self._lock:
+            if key is None:
+                scope = self._document_scope(resource, params)
+                for k in [k for k in self.documents if k[:-1] == scope]:
+                    del self.documents[k]
+            elif self._precondition_failed(key, headers):
+                return self._response(412)
+            else:
+                self.documents.pop(key, None)
+        return self._response(204)
+
+
+class LocalLRSProcess(object):
+    """
+    A :class:`LocalLRS` run in a process of its own, so that it
+    doesn't compete with the client for the interpreter. It takes the
+    options of the ``nti_xapi_local_lrs`` script as keywords, such as
+    ``page_size=10`` or ``error_rate=0.1``.
+
+    Use it as a context manager, or call :meth:`start` and :meth:`stop`.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.process = None
+        self.endpoint = None
+
+    def start(self):
+        args = [sys.executable, '-m', 'nti.xapi.testing']
+        for name, value in sorted(self.options.items()):
+            args.extend(('--' + name.replace('_', '-'), str(value)))
+        self.process = subprocess.Popen(args, stdout=subprocess.PIPE)
+        line = self.process.stdout.readline().decode('ascii').strip()
+        if not line:
+            self.stop()
+            raise RuntimeError('Local LRS process failed to start')
+        self.endpoint = line
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.terminate()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *unused_args):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u'Run a local stand-in LRS')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help=u'The address listened on')
+    parser.add_argument('--port', type=int, default=0,
+                        help=u'The port listened on, by default any free one')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help=u'The statements in a page of results')
+    parser.add_argument('--latency', type=float, default=0,
+                        help=u'Seconds every request is delayed')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help=u'Up to this many more seconds of delay')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help=u'The fraction of requests failed')
+    parser.add_argument('--error-status', type=int, default=503,
+                        help=u'The status of failed requests')
+    parser.add_argument('--seed', type=int,
+                        help=u'The seed of the delays and failures')
+    args = parser.parse_args(argv)
+    lrs = LocalLRS(host=args.host, port=args.port, page_size=args.page_size,
+                   latency=args.latency, jitter=args.jitter,
+                   error_rate=args.error_rate, error_status=args.error_status,
+                   seed=args.seed)
+    lrs.start()
+    try:
+        print(lrs.endpoint)
+        sys.stdout.flush()
+        lrs.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lrs.stop()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
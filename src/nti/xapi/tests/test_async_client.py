@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import has_property
+from hamcrest import less_than_or_equal_to
+
+from nti.testing.matchers import verifiably_provides
+
+import os
+import codecs
+import inspect
+import unittest
+
+import simplejson as json
+
+from nti.externalization import update_from_external_object
+
+from nti.xapi.about import About
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.interfaces import ILRSClient
+from nti.xapi.interfaces import IAsyncLRSClient
+from nti.xapi.interfaces import DeadlineExceededException
+
+from nti.xapi.statement import Statement
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+try:
+    import asyncio
+    from nti.xapi.async_client import AsyncLRSClient
+except (ImportError, SyntaxError):  # pragma: no cover
+    AsyncLRSClient = None
+
+
+@unittest.skipIf(AsyncLRSClient is None, 'Requires Python 3')
+class TestAsyncClient(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def run_async(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def collect(self, agen):
+        items = []
+        while True:
+            try:
+                items.append(self.run_async(agen.__anext__()))
+            except StopAsyncIteration:  # pylint: disable=undefined-variable
+                return items
+
+    @property
+    def statement(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "data", "statement.json")
+        with codecs.open(path, "r", "UTF-8") as fp:
+            stmt = Statement()
+            update_from_external_object(stmt, json.load(fp))
+        stmt.id = None
+        return stmt
+
+    def test_parity(self):
+        client = AsyncLRSClient('https://lrs.io', auth=('a', 'b'),
+                                max_concurrency=4)
+        assert_that(client, verifiably_provides(IAsyncLRSClient))
+        for name in ILRSClient.names():
+            method = getattr(client, name)
+            assert_that(inspect.iscoroutinefunction(method)
+                        or inspect.isasyncgenfunction(method),
+                        is_(True))
+        assert_that(client.get_state.__name__, is_('retrieve_state'))
+        assert_that(client, has_property('endpoint', 'https://lrs.io/'))
+        assert_that(client.client.pool_maxsize, is_(4))
+        assert_that(client.client.auth, is_(('a', 'b')))
+        client.close()
+
+        shared = LRSClient('https://lrs.io')
+        client = AsyncLRSClient(client=shared)
+        assert_that(client.client, is_(shared))
+        client.close()
+
+    def test_operations(self):
+        with LocalLRS() as lrs:
+            client = AsyncLRSClient(lrs.endpoint, max_concurrency=3)
+            assert_that(self.run_async(client.__aenter__()), is_(client))
+
+            abouts = self.run_async(asyncio.gather(*[client.about()
+                                                     for _ in range(20)]))
+            assert_that(abouts, has_length(20))
+            for about in abouts:
+                assert_that(about, instance_of(About))
+
+            saved = self.run_async(asyncio.gather(*[client.save_statement(self.statement)
+                                                    for _ in range(5)]))
+            for stmt in saved:
+                assert_that(stmt.id, is_not(none()))
+
+            fetched = self.run_async(client.get_statement(saved[0].id))
+            assert_that(fetched, instance_of(Statement))
+            assert_that(fetched.id, is_(saved[0].id))
+
+            result = self.run_async(client.query_statements({'limit': 2}))
+            assert_that(result.statements, has_length(2))
+            more = self.run_async(client.more_statements(result))
+            assert_that(more.statements, has_length(2))
+
+            ids = [x.id for x in self.collect(client.iter_statements({'limit': 2}))]
+            assert_that(ids, is_(list(lrs.statements)))
+            ids = [x.id for x in self.collect(client.iter_statements({'limit': 2},
+                                                                     prefetch=False))]
+            assert_that(ids, is_(list(lrs.statements)))
+            statements = self.collect(client.iter_statements({'limit': 2},
+                                                             max_statements=3))
+            assert_that(statements, has_length(3))
+            statements = self.collect(client.iter_statements({},
+                                                             max_statements=0))
+            assert_that(statements, has_length(0))
+            requests = lrs.requests
+            statements = self.collect(client.iter_statements({'limit': 2},
+                                                             max_statements=4))
+            assert_that(statements, has_length(4))
+            assert_that(lrs.requests, is_(requests + 2))
+
+            ids = [x.id for x in self.collect(client.iter_statements({'limit': 2},
+                                                                     stream=True))]
+            assert_that(ids, is_(list(lrs.statements)))
+            statements = self.collect(client.iter_statements({'limit': 2}, stream=True,
+                                                             max_statements=3))
+            assert_that(statements, has_length(3))
+            for stream in (False, True):
+                statements = client.iter_statements({'limit': 2}, stream=stream,
+                                                    deadline=0)
+                assert_that(calling(self.collect).with_args(statements),
+                            raises(DeadlineExceededException))
+
+            # the page fetched ahead is cancelled when the iteration stops
+            cancelled = []
+            fetch = client._fetch
+
+            def slow(deadline, func, arg):
+                if func != client.client.more_statements:
+                    return fetch(deadline, func, arg)
+                # never done
+                future = asyncio.Future()
+                future.add_done_callback(lambda f: cancelled.append(f.cancelled()))
+                return future
+            client._fetch = slow
+            statements = client.iter_statements({'limit': 2})
+            assert_that(self.run_async(statements.__anext__()), instance_of(Statement))
+            self.run_async(statements.aclose())
+            self.run_async(asyncio.sleep(0))
+            assert_that(cancelled, is_([True]))
+            del client._fetch
+
+            missing = self.run_async(client.retrieve_statement('missing'))
+            assert_that(missing, is_(none()))
+
+            self.run_async(client.__aexit__(None, None, None))
+            assert_that(lrs.connections, less_than_or_equal_to(3))
@@ -11,9 +11,21 @@ from hamcrest import assert_that
 from hamcrest import is_
 from hamcrest import has_entry
 from hamcrest import has_properties
-
+from hamcrest import calling
+from hamcrest import raises
+from hamcrest import has_length
+
+import os
+import shutil
+import hashlib
+import tempfile
 import unittest
 
+from io import BytesIO
+from io import StringIO
+
+import fudge
+
 from nti.testing.matchers import verifiably_provides
 
 from nti.externalization import update_from_external_object
@@ -25,6 +37,21 @@ from . import SharedConfiguringTestLayer
 from ..interfaces import IAttachment
 
 from ..attachment import Attachment
+from ..attachment import hash_file
+from ..attachment import hash_files
+from ..attachment import hash_stream
+from ..attachment import verify_attachment
+from ..attachment import attachment_from_file
+from ..attachment import attachments_from_files
+from ..attachment import attachment_from_stream
+
+from ..client import LRSClient
+
+from ..interfaces import AttachmentMismatchException
+
+from ..statement import Statement
+
+from ..testing import LocalLRS
 
 class TestAttachment(unittest.TestCase):
 
@@ -65,3 +92,142 @@ class TestAttachment(unittest.TestCase):
         update_from_external_object(attachment, self.data)
 
         self.validate_attachment(attachment)
+
+
+class _Unseekable(object):
+
+    def __init__(self, data):
+        self._data = BytesIO(data)
+
+    def read(self, size):
+        return self._data.read(size)
+
+
+class TestAttachmentHashing(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    usage_type = "http://adlnet.gov/expapi/attachments/signature"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _file(self, data, name='data.bin'):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return path
+
+    def test_hash(self):
+        data = os.urandom(200 * 1024)
+        expected = (hashlib.sha256(data).hexdigest(), len(data))
+        assert_that(hash_stream(BytesIO(data)), is_(expected))
+        assert_that(hash_stream(StringIO(u'caf\xe9')),
+                    is_((hashlib.sha256(b'caf\xc3\xa9').hexdigest(), 5)))
+        assert_that(hash_stream(BytesIO(data), 'sha512'),
+                    is_((hashlib.sha512(data).hexdigest(), len(data))))
+
+        path = self._file(data)
+        assert_that(hash_file(path), is_(expected))
+        patched = fudge.patch_object('nti.xapi.attachment', 'MMAP_THRESHOLD', 1024)
+        try:
+            assert_that(hash_file(path), is_(expected))
+        finally:
+            patched.restore()
+        assert_that(hash_file(self._file(b'', 'empty')),
+                    is_((hashlib.sha256(b'').hexdigest(), 0)))
+
+        paths = [self._file(data[:i * 1000], 'f%s' % i) for i in range(5)]
+        hashes = [hash_file(p) for p in paths]
+        assert_that(hash_files(paths), is_(hashes))
+        assert_that(hash_files(paths, max_workers=1), is_(hashes))
+        assert_that(hash_files(iter(paths[:1])), is_(hashes[:1]))
+
+    def test_attachments(self):
+        data = b'certificate'
+        sha2 = hashlib.sha256(data).hexdigest()
+        path = self._file(data, 'certificate.png')
+        attachment = attachment_from_file(path, self.usage_type)
+        assert_that(attachment, verifiably_provides(IAttachment))
+        assert_that(attachment,
+                    has_properties('usageType', self.usage_type,
+                                   'display', has_entry('und', 'certificate.png'),
+                                   'contentType', 'image/png',
+                                   'length', len(data),
+                                   'sha2', sha2,
+                                   'description', is_(None)))
+        attachment = attachment_from_file(path, self.usage_type,
+                                          {'en-US': 'Certificate'},
+                                          'application/pdf',
+                                          {'en-US': 'A certificate'})
+        assert_that(attachment,
+                    has_properties('display', has_entry('en-US', 'Certificate'),
+                                   'description', has_entry('en-US', 'A certificate'),
+                                   'contentType', 'application/pdf'))
+
+        other = self._file(b'data', 'data')
+        attachments = attachments_from_files([path, other], self.usage_type)
+        assert_that(attachments, has_length(2))
+        assert_that(attachments[1],
+                    has_properties('contentType', 'application/octet-stream',
+                                   'sha2', hashlib.sha256(b'data').hexdigest()))
+
+        stream = BytesIO(b'xx' + data)
+        stream.read(2)
+        attachment = attachment_from_stream(stream, self.usage_type,
+                                            {'en-US': 'Certificate'})
+        assert_that(attachment, has_properties('sha2', sha2,
+                                               'length', len(data)))
+        assert_that(stream.read(), is_(data))
+        stream = _Unseekable(data)
+        attachment = attachment_from_stream(stream, self.usage_type,
+                                            {'en-US': 'Certificate'})
+        assert_that(attachment, has_properties('sha2', sha2))
+        assert_that(stream.read(10), is_(b''))
+
+    def test_verify(self):
+        data = b'certificate'
+        attachment = attachment_from_stream(BytesIO(data), self.usage_type,
+                                            {'en-US': 'Certificate'})
+        assert_that(verify_attachment(attachment, data), is_(True))
+        assert_that(verify_attachment(attachment, u'certificate'), is_(True))
+        stream = BytesIO(data)
+        assert_that(verify_attachment(attachment, stream), is_(True))
+        assert_that(stream.tell(), is_(0))
+        assert_that(verify_attachment(attachment, _Unseekable(b'other')),
+                    is_(False))
+
+        for other in (b'certificatE', BytesIO(b'certificate!')):
+            assert_that(calling(verify_attachment).with_args(attachment, other),
+                        raises(AttachmentMismatchException))
+        attachment.length = 1
+        assert_that(calling(verify_attachment).with_args(attachment, data),
+                    raises(AttachmentMismatchException))
+
+        attachment.sha2 = hashlib.sha512(data).hexdigest().upper()
+        attachment.length = len(data)
+        assert_that(verify_attachment(attachment, data), is_(True))
+
+    def test_client(self):
+        data = b'certificate'
+        attachment = attachment_from_stream(BytesIO(data), self.usage_type,
+                                            {'en-US': 'Certificate'})
+        statement = Statement()
+        update_from_external_object(statement, {
+            "actor": {"mbox": "mailto:a@example.com"},
+            "verb": {"id": "http://adlnet.gov/expapi/verbs/attempted"},
+            "object": {"id": "http://example.com/activities/a"},
+        })
+        statement.attachments = [attachment]
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint, verify_attachments=True)
+            assert_that(calling(client.save_statement).with_args(
+                statement, {attachment.sha2: BytesIO(b'other')}),
+                raises(AttachmentMismatchException))
+            assert_that(lrs.requests, is_(0))
+            client.save_statement(statement, {attachment.sha2: BytesIO(data)})
+            assert_that(lrs.attachments[attachment.sha2], is_(data))
+            client.close()
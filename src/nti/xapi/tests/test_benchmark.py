@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_key
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_entries
+from hamcrest import contains_exactly
+from hamcrest import less_than
+from hamcrest import greater_than
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from collections import OrderedDict
+
+import six
+
+import simplejson as json
+
+from nti.xapi.benchmark import COMPLETE
+from nti.xapi.benchmark import Benchmarks
+
+from nti.xapi.benchmark import main
+from nti.xapi.benchmark import run_benchmarks
+from nti.xapi.benchmark import generate_statements
+
+from nti.xapi.externalization import externalize
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+
+class TestBenchmark(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def test_generate_statements(self):
+        statements = generate_statements(20, actors=2, verbs=3, activities=4)
+        assert_that(statements, has_length(20))
+        assert_that(set(s.actor.mbox for s in statements), has_length(2))
+        assert_that(set(s.verb.id for s in statements), has_length(3))
+        assert_that(set(s.object.id for s in statements), has_length(4))
+        # repeatable
+        assert_that(externalize(generate_statements(20, actors=2, verbs=3,
+                                                    activities=4)),
+                    is_(externalize(statements)))
+
+        statement = generate_statements(1, COMPLETE)[0]
+        assert_that(statement.result.score.max, is_(100))
+        assert_that(statement.context.contextActivities.parent, has_length(1))
+        assert_that(statement.object.definition.type,
+                    is_('http://adlnet.gov/expapi/activities/lesson'))
+
+        assert_that(calling(generate_statements).with_args(1, 'unknown'),
+                    raises(ValueError))
+
+    def test_run(self):
+        report = run_benchmarks(label='test', statements=10, shape=COMPLETE,
+                                repeat=2, batch_size=4, page_size=3, documents=2,
+                                attachment_size=100, requests=2)
+        assert_that(report, has_entries('label', 'test',
+                                        'parameters', has_entries('statements', 10)))
+        assert_that(list(report['benchmarks']), is_(list(Benchmarks.names)))
+        for result in report['benchmarks'].values():
+            assert_that(result['runs'], has_length(2))
+            assert_that(result, has_entries('best', min(result['runs'])))
+        benchmarks = report['benchmarks']
+        assert_that(benchmarks['iter_statements'], has_entries('items', 10))
+        assert_that(benchmarks['about_new_session'], has_entries('items', 2,
+                                                                  'unit', 'requests'))
+        memory = benchmarks['read_statement_result']['memory']
+        for name in ('read_statement_result_compact', 'read_statement_result_interned'):
+            if memory is None:  # pragma: no cover
+                assert_that(benchmarks[name]['memory'], is_(none()))
+            else:
+                assert_that(benchmarks[name]['memory'], less_than(memory))
+        assert_that(benchmarks['save_documents'], has_entries('items', 2,
+                                                               'unit', 'documents'))
+        assert_that(benchmarks['hash_files_serial'], has_entries('items', 2,
+                                                                  'bytes', 200))
+        assert_that(benchmarks['send_statements_attachments']['bytes'],
+                    greater_than(benchmarks['send_statements']['bytes'] + 1000))
+        json.dumps(report)
+
+        assert_that(calling(Benchmarks(statements=1).run).with_args(['unknown']),
+                    raises(ValueError))
+
+    def test_main(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'results.json')
+            main(['-n', '5', '-r', '1', '--only', 'externalize',
+                  '--only', 'iter_statements_stream', '--only', 'send_statements',
+                  '--codec', 'json', '--compression', 'gzip', '-o', path])
+            with open(path) as fp:
+                report = json.load(fp, object_pairs_hook=OrderedDict)
+            assert_that(list(report['benchmarks']),
+                        contains_exactly('externalize', 'iter_statements_stream',
+                                         'send_statements'))
+            assert_that(report, has_key('python'))
+            assert_that(report['parameters'], has_entries('codec', 'json',
+                                                          'compression', 'gzip'))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        stdout = sys.stdout
+        sys.stdout = six.StringIO()
+        try:
+            report = main(['-n', '2', '-r', '1', '--only', 'to_external_object'])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert_that(json.loads(output), is_(report))
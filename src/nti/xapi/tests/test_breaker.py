@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_entries
+
+from nti.testing.matchers import verifiably_provides
+
+import unittest
+
+import fudge
+
+from requests.exceptions import ConnectionError  # pylint: disable=redefined-builtin
+
+from nti.xapi.breaker import OPEN
+from nti.xapi.breaker import CLOSED
+from nti.xapi.breaker import HALF_OPEN
+from nti.xapi.breaker import CircuitBreaker
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.emitter import StatementEmitter
+
+from nti.xapi.interfaces import ISpillBuffer
+from nti.xapi.interfaces import ICircuitBreaker
+from nti.xapi.interfaces import CircuitOpenException
+
+from nti.xapi.spill import MemorySpillBuffer
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_multipart import _statement
+
+from nti.xapi.tests.test_retry import FlakyLRS
+
+
+class Clock(object):
+
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def _response(self, status):
+        return fudge.Fake().has_attr(status_code=status)
+
+    def _breaker(self, **kwargs):
+        self.clock = Clock()
+        self.changes = []
+        kwargs.setdefault('failure_threshold', 2)
+        kwargs.setdefault('reset_timeout', 10)
+        return CircuitBreaker(clock=self.clock,
+                              on_change=lambda *args: self.changes.append(args),
+                              **kwargs)
+
+    def _fail(self):
+        raise ConnectionError()
+
+    def test_breaker(self):
+        probes = []
+        breaker = self._breaker(probe=lambda: probes.pop(0))
+        assert_that(breaker, verifiably_provides(ICircuitBreaker))
+        ok = self._response(200)
+        assert_that(breaker.call(lambda: ok), is_(ok))
+        breaker.call(lambda: self._response(503))
+        assert_that(breaker.state, is_(CLOSED))
+        # another kind of response resets the count
+        breaker.call(lambda: self._response(404))
+        breaker.call(lambda: self._response(500))
+        assert_that(calling(breaker.call).with_args(self._fail),
+                    raises(ConnectionError))
+        assert_that(breaker.state, is_(OPEN))
+
+        # fails fast
+        func = fudge.Fake().is_callable().times_called(0)
+        assert_that(calling(breaker.call).with_args(func),
+                    raises(CircuitOpenException))
+        assert_that(breaker.metrics(),
+                    is_({'state': OPEN, 'failures': 2, 'opened': 1, 'rejected': 1}))
+
+        # probes once the timeout passes
+        self.clock.now += 10
+        assert_that(breaker.state, is_(HALF_OPEN))
+        probes.extend([False])
+        assert_that(calling(breaker.call).with_args(func),
+                    raises(CircuitOpenException))
+        assert_that(breaker.state, is_(OPEN))
+        self.clock.now += 10
+        probes.extend([True])
+        assert_that(breaker.call(lambda: ok), is_(ok))
+        assert_that(breaker.state, is_(CLOSED))
+        assert_that(self.changes, is_([(CLOSED, OPEN), (OPEN, HALF_OPEN),
+                                       (HALF_OPEN, OPEN), (OPEN, HALF_OPEN),
+                                       (HALF_OPEN, CLOSED)]))
+        assert_that(breaker.opened, is_(2))
+
+        # a probe raising is a failure
+        breaker.call(lambda: self._response(500))
+        breaker.call(lambda: self._response(500))
+        self.clock.now += 10
+        breaker.probe = self._fail
+        assert_that(calling(breaker.call).with_args(func),
+                    raises(CircuitOpenException))
+        assert_that(breaker.state, is_(OPEN))
+
+    def test_trials(self):
+        breaker = self._breaker(failure_threshold=1)
+        breaker.call(lambda: self._response(500))
+        self.clock.now += 10
+        # without a probe, the call is the trial
+        breaker.call(lambda: self._response(500))
+        assert_that(breaker.state, is_(OPEN))
+        self.clock.now += 10
+        breaker.call(lambda: self._response(200))
+        assert_that(breaker.state, is_(CLOSED))
+        assert_that(breaker._trial(), is_(True))
+
+        # calls made while probing fail fast
+        breaker.call(lambda: self._response(500))
+        self.clock.now += 10
+        breaker._probe_lock.acquire()
+        try:
+            assert_that(calling(breaker.call).with_args(lambda: None),
+                        raises(CircuitOpenException))
+        finally:
+            breaker._probe_lock.release()
+
+    def test_spill_buffer(self):
+        spill = MemorySpillBuffer(maxlen=3)
+        assert_that(spill, verifiably_provides(ISpillBuffer))
+        spill.put([1, 2])
+        spill.put([3, 4])
+        assert_that(spill, has_length(3))
+        assert_that(spill.dropped, is_(1))
+        assert_that(spill.drain(), is_([2, 3, 4]))
+        assert_that(spill, has_length(0))
+
+
+class TestClientBreaker(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def statement(self):
+        statement, _ = _statement(b'data')
+        statement.attachments = None
+        return statement
+
+    def test_client(self):
+        with FlakyLRS() as lrs:
+            clock = Clock()
+            breaker = CircuitBreaker(failure_threshold=2, reset_timeout=5,
+                                     clock=clock)
+            client = LRSClient(lrs.endpoint, circuit_breaker=breaker)
+            assert_that(breaker.probe, is_(client.about))
+
+            lrs.failures = 100
+            assert_that(client.about(), is_(none()))
+            assert_that(client.retrieve_statement('x'), is_(none()))
+            assert_that(breaker.state, is_(OPEN))
+            assert_that(calling(client.about), raises(CircuitOpenException))
+            assert_that(calling(client.save_statements).with_args([self.statement()]),
+                        raises(CircuitOpenException))
+            assert_that(lrs.methods, has_length(2))
+
+            # the probe goes through while half-open
+            clock.now += 5
+            assert_that(calling(client.about), raises(CircuitOpenException))
+            assert_that(lrs.methods, has_length(3))
+            clock.now += 5
+            lrs.failures = 0
+            assert_that(client.about(), is_not(none()))
+            assert_that(breaker.state, is_(CLOSED))
+            # the probe and the call
+            assert_that(lrs.methods, has_length(5))
+
+            # the emitter spills batches while the breaker is open
+            spill = MemorySpillBuffer()
+            emitter = StatementEmitter(client, max_linger=60, spill=spill)
+            lrs.failures = 2
+            client.about()
+            client.about()
+            emitter.emit(self.statement())
+            assert_that(emitter.flush(5), is_(True))
+            assert_that(spill, has_length(1))
+            assert_that(emitter.spilled, is_(1))
+
+            # or drops them without a spill buffer
+            failed = []
+            other = StatementEmitter(client, max_linger=60, on_error=failed.extend)
+            other.emit(self.statement())
+            assert_that(other.flush(5), is_(True))
+            assert_that(failed, has_length(1))
+            assert_that(lrs.statements, has_length(0))
+
+            clock.now += 5
+            emitter.emit(spill.drain()[0])
+            emitter.close(5)
+            other.close(5)
+            assert_that(lrs.statements, has_length(1))
+            assert_that(breaker.metrics(), has_entries('state', CLOSED, 'opened', 3))
+            client.close()
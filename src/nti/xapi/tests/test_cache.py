@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_length
+from hamcrest import assert_that
+
+from nti.testing.matchers import verifiably_provides
+
+import unittest
+
+from nti.xapi.cache import LRUCache
+from nti.xapi.cache import DocumentCache
+from nti.xapi.cache import StatementCache
+from nti.xapi.cache import CachedDocument
+
+from nti.xapi.interfaces import IDocumentCache
+from nti.xapi.interfaces import IStatementCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert_that(cache.get('a'), is_(1))
+        cache.set('c', 3)
+        # b was the least recently used
+        assert_that('b' in cache, is_(False))
+        assert_that(cache.get('b'), is_(none()))
+        assert_that(cache.get('b', 0), is_(0))
+        assert_that(cache.hits, is_(1))
+        assert_that(cache.misses, is_(2))
+
+        cache.set('a', 4)
+        cache.set('d', 5)
+        assert_that(cache.get('a'), is_(4))
+        assert_that(cache.get('c'), is_(none()))
+
+        assert_that(cache.pop('a'), is_(4))
+        assert_that(cache.pop('a', 0), is_(0))
+        assert_that(cache, has_length(1))
+
+        for key in 'xy':
+            cache.set(key, key)
+        assert_that(cache.discard(lambda key: key == 'x'), is_(1))
+        assert_that(cache, has_length(1))
+        cache.clear()
+        assert_that(cache, has_length(0))
+
+    def test_documents(self):
+        cache = DocumentCache(maxsize=10, max_bytes=10)
+        assert_that(cache, verifiably_provides(IDocumentCache))
+        cache.set('a', CachedDocument(b'12345', {}))
+        cache.set('b', CachedDocument(b'1234', {}))
+        assert_that(cache.weight, is_(9))
+        cache.set('c', CachedDocument(b'12', {}))
+        assert_that('a' in cache, is_(False))
+        assert_that(cache.weight, is_(6))
+
+        cache.set('b', CachedDocument(None, {}))
+        assert_that(cache.weight, is_(2))
+        cache.pop('c')
+        assert_that(cache.weight, is_(0))
+
+        # too large to be kept at all
+        cache.set('d', CachedDocument(b'x' * 11, {}))
+        assert_that('d' in cache, is_(False))
+        assert_that(cache.weight, is_(0))
+
+        cache.set('e', CachedDocument(b'x', {}))
+        cache.clear()
+        assert_that(cache.weight, is_(0))
+
+        cache = DocumentCache(maxsize=1, max_bytes=None)
+        cache.set('a', CachedDocument(b'x' * 100, {}))
+        cache.set('b', CachedDocument(b'x' * 100, {}))
+        assert_that(cache, has_length(1))
+
+    def test_ttl(self):
+        cache = StatementCache(maxsize=10)
+        assert_that(cache, verifiably_provides(IStatementCache))
+        cache.set('a', 1)
+        assert_that(cache.get('a'), is_(1))
+
+        cache = StatementCache(maxsize=10, ttl=0)
+        cache.set('a', 1)
+        assert_that(cache.get('a'), is_(none()))
+        assert_that('a' in cache, is_(False))
+        assert_that(cache.misses, is_(1))
+
+        cache = DocumentCache(max_bytes=None)
+        cache.ttl = 0
+        cache.set('a', CachedDocument(b'x', {}))
+        assert_that(cache.get('a'), is_(none()))
+        assert_that(cache.weight, is_(0))
@@ -13,21 +13,32 @@ from hamcrest import calling
 from hamcrest import is_
 from hamcrest import none
 from hamcrest import is_not
+from hamcrest import has_entry
 from hamcrest import assert_that
+from hamcrest import has_property
+from hamcrest import same_instance
 from hamcrest import raises
+from hamcrest import has_length
 
+import time
 import codecs
 import unittest
 from datetime import datetime, timedelta
 
 import fudge
 
+import simplejson as json
+
 from requests.structures import CaseInsensitiveDict
 
 from nti.xapi.client import LRSClient
 from nti.xapi.client import _parse_date as parse_date
 from nti.xapi.client import UTC
 
+from nti.xapi.cache import DocumentCache
+from nti.xapi.cache import CachedDocument
+from nti.xapi.cache import StatementCache
+
 from nti.xapi.activity import Activity
 
 from nti.xapi.documents.document import StateDocument
@@ -39,14 +50,20 @@ from nti.xapi.entities import Agent
 from nti.xapi.tests import SharedConfiguringTestLayer
 
 from nti.xapi.statement import Statement
+from nti.xapi.statement import StatementRef
 
 from nti.xapi.attachment import Attachment
 
+from nti.xapi.testing import LocalLRS
+from nti.xapi.testing import DOCUMENT_RESOURCES
+
+from nti.externalization import to_external_object
 from nti.externalization import update_from_external_object
 
 from io import StringIO
 
 from requests import HTTPError
+from requests import Timeout
 
 from nti.xapi.interfaces import MissingAttachmentDataException
 
@@ -78,6 +95,26 @@ class TestClient(unittest.TestCase):
         assert_that(client.endpoint, is_('a/'))
         assert_that(client.auth, is_(('test', 'pwd')))
 
+    def test_pooled_session(self):
+        client = LRSClient('a', pool_connections=2, pool_maxsize=20,
+                           max_retries=3)
+        session = client.session()
+        assert_that(client.session(), same_instance(session))
+        adapter = session.get_adapter('https://lrs.io')
+        assert_that(adapter, has_property('_pool_connections', 2))
+        assert_that(adapter, has_property('_pool_maxsize', 20))
+        assert_that(adapter.max_retries, has_property('total', 3))
+        assert_that(session.headers,
+                    has_entry('X-Experience-API-Version', client.version))
+
+        client.close()
+        assert_that(client.session(), is_not(same_instance(session)))
+        client.close()
+        client.close()
+
+        client = LRSClient('a', keep_alive=False)
+        assert_that(client.session().headers, has_entry('Connection', 'close'))
+
     @fudge.patch('requests.Session.get',
                  'nti.xapi.client.update_from_external_object')
     def test_get_about(self, mock_ss, mock_in):
@@ -243,7 +280,7 @@ class TestClient(unittest.TestCase):
             data = fp.read()
 
         # success
-        data = fudge.Fake().has_attr(text=data).has_attr(ok=True)
+        data = fudge.Fake().has_attr(text=data).has_attr(ok=True).has_attr(headers={})
         mock_ss.is_callable().returns(data)
 
         query = {'verb': 1, 'agent': 1, 'ascending': False}
@@ -263,7 +300,7 @@ class TestClient(unittest.TestCase):
             data = fp.read()
 
         # success
-        data = fudge.Fake().has_attr(text=data).has_attr(ok=True)
+        data = fudge.Fake().has_attr(text=data).has_attr(ok=True).has_attr(headers={})
         mock_ss.is_callable().returns(data)
 
         client = self.get_client()
@@ -276,6 +313,24 @@ class TestClient(unittest.TestCase):
         result = client.more_statements("more/1234")
         assert_that(result, is_(none()))
 
+    @fudge.patch('requests.Session.get',)
+    def test_fast_decode(self, mock_ss):
+        with codecs.open(self.statement_result_file, "r", "UTF-8") as fp:
+            data = fp.read()
+        mock_ss.is_callable().returns(fudge.Fake().has_attr(text=data, ok=True, headers={}))
+
+        client = self.get_client()
+        client.fast_decode = True
+        result = client.more_statements("more/1234")
+        expected = self.get_client().read_statement_result(data)
+        assert_that(to_external_object(result),
+                    is_(to_external_object(expected)))
+
+        with codecs.open(self.statement_file, "r", "UTF-8") as fp:
+            data = fp.read()
+        assert_that(to_external_object(client.read_statement(data)),
+                    is_(to_external_object(self.get_client().read_statement(data))))
+
     # states
 
     @fudge.patch('requests.Session.get',
@@ -590,3 +645,345 @@ class TestClient(unittest.TestCase):
         mock_ss.is_callable().returns(response)
         result = client.delete_agent_profile(doc)
         assert_that(result, is_(False))
+
+
+class TestPooledTransport(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    statement_file = TestClient.statement_file
+
+    def test_connection_reuse(self):
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint)
+            for _ in range(10):
+                assert_that(client.about(), is_not(none()))
+            stmt = Statement()
+            with codecs.open(self.statement_file, "r", "UTF-8") as fp:
+                update_from_external_object(stmt, json.load(fp))
+            stmt.id = None
+            stmt = client.save_statement(stmt)
+            assert_that(client.retrieve_statement(stmt.id), is_not(none()))
+            client.close()
+            assert_that(lrs.connections, is_(1))
+
+            client = LRSClient(lrs.endpoint, keep_alive=False)
+            for _ in range(3):
+                client.about()
+            assert_that(lrs.connections, is_(4))
+
+    def test_iter_statements(self):
+        with LocalLRS(page_size=10) as lrs:
+            client = LRSClient(lrs.endpoint)
+            for i in range(25):
+                stmt = Statement()
+                with codecs.open(self.statement_file, "r", "UTF-8") as fp:
+                    update_from_external_object(stmt, json.load(fp))
+                stmt.id = '7ccd3322-e1a5-411a-a67d-6a735c76f%03d' % i
+                client.save_statement(stmt)
+
+            ids = [s.id for s in client.iter_statements({})]
+            assert_that(ids, is_(list(lrs.statements)))
+
+            ids = [s.id for s in client.iter_statements({}, prefetch=False)]
+            assert_that(ids, is_(list(lrs.statements)))
+
+            ids = [s.id for s in client.iter_statements({'limit': 4},
+                                                        max_statements=10)]
+            assert_that(ids, is_(list(lrs.statements)[:10]))
+
+            requests = lrs.requests
+            ids = [s.id for s in client.iter_statements({}, max_statements=0)]
+            assert_that(ids, is_([]))
+            assert_that(lrs.requests, is_(requests + 1))
+
+            # no page is fetched past the one reaching max_statements
+            for prefetch in (True, False):
+                requests = lrs.requests
+                ids = [s.id for s in client.iter_statements({'limit': 2},
+                                                            max_statements=4,
+                                                            prefetch=prefetch)]
+                assert_that(ids, is_(list(lrs.statements)[:4]))
+                assert_that(lrs.requests, is_(requests + 2))
+
+            lrs.statements.clear()
+            assert_that(list(client.iter_statements({})), is_([]))
+            client.close()
+
+        with fudge.patch('requests.Session.get') as mock_get:
+            mock_get.is_callable().returns(fudge.Fake().has_attr(ok=False, status_code=500))
+            assert_that(list(client.iter_statements({})), is_([]))
+
+        with fudge.patch('nti.xapi.client.LRSClient.query_statements',
+                         'nti.xapi.client.LRSClient.more_statements') as (mock_query, mock_more):
+            mock_query.is_callable().returns(fudge.Fake().has_attr(statements=None,
+                                                                   more='more/1'))
+            mock_more.is_callable().raises(ValueError())
+            assert_that(calling(list).with_args(client.iter_statements({})),
+                        raises(ValueError))
+
+    def test_streamed_statements(self):
+        with LocalLRS(page_size=10) as lrs:
+            client = LRSClient(lrs.endpoint)
+            for i in range(25):
+                stmt = Statement()
+                with codecs.open(self.statement_file, "r", "UTF-8") as fp:
+                    update_from_external_object(stmt, json.load(fp))
+                stmt.id = '7ccd3322-e1a5-411a-a67d-6a735c76f%03d' % i
+                client.save_statement(stmt)
+
+            ids = [s.id for s in client.iter_statements({}, stream=True)]
+            assert_that(ids, is_(list(lrs.statements)))
+            ids = [s.id for s in client.iter_statements({}, stream=True,
+                                                        max_statements=10)]
+            assert_that(ids, is_(list(lrs.statements)[:10]))
+            ids = [s.id for s in client.iter_statements({}, stream=True,
+                                                        max_statements=12)]
+            assert_that(ids, is_(list(lrs.statements)[:12]))
+
+            seen = []
+            result = client.query_statements({}, callback=seen.append)
+            assert_that(result.statements, has_length(0))
+            assert_that(seen, has_length(10))
+            result = client.more_statements(result, callback=seen.append)
+            assert_that(seen, has_length(20))
+            assert_that(result.more, is_not(none()))
+
+            response = client.session().get(lrs.endpoint + 'statements',
+                                             stream=True)
+            result = client.read_statement_result_stream(response)
+            assert_that(result.statements, has_length(10))
+            client.close()
+
+        with fudge.patch('requests.Session.get') as mock_get:
+            response = fudge.Fake().has_attr(ok=False, status_code=500).provides('close')
+            mock_get.is_callable().returns(response)
+            assert_that(list(client.iter_statements({}, stream=True)), is_([]))
+
+    def test_document_cache(self):
+        with LocalLRS() as lrs:
+            cache = DocumentCache()
+            client = LRSClient(lrs.endpoint, document_cache=cache)
+            activity = Activity(id='http://example.com/activities/a')
+            agent = Agent(mbox='mailto:a@example.com')
+            named = Agent(mbox='mailto:a@example.com', name='A')
+
+            def stored(content):
+                # change a stored document without changing its etag,
+                # showing whether the client read it again
+                for document in lrs.documents.values():
+                    document['content'] = content
+
+            state = StateDocument(id='s1', content=b'one',
+                                  activity=activity, agent=agent)
+            assert_that(client.save_state(state), is_not(none()))
+            assert_that(client.retrieve_state(activity, agent, 's1').content,
+                        is_(b'one'))
+            assert_that(cache, has_length(1))
+            stored(b'changed')
+            doc = client.retrieve_state(activity, named, 's1')
+            assert_that(doc.content, is_(b'one'))
+            assert_that(doc.etag, is_not(none()))
+            assert_that(doc.content_type, is_('application/octet-stream'))
+            assert_that(doc.timestamp, is_not(none()))
+            assert_that(doc.agent, is_(same_instance(named)))
+            assert_that(cache.hits, is_(1))
+
+            # writes drop the cached copies
+            state.content = b'two'
+            client.save_state(state)
+            assert_that(cache, has_length(0))
+            assert_that(client.retrieve_state(activity, agent, 's1').content,
+                        is_(b'two'))
+            client.retrieve_state(activity, agent, 's1', registration='r1')
+            assert_that(cache, has_length(1))
+            client.clear_state(activity, agent, registration='r2')
+            assert_that(cache, has_length(1))
+            client.clear_state(activity, agent)
+            assert_that(cache, has_length(0))
+            client.save_state(state)
+            client.delete_state(client.retrieve_state(activity, agent, 's1'))
+            assert_that(cache, has_length(0))
+            assert_that(client.retrieve_state(activity, agent, 's1'), is_(none()))
+
+            profile = ActivityProfileDocument(id='p1', content=b'one',
+                                              activity=activity)
+            client.save_activity_profile(profile)
+            client.retrieve_activity_profile(activity, 'p1')
+            stored(b'changed')
+            assert_that(client.retrieve_activity_profile(activity, 'p1').content,
+                        is_(b'one'))
+            client.delete_activity_profile(profile)
+            assert_that(cache, has_length(0))
+            client.save_activity_profile(profile)
+            client.retrieve_activity_profile(activity, 'p1')
+            client.save_activity_profile(profile)
+            assert_that(cache, has_length(0))
+
+            profile = AgentProfileDocument(id='p1', content=b'one', agent=agent)
+            client.save_agent_profile(profile)
+            client.retrieve_agent_profile(agent, 'p1')
+            lrs.documents.clear()
+            client.save_agent_profile(profile)
+            client.retrieve_agent_profile(agent, 'p1')
+            stored(b'changed')
+            assert_that(client.retrieve_agent_profile(agent, 'p1').content,
+                        is_(b'one'))
+            client.delete_agent_profile(profile)
+            assert_that(cache, has_length(0))
+            client.close()
+
+        # documents without validators are not kept
+        headers = CaseInsensitiveDict({'content-type': 'text/plain'})
+        response = fudge.Fake().has_attr(content=b'b', ok=True, status_code=200,
+                                         headers=headers)
+        with fudge.patch('requests.Session.get') as mock_get:
+            mock_get.is_callable().returns(response)
+            cache.set(client._document_key('agents/profile', agent=agent,
+                                           document_id='p1'),
+                      CachedDocument(b'old', {'etag': '"old"'}))
+            doc = client.retrieve_agent_profile(agent, 'p1')
+            assert_that(doc.content, is_(b'b'))
+            assert_that(cache, has_length(0))
+
+    def _statement(self, statement_id=None):
+        stmt = Statement()
+        with codecs.open(self.statement_file, "r", "UTF-8") as fp:
+            update_from_external_object(stmt, json.load(fp))
+        stmt.id = statement_id
+        return stmt
+
+    def test_statement_cache(self):
+        with LocalLRS(page_size=10) as lrs:
+            cache = StatementCache()
+            client = LRSClient(lrs.endpoint, statement_cache=cache)
+            other = LRSClient(lrs.endpoint, statement_cache=cache)
+
+            saved = client.save_statement(self._statement())
+            requests = lrs.requests
+            assert_that(other.retrieve_statement(saved.id),
+                        is_(same_instance(saved)))
+            assert_that(lrs.requests, is_(requests))
+            client.save_statements([self._statement() for _ in range(3)])
+            client.save_statement(self._statement(
+                '7ccd3322-e1a5-411a-a67d-6a735c76f000'))
+            assert_that(cache, has_length(5))
+
+            # retrieved statements are kept
+            cache.clear()
+            requests = lrs.requests
+            statement = client.retrieve_statement(saved.id)
+            assert_that(client.retrieve_statement(saved.id),
+                        is_(same_instance(statement)))
+            voided = client.retrieve_voided_statement(saved.id)
+            assert_that(voided, is_not(same_instance(statement)))
+            assert_that(client.retrieve_voided_statement(saved.id),
+                        is_(same_instance(voided)))
+            assert_that(lrs.requests, is_(requests + 2))
+            assert_that(cache.hits, is_(3))
+
+            # saving a voiding statement drops its target
+            voiding = self._statement()
+            voiding.verb.id = 'http://adlnet.gov/expapi/verbs/voided'
+            voiding.object = StatementRef(id=saved.id)
+            client.save_statement(voiding)
+            assert_that((lrs.endpoint, False, saved.id) in cache, is_(False))
+            assert_that((lrs.endpoint, True, saved.id) in cache, is_(True))
+
+            # query pages
+            for _ in range(25):
+                client.save_statement(self._statement())
+            cache.clear()
+            list(client.iter_statements({'format': 'ids'}))
+            list(client.iter_statements({'format': 'ids'}, stream=True))
+            client.query_statements({'format': 'canonical'})
+            assert_that(cache, has_length(0))
+            # LocalLRS also returns the voided statement, which the
+            # voiding statement drops
+            list(client.iter_statements({}))
+            assert_that(cache, has_length(len(lrs.statements) - 1))
+            cache.clear()
+            list(client.iter_statements({}, stream=True))
+            assert_that(cache, has_length(len(lrs.statements) - 1))
+            cache.clear()
+            seen = []
+            client.query_statements({'limit': 3}, callback=seen.append)
+            assert_that(seen, has_length(3))
+            assert_that(cache, has_length(3))
+
+            # not found statements are not kept
+            assert_that(client.retrieve_statement('missing'), is_(none()))
+            assert_that(client.retrieve_voided_statement('missing'), is_(none()))
+            assert_that(cache, has_length(3))
+            client.close()
+            other.close()
+
+    def test_bulk_documents(self):
+        class SlowLRS(LocalLRS):
+            delay = 0
+
+            def get_document(self, resource, params, *args):
+                name = DOCUMENT_RESOURCES[resource][0]
+                time.sleep(1 if params.get(name) == 'slow' else self.delay)
+                return LocalLRS.get_document(self, resource, params, *args)
+
+        with SlowLRS() as lrs:
+            client = LRSClient(lrs.endpoint)
+            activity = Activity(id='http://example.com/activities/a')
+            agent = Agent(mbox='mailto:a@example.com')
+            for i in range(3):
+                client.save_state(StateDocument(id='s%s' % i, content=b'%d' % i,
+                                                activity=activity, agent=agent))
+                client.save_activity_profile(
+                    ActivityProfileDocument(id='p%s' % i, content=b'%d' % i,
+                                            activity=activity))
+                client.save_agent_profile(
+                    AgentProfileDocument(id='p%s' % i, content=b'%d' % i,
+                                         agent=agent))
+
+            # roughly one round trip rather than one per state
+            lrs.delay = 0.2
+            requests = [(activity, agent, 's%s' % i) for i in range(6)]
+            start = time.time()
+            results = client.retrieve_states(requests)
+            elapsed = time.time() - start
+            assert_that(elapsed < 0.2 * len(requests) / 2, is_(True))
+            assert_that(list(results), is_(requests))
+            assert_that([r.value.content for r in list(results.values())[:3]],
+                        is_([b'0', b'1', b'2']))
+            assert_that(results[requests[3]], is_((None, None)))
+
+            # errors are reported by item
+            lrs.delay = 0
+            requests = [(activity, agent, 's0', None),
+                        (activity, agent, 'slow'),
+                        (activity,)]
+            results = client.retrieve_states(requests, timeout=0.2)
+            assert_that(results[requests[0]].value.content, is_(b'0'))
+            assert_that(results[requests[1]].error, is_(Timeout))
+            assert_that(results[requests[2]].error, is_(TypeError))
+
+            results = client.retrieve_activity_profiles(activity, ['p0', 'p1', 'p9'])
+            assert_that(dict((k, r.value and r.value.content)
+                             for k, r in results.items()),
+                        is_({'p0': b'0', 'p1': b'1', 'p9': None}))
+            results = client.retrieve_agent_profiles(agent, ['p2', 'p1'],
+                                                     max_workers=1)
+            assert_that(list(results), is_(['p2', 'p1']))
+            assert_that(results['p2'].value.agent, is_(same_instance(agent)))
+            client.close()
+
+    def test_session_connections(self):
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint)
+            url = client.endpoint + 'about'
+            # a session per call opens a connection per call
+            for _ in range(5):
+                with client.new_session() as session:
+                    session.get(url).raise_for_status()
+            assert_that(lrs.connections, is_(5))
+            # the pooled one a single one
+            for _ in range(5):
+                client._request('GET', url).raise_for_status()
+            client.close()
+            assert_that(lrs.connections, is_(6))
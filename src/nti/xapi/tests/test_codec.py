@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import is_in
+from hamcrest import is_not
+from hamcrest import calling
+from hamcrest import raises
+from hamcrest import has_item
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import same_instance
+
+from nti.testing.matchers import verifiably_provides
+
+import os
+import codecs
+import unittest
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+import fudge
+
+import simplejson as json
+
+from nti.externalization import update_from_external_object
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.codec import AUTO
+from nti.xapi.codec import get_codec
+from nti.xapi.codec import SimpleJSONCodec
+from nti.xapi.codec import available_codecs
+
+from nti.xapi.externalization import externalize
+
+from nti.xapi.interfaces import IJSONCodec
+
+from nti.xapi.statement import Statement
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+
+class TestCodecs(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    statement_file = os.path.join(os.path.dirname(__file__),
+                                  "data", "statement.json")
+
+    def statements(self, count):
+        result = []
+        for i in range(count):
+            with codecs.open(self.statement_file, "r", "UTF-8") as fp:
+                data = json.load(fp)
+            data['result']['response'] = u'r\xe9ponse %s' % i
+            statement = Statement()
+            update_from_external_object(statement, data)
+            result.append(statement)
+        return result
+
+    def test_codecs(self):
+        payload = externalize(self.statements(3))
+        values = {
+            'datetime': datetime(2016, 1, 1, 12, 30),
+            'date': date(2016, 1, 1),
+            'duration': timedelta(minutes=20, seconds=34),
+        }
+        for name in available_codecs():
+            codec = get_codec(name)
+            assert_that(codec, verifiably_provides(IJSONCodec))
+            assert_that(codec.name, is_(name))
+
+            data = codec.dumps(payload)
+            assert_that(data, is_(instance_of(bytes)))
+            assert_that(u'r\xe9ponse'.encode('utf-8') in data, is_(True))
+            assert_that(codec.loads(data), is_(payload))
+            assert_that(codec.loads(data.decode('utf-8')), is_(payload))
+
+            assert_that(codec.loads(codec.dumps(values)),
+                        is_({'datetime': '2016-01-01T12:30:00Z',
+                             'date': '2016-01-01',
+                             'duration': 'PT20M34S'}))
+            assert_that(calling(codec.dumps).with_args(object()),
+                        raises(TypeError))
+
+    def test_get_codec(self):
+        assert_that(get_codec(), is_(instance_of(SimpleJSONCodec)))
+        codec = get_codec('json')
+        assert_that(get_codec(codec), is_(same_instance(codec)))
+        assert_that(get_codec(AUTO).name, is_(available_codecs()[0]))
+        assert_that(available_codecs(), has_item('json'))
+        assert_that(calling(get_codec).with_args('xml'),
+                    raises(ValueError))
+
+        # optional codecs that are not installed
+        for name in ('orjson', 'ujson'):
+            with fudge.patch('nti.xapi.codec.' + name) as module:
+                module.is_a_stub()
+                assert_that(name, is_in(available_codecs()))
+            patched = fudge.patch_object('nti.xapi.codec', name, None)
+            try:
+                assert_that(name, is_not(is_in(available_codecs())))
+                assert_that(calling(get_codec).with_args(name),
+                            raises(ValueError))
+            finally:
+                patched.restore()
+
+    def test_client(self):
+        with LocalLRS() as lrs:
+            for name in available_codecs():
+                client = LRSClient(lrs.endpoint, codec=name)
+                assert_that(client.codec.name, is_(name))
+                statements = self.statements(3)
+                for statement in statements:
+                    statement.id = None
+                assert_that(client.save_statements(statements),
+                            is_not(None))
+                ids = [s.id for s in client.iter_statements({}, stream=True)]
+                assert_that(ids, has_item(statements[0].id))
+                client.close()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import starts_with
+from hamcrest import contains_exactly
+
+from nti.testing.matchers import verifiably_provides
+
+from zope.schema.interfaces import RequiredMissing
+
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+import simplejson as json
+
+from nti.externalization import to_external_object
+
+from nti.xapi.benchmark import COMPLETE
+from nti.xapi.benchmark import generate_statements
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.compact import CompactAgent
+from nti.xapi.compact import CompactVerb
+from nti.xapi.compact import CompactActivity
+from nti.xapi.compact import CompactStatement
+from nti.xapi.compact import CompactExtensions
+from nti.xapi.compact import CompactLanguageMap
+from nti.xapi.compact import CompactSubStatement
+from nti.xapi.compact import CompactIdentifiedGroup
+from nti.xapi.compact import CompactStatementResult
+
+from nti.xapi.externalization import externalize
+from nti.xapi.externalization import internalize
+
+from nti.xapi.interfaces import IVerb
+from nti.xapi.interfaces import IAgent
+from nti.xapi.interfaces import IStatement
+from nti.xapi.interfaces import IExtensions
+from nti.xapi.interfaces import ILanguageMap
+
+from nti.xapi.statement import Statement
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_externalization import _copy
+from nti.xapi.tests.test_externalization import _ModelDataMixin
+
+
+class TestCompact(_ModelDataMixin, unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def test_conformance(self):
+        for data in (self.data, self.complete_data):
+            statement = internalize(_copy(data), CompactStatement)
+            assert_that(statement, verifiably_provides(IStatement))
+            assert_that(hasattr(statement, '__dict__'), is_(False))
+            standard = internalize(_copy(data), Statement)
+            assert_that(externalize(statement), is_(externalize(standard)))
+            assert_that(to_external_object(statement),
+                        is_(to_external_object(standard)))
+
+        statement = internalize(self.complete_data, CompactStatement)
+        assert_that(statement.actor.member[1], instance_of(CompactAgent))
+        assert_that(statement.object, instance_of(CompactSubStatement))
+        assert_that(statement.object.object, instance_of(CompactActivity))
+        assert_that(statement.context.team, instance_of(CompactIdentifiedGroup))
+        assert_that(statement.context.contextActivities.parent[0].definition.extensions,
+                    instance_of(CompactExtensions))
+        assert_that(statement.verb.display, instance_of(CompactLanguageMap))
+
+        result = internalize({'statements': [self.data], 'more': '/more'},
+                             CompactStatementResult)
+        assert_that(list(result), contains_exactly(instance_of(CompactStatement)))
+        assert_that(result.more, is_('/more'))
+
+    def test_errors(self):
+        data = self.data
+        data['id'] = 'not-a-uuid'
+        assert_that(calling(internalize).with_args(data, CompactStatement),
+                    raises(Exception))
+        data = self.data
+        data['verb']['display'] = {'en-US': 1}
+        assert_that(calling(internalize).with_args(data, CompactStatement),
+                    raises(Exception))
+
+    def test_fallback(self):
+        # input the fast path leaves to the standard internalization
+        data = self.data
+        del data['actor']
+        assert_that(calling(internalize).with_args(_copy(data), Statement),
+                    raises(RequiredMissing))
+        assert_that(calling(internalize).with_args(data, CompactStatement),
+                    raises(RequiredMissing))
+
+        data = self.complete_data
+        data['actor']['Class'] = 'Group'
+        statement = internalize(_copy(data), CompactStatement)
+        assert_that(statement, instance_of(CompactStatement))
+        assert_that(hasattr(statement, '__dict__'), is_(False))
+        assert_that(statement.actor.member[1], instance_of(CompactAgent))
+        assert_that(statement.verb.display, instance_of(CompactLanguageMap))
+        assert_that(statement.context.contextActivities.parent[0].definition.extensions,
+                    instance_of(CompactExtensions))
+        standard = internalize(_copy(data), Statement)
+        assert_that(externalize(statement), is_(externalize(standard)))
+
+        result = internalize({'statements': [_copy(data)], 'more': '/more'},
+                             CompactStatementResult)
+        assert_that(result, instance_of(CompactStatementResult))
+        assert_that(list(result), contains_exactly(instance_of(CompactStatement)))
+        assert_that(result.more, is_('/more'))
+
+    def test_objects(self):
+        verb = CompactVerb(id=u'http://adlnet.gov/expapi/verbs/attempted',
+                           display=CompactLanguageMap({u'en-US': u'attempted'}))
+        assert_that(verb, verifiably_provides(IVerb))
+        assert_that(repr(verb), starts_with('CompactVerb(display=CompactLanguageMap('))
+        agent = CompactAgent(name=u'A')
+        assert_that(agent, verifiably_provides(IAgent))
+        assert_that(agent.mbox, is_(none()))
+        assert_that(calling(CompactAgent).with_args(extra=1), raises(AttributeError))
+        assert_that(externalize(agent), is_({'name': u'A', 'objectType': 'Agent'}))
+
+    def test_mappings(self):
+        names = CompactLanguageMap(en=u'one', fr=u'un')
+        assert_that(names, verifiably_provides(ILanguageMap))
+        assert_that(names, has_length(2))
+        names[u'en'] = u'One'
+        names[u'de'] = u'eins'
+        assert_that(sorted(names.items()),
+                    is_([(u'de', u'eins'), (u'en', u'One'), (u'fr', u'un')]))
+        del names[u'fr']
+        assert_that(dict(names), is_({u'de': u'eins', u'en': u'One'}))
+        assert_that(calling(names.__getitem__).with_args(u'fr'), raises(KeyError))
+        assert_that(calling(names.__delitem__).with_args(u'fr'), raises(KeyError))
+        assert_that(calling(names.__setitem__).with_args(u'fr', 1), raises(TypeError))
+        assert_that(names.get(u'fr'), is_(none()))
+
+        extensions = CompactExtensions({u'http://example.com/a': [1]})
+        assert_that(extensions, verifiably_provides(IExtensions))
+        assert_that(calling(extensions.__setitem__).with_args(u'not a uri', 1),
+                    raises(Exception))
+
+    def test_client(self):
+        with LocalLRS(page_size=2) as lrs:
+            client = LRSClient(lrs.endpoint)
+            client.save_statements(generate_statements(3, COMPLETE))
+            client = LRSClient(lrs.endpoint, compact=True)
+            result = client.query_statements({})
+            assert_that(result, instance_of(CompactStatementResult))
+            assert_that(result.statements, has_length(2))
+            for stream in (False, True):
+                statements = list(client.iter_statements({}, stream=stream))
+                assert_that(statements, has_length(3))
+                for statement in statements:
+                    assert_that(statement, instance_of(CompactStatement))
+            statement = client.retrieve_statement(statements[0].id)
+            assert_that(statement, instance_of(CompactStatement))
+            client.close()
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc not available')
+    def test_memory(self):
+        # as read from an LRS, with no objects shared between statements
+        data = [json.dumps(externalize(s))
+                for s in generate_statements(2000, COMPLETE)]
+
+        def size(factory):
+            tracemalloc.start()
+            try:
+                statements = [internalize(json.loads(d), factory) for d in data]
+                return tracemalloc.get_traced_memory()[0] / len(statements)
+            finally:
+                tracemalloc.stop()
+
+        assert_that(size(CompactStatement) < size(Statement) * 0.8, is_(True))
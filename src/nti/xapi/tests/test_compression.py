@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_entries
+from hamcrest import instance_of
+from hamcrest import same_instance
+
+from nti.testing.matchers import verifiably_provides
+
+import zlib
+import gzip
+import unittest
+from io import BytesIO
+
+from nti.xapi.activity import Activity
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.compression import GZIP
+from nti.xapi.compression import DEFLATE
+from nti.xapi.compression import GzipCompressor
+from nti.xapi.compression import get_compressor
+from nti.xapi.compression import DeflateCompressor
+from nti.xapi.compression import RequestCompression
+
+from nti.xapi.documents.document import StateDocument
+
+from nti.xapi.entities import Agent
+
+from nti.xapi.interfaces import IRequestCompressor
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_multipart import _statement
+
+from nti.xapi.tests.test_retry import FlakyLRS
+
+
+def _statements(count):
+    result = []
+    for _ in range(count):
+        statement, _ = _statement(b'data')
+        statement.attachments = None
+        result.append(statement)
+    return result
+
+
+class TestCompression(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    data = b'{"verb": {"id": "http://adlnet.gov/expapi/verbs/attempted"}}' * 50
+
+    def test_compressors(self):
+        compressor = get_compressor()
+        assert_that(compressor, is_(instance_of(GzipCompressor)))
+        assert_that(compressor, verifiably_provides(IRequestCompressor))
+        compressed = compressor.compress(self.data)
+        assert_that(gzip.GzipFile(fileobj=BytesIO(compressed)).read(),
+                    is_(self.data))
+
+        compressor = get_compressor(DEFLATE, level=1)
+        assert_that(compressor, is_(instance_of(DeflateCompressor)))
+        assert_that(compressor, verifiably_provides(IRequestCompressor))
+        assert_that(zlib.decompress(compressor.compress(self.data)),
+                    is_(self.data))
+
+        assert_that(get_compressor(compressor), is_(same_instance(compressor)))
+        assert_that(calling(get_compressor).with_args('br'), raises(ValueError))
+
+    def test_threshold(self):
+        compression = RequestCompression(threshold=100)
+        assert_that(compression.ratio, is_(none()))
+        assert_that(compression.compress(b'small'), is_(none()))
+        assert_that(compression.compress(BytesIO(self.data)), is_(none()))
+        assert_that(compression.compress(self.data.decode('ascii')),
+                    is_not(none()))
+        assert_that(compression.ratio > 10, is_(True))
+        assert_that(compression.metrics(),
+                    has_entries('compressed', 1,
+                                'bytes_in', len(self.data),
+                                'supported', none()))
+        compression.supported = False
+        assert_that(compression.compress(self.data), is_(none()))
+
+    def test_client(self):
+        for encoding in (GZIP, DEFLATE):
+            with LocalLRS() as lrs:
+                client = LRSClient(lrs.endpoint, compression=encoding)
+                compression = client.compression
+                assert_that(compression.compressor.encoding, is_(encoding))
+                statements = _statements(100)
+                assert_that(client.save_statements(statements), is_(statements))
+                assert_that(lrs.statements, has_length(100))
+                assert_that(compression.supported, is_(True))
+                assert_that(lrs.bytes_received, is_(compression.bytes_out))
+                assert_that(compression.ratio > 10, is_(True))
+
+                # documents too
+                activity = Activity(id='http://example.com/activities/a')
+                agent = Agent(mbox='mailto:a@example.com')
+                state = StateDocument(id='s1', content=self.data,
+                                      activity=activity, agent=agent)
+                client.save_state(state)
+                assert_that(compression.compressed, is_(2))
+                assert_that(client.retrieve_state(activity, agent, 's1').content,
+                            is_(self.data))
+
+                # but not statements with attachments
+                statement, sha2 = _statement(self.data)
+                client.save_statement(statement, {sha2: self.data})
+                assert_that(compression.compressed, is_(2))
+                assert_that(lrs.attachments[sha2], is_(self.data))
+                client.close()
+
+    def test_fallback(self):
+        with LocalLRS(content_encodings=()) as lrs:
+            compression = RequestCompression(threshold=0)
+            client = LRSClient(lrs.endpoint, compression=compression)
+            statements = _statements(2)
+            assert_that(client.save_statements(statements), is_(statements))
+            assert_that(compression.supported, is_(False))
+            assert_that(compression.fallbacks, is_(1))
+            client.save_statements(_statements(2))
+            assert_that(compression.compressed, is_(1))
+            assert_that(lrs.statements, has_length(4))
+            client.close()
+
+    def test_probe(self):
+        with FlakyLRS() as lrs:
+            compression = RequestCompression(threshold=0)
+            client = LRSClient(lrs.endpoint, compression=compression)
+
+            # a bad request either way says nothing about compression
+            lrs.failures, lrs.status = 2, 400
+            assert_that(client.save_statements(_statements(1)), is_(none()))
+            assert_that(compression.supported, is_(none()))
+            lrs.failures = 1
+            assert_that(client.save_statements(_statements(1)), is_not(none()))
+            assert_that(compression.supported, is_(False))
+            assert_that(lrs.methods, has_length(4))
+            client.close()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import same_instance
+
+import time
+import unittest
+
+from requests import Timeout
+
+from nti.xapi.activity import Activity
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.deadline import Deadline
+from nti.xapi.deadline import deadline
+from nti.xapi.deadline import current_deadline
+
+from nti.xapi.entities import Agent
+
+from nti.xapi.interfaces import LRSTimeoutException
+from nti.xapi.interfaces import DeadlineExceededException
+
+from nti.xapi.retry import RetryPolicy
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_multipart import _statement
+
+from nti.xapi.tests.test_retry import FlakyLRS
+
+
+class Clock(object):
+
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowLRS(LocalLRS):
+
+    delay = 0
+
+    def handle(self, *args):
+        time.sleep(self.delay)
+        return LocalLRS.handle(self, *args)
+
+
+class TestDeadline(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def test_deadline(self):
+        clock = Clock()
+        unbounded = Deadline(clock=clock)
+        assert_that(unbounded.remaining(), is_(none()))
+        assert_that(unbounded.expired, is_(False))
+        assert_that(unbounded.cap((1, None)), is_((1, None)))
+
+        bounded = Deadline(10, clock=clock)
+        assert_that(bounded.remaining(), is_(10))
+        assert_that(bounded.cap(None), is_(10))
+        assert_that(bounded.cap(3), is_(3))
+        assert_that(bounded.cap((3, 30)), is_((3, 10)))
+        assert_that(bounded.cap((3, None)), is_((3, 10)))
+        clock.now += 20
+        assert_that(bounded.remaining(), is_(0))
+        assert_that(bounded.expired, is_(True))
+        assert_that(calling(bounded.check), raises(DeadlineExceededException))
+        assert_that(calling(bounded.cap).with_args(1),
+                    raises(DeadlineExceededException))
+
+        # the earlier deadline applies
+        outer = Deadline(5, timeout=2, clock=clock)
+        nested = Deadline(10, clock=clock).within(outer)
+        assert_that(nested.expires, is_(outer.expires))
+        assert_that(nested.timeout, is_(2))
+        nested = Deadline(timeout=1, clock=clock).within(unbounded)
+        assert_that(nested.expires, is_(none()))
+        assert_that(nested.timeout, is_(1))
+
+    def test_scope(self):
+        assert_that(current_deadline(), is_(none()))
+        with deadline(60, timeout=5) as outer:
+            assert_that(current_deadline(), is_(same_instance(outer)))
+            with deadline(120) as inner:
+                assert_that(inner.expires, is_(outer.expires))
+                assert_that(inner.timeout, is_(5))
+            given = Deadline(1)
+            with deadline(given) as inner:
+                assert_that(inner.expires, is_(given.expires))
+            assert_that(current_deadline(), is_(same_instance(outer)))
+        assert_that(current_deadline(), is_(none()))
+
+    def test_timeouts(self):
+        with SlowLRS() as lrs:
+            client = LRSClient(lrs.endpoint, timeout=(5, 0.1))
+            assert_that(client._timeout(), is_((5, 0.1)))
+            assert_that(client._timeout(1), is_(1))
+            with deadline(timeout=2):
+                assert_that(client._timeout(), is_(2))
+            lrs.delay = 0.5
+            assert_that(calling(client.about), raises(LRSTimeoutException))
+
+            # per call
+            client.timeout = None
+            with deadline(timeout=0.1):
+                assert_that(calling(client.about), raises(Timeout))
+            with deadline(0.1):
+                assert_that(calling(client.about), raises(LRSTimeoutException))
+            lrs.delay = 0
+            assert_that(client.about(), is_(instance_of(object)))
+
+            # nothing is sent past the deadline
+            requests = lrs.requests
+            with deadline(0):
+                assert_that(calling(client.save_statements).with_args([_statement(b'x')[0]]),
+                            raises(DeadlineExceededException))
+                activity = Activity(id='http://example.com/activities/a')
+                agent = Agent(mbox='mailto:a@example.com')
+                results = client.retrieve_states([(activity, agent, 's1'),
+                                                  (activity, agent, 's2')])
+                for result in results.values():
+                    assert_that(result.error, is_(instance_of(DeadlineExceededException)))
+            assert_that(lrs.requests, is_(requests))
+            client.close()
+
+    def test_retries(self):
+        with FlakyLRS() as lrs:
+            policy = RetryPolicy(backoff=10, jitter=False, budget=False)
+            client = LRSClient(lrs.endpoint, retry_policy=policy)
+            lrs.failures, lrs.retry_after = 1, ''
+            start = time.time()
+            with deadline(5):
+                assert_that(client.about(), is_(none()))
+            assert_that(time.time() - start < 5, is_(True))
+            assert_that(policy.exhausted, is_(1))
+            client.close()
+
+            # the deadline passing while waiting to retry
+            clock = Clock()
+
+            def sleep(delay):
+                clock.now += delay + 20
+            policy = RetryPolicy(backoff=0, budget=False, sleep=sleep)
+            client = LRSClient(lrs.endpoint, retry_policy=policy)
+            lrs.failures = 1
+            with deadline(Deadline(10, clock=clock)):
+                assert_that(calling(client.about),
+                            raises(DeadlineExceededException))
+            assert_that(policy.retries, is_(1))
+            client.close()
+
+    def test_iteration(self):
+        with LocalLRS(page_size=1) as lrs:
+            client = LRSClient(lrs.endpoint)
+            statements = [_statement(b'x')[0] for _ in range(3)]
+            for statement in statements:
+                statement.attachments = None
+            client.save_statements(statements)
+
+            for stream in (False, True):
+                clock = Clock()
+                budget = Deadline(10, clock=clock)
+                found = client.iter_statements({}, prefetch=False, stream=stream,
+                                               deadline=budget)
+                next(found)
+                clock.now += 20
+                assert_that(calling(next).with_args(found),
+                            raises(DeadlineExceededException))
+
+            with deadline(60):
+                found = client.iter_statements({}, deadline=30)
+            assert_that(list(found), has_length(3))
+            client.close()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import calling
+from hamcrest import raises
+from hamcrest import has_length
+from hamcrest import assert_that
+
+from nti.testing.matchers import verifiably_provides
+
+import os
+import time
+import codecs
+import unittest
+import threading
+
+import fudge
+
+import simplejson as json
+
+from nti.externalization import update_from_external_object
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.emitter import StatementEmitter
+
+from nti.xapi.interfaces import IStatementEmitter
+from nti.xapi.interfaces import CircuitOpenException
+
+from nti.xapi.statement import Statement
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+
+class TestStatementEmitter(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def statement(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "data", "statement.json")
+        with codecs.open(path, "r", "UTF-8") as fp:
+            stmt = Statement()
+            update_from_external_object(stmt, json.load(fp))
+        stmt.id = None
+        return stmt
+
+    def test_batches(self):
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint)
+            emitter = StatementEmitter(client, max_count=10, max_linger=60)
+            assert_that(emitter, verifiably_provides(IStatementEmitter))
+            statements = [self.statement() for _ in range(25)]
+
+            def work(chunk):
+                for stmt in chunk:
+                    emitter.emit(stmt)
+            threads = [threading.Thread(target=work, args=(statements[i::5],))
+                       for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert_that(emitter.flush(5), is_(True))
+            assert_that(lrs.statements, has_length(25))
+            assert_that(emitter.batches, is_(3))
+            assert_that(emitter.sent, is_(25))
+            for stmt in statements:
+                assert_that(stmt.id, is_not(none()))
+            assert_that(lrs.statements[statements[0].id], is_not(none()))
+
+            emitter.close()
+            emitter.close()
+            assert_that(calling(emitter.emit).with_args(self.statement()),
+                        raises(ValueError))
+            client.close()
+
+    def test_linger_and_size(self):
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint)
+            emitter = StatementEmitter(client, max_linger=0.01)
+            stmt = self.statement()
+            emitter.emit(stmt)
+            for _ in range(500):
+                if stmt.id:
+                    break
+                time.sleep(0.01)
+            assert_that(stmt.id, is_not(none()))
+            emitter.close()
+
+            size = len(emitter._encode(stmt)) + 1
+            emitter = StatementEmitter(client, max_bytes=size * 2,
+                                       max_linger=60)
+            statements = [self.statement() for _ in range(5)]
+            for stmt in statements:
+                emitter.emit(stmt)
+            emitter.close()
+            assert_that(emitter.batches, is_(3))
+            assert_that(lrs.statements, has_length(6))
+            # the measured JSON is what was sent
+            assert_that(lrs.statements[statements[4].id], is_not(none()))
+            # flushing a closed emitter returns at once
+            assert_that(emitter.flush(5), is_(True))
+            client.close()
+
+            # statements given ids by the client are encoded again
+            client = LRSClient(lrs.endpoint, statement_ids='random')
+            emitter = StatementEmitter(client, max_bytes=size * 2,
+                                       max_linger=60)
+            stmt = self.statement()
+            emitter.emit(stmt)
+            emitter.close()
+            assert_that(lrs.statements[stmt.id], is_not(none()))
+            client.close()
+
+    def test_failures(self):
+        failed = []
+        client = fudge.Fake().provides('save_statements').returns(None)
+        emitter = StatementEmitter(client, on_error=failed.extend, max_bytes=10000)
+        try:
+            emitter.emit(self.statement())
+            emitter.flush()
+            assert_that(failed, has_length(1))
+            assert_that(emitter.failed, is_(1))
+        finally:
+            emitter.close()
+
+        client = fudge.Fake().provides('save_statements').raises(ValueError())
+        emitter = StatementEmitter(client)
+        emitter.emit(self.statement())
+        emitter.close()
+        assert_that(emitter.failed, is_(1))
+
+        # a batch the spill buffer refuses is dropped
+        failed = []
+        client = fudge.Fake().provides('save_statements').raises(CircuitOpenException())
+        spill = fudge.Fake().provides('put').returns(False)
+        emitter = StatementEmitter(client, spill=spill, on_error=failed.extend)
+        emitter.emit(self.statement())
+        emitter.close()
+        assert_that(emitter.spilled, is_(0))
+        assert_that(emitter.failed, is_(1))
+        assert_that(failed, has_length(1))
+
+    def test_worker_errors(self):
+        # errors while encoding, spilling or reporting a batch don't
+        # stop the worker
+        client = fudge.Fake().provides('save_statements').raises(CircuitOpenException())
+        spill = fudge.Fake().provides('put').raises(IOError('disk full'))
+        on_error = fudge.Fake().is_callable().raises(ValueError())
+        emitter = StatementEmitter(client, spill=spill, on_error=on_error,
+                                   max_bytes=10000)
+        try:
+            emitter.emit(object())
+            emitter.emit(self.statement())
+            assert_that(emitter.flush(5), is_(True))
+            assert_that(emitter.failed, is_(2))
+            assert_that(emitter.spilled, is_(0))
+
+            emitter.emit(self.statement())
+            assert_that(emitter.flush(5), is_(True))
+            assert_that(emitter.failed, is_(3))
+        finally:
+            emitter.close()
+        assert_that(calling(emitter.emit).with_args(self.statement()),
+                    raises(ValueError))
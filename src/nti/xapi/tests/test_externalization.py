@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import has_key
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import same_instance
+
+import os
+import re
+import codecs
+import unittest
+from datetime import datetime
+from datetime import timedelta
+
+import fudge
+
+import simplejson as json
+
+from zope import interface
+
+from nti.externalization import to_external_object
+from nti.externalization import update_from_external_object
+
+from nti.xapi.about import About
+
+from nti.xapi.language_map import LanguageMap
+
+from nti.xapi.externalization import _PLANS
+from nti.xapi.externalization import _UPDATERS
+from nti.xapi.externalization import externalize
+from nti.xapi.externalization import internalize
+
+from nti.xapi.statement import Statement
+from nti.xapi.statement import StatementResult
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+
+class IMarker(interface.Interface):
+    pass
+
+
+class _ModelDataMixin(object):
+
+    statement_file = os.path.join(os.path.dirname(__file__),
+                                  "data", "statement.json")
+
+    @property
+    def data(self):
+        with codecs.open(self.statement_file, "r", "UTF-8") as fp:
+            return json.load(fp)
+
+    @property
+    def complete_data(self):
+        data = self.data
+        activity = {
+            "id": "http://example.com/activities/a",
+            "definition": {
+                "type": "http://adlnet.gov/expapi/activities/cmi.interaction",
+                "moreInfo": "http://example.com/activities/a/info",
+                "correctResponsesPattern": ["golf[,]tetris"],
+                "extensions": {"http://example.com/ext": {"deep": [1, 2]}},
+            }
+        }
+        agent = {"account": {"homePage": "http://example.com",
+                             "name": "learner"}}
+        data.update({
+            "actor": {"objectType": "Group",
+                      "name": "Team",
+                      "member": [{"mbox": "mailto:a@example.com"}, agent]},
+            "authority": {"objectType": "Agent",
+                          "mbox_sha1sum": "ebd31e95054c018b10727ccffd2ef2ec3a016ee9"},
+            "stored": "2015-12-18T12:18:00+00:00",
+            "object": {
+                "objectType": "SubStatement",
+                "actor": agent,
+                "verb": {"id": "http://adlnet.gov/expapi/verbs/reviewed"},
+                "object": activity,
+            },
+            "context": {
+                "registration": "ec531277-b57b-4c15-8d91-d292c5b2b8f7",
+                "instructor": {"openid": "http://example.com/instructor"},
+                "team": {"objectType": "Group",
+                         "mbox": "mailto:team@example.com"},
+                "contextActivities": {"parent": [activity],
+                                      "grouping": [{"id": "http://example.com/g"}]},
+                "revision": "r1",
+                "platform": "nti",
+                "language": "en-US",
+                "statement": {"objectType": "StatementRef",
+                              "id": "e05aa883-acaf-40ad-bf54-02c8ce485fb0"},
+                "extensions": {"http://example.com/ctx": None},
+            },
+        })
+        data["result"].update({"response": u"réponse",
+                               "extensions": {"http://example.com/r": 1}})
+        return data
+
+    def _statement(self, data):
+        statement = Statement()
+        # updating consumes the external data
+        update_from_external_object(statement, json.loads(json.dumps(data)))
+        return statement
+
+
+class TestExternalize(_ModelDataMixin, unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def test_conformance(self):
+        for data in (self.data, self.complete_data):
+            statement = self._statement(data)
+            expected = to_external_object(statement)
+            assert_that(externalize(statement), is_(expected))
+            assert_that(json.dumps(externalize(statement), sort_keys=True),
+                        is_(json.dumps(expected, sort_keys=True)))
+
+        statements = [self._statement(self.data) for _ in range(3)]
+        statements[1].timestamp = datetime(2016, 1, 1, 12)
+        statements[1].result.duration = timedelta(0)
+        statements[2].result = None
+        assert_that(externalize(statements),
+                    is_(to_external_object(statements)))
+        assert_that(externalize(tuple(statements)),
+                    is_(to_external_object(statements)))
+
+        about = About()
+        update_from_external_object(about, {"version": ["1.0.3", "1.0.0"]})
+        assert_that(externalize(about), is_(to_external_object(about)))
+
+    def test_plans_cached(self):
+        statement = self._statement(self.complete_data)
+        externalize(statement)
+        plan = _PLANS[Statement]
+        externalize(statement)
+        assert_that(_PLANS[Statement], is_(same_instance(plan)))
+
+    def test_fallback(self):
+        statement = self._statement(self.data)
+        interface.alsoProvides(statement, IMarker)
+        interface.alsoProvides(statement.verb.display, IMarker)
+        assert_that(externalize(statement),
+                    is_(to_external_object(statement)))
+        assert_that(externalize(statement),
+                    is_(instance_of(type(to_external_object(statement)))))
+        assert_that(externalize(statement.verb.display),
+                    is_(to_external_object(statement.verb.display)))
+
+        # values outside the model, including subclasses of the
+        # handled types
+        class Timestamp(datetime):
+            pass
+        value = {'a': Timestamp(2016, 1, 1)}
+        assert_that(externalize(value), is_(to_external_object(value)))
+        assert_that(externalize(Timestamp(2016, 1, 1)),
+                    is_('2016-01-01T00:00:00Z'))
+
+        class Duration(timedelta):
+            pass
+        assert_that(externalize(Duration(seconds=60)), is_('PT1M'))
+
+
+def _copy(data):
+    return json.loads(json.dumps(data))
+
+
+class TestInternalize(_ModelDataMixin, unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    @property
+    def result_data(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "data", "statement_result.json")
+        with codecs.open(path, "r", "UTF-8") as fp:
+            return json.load(fp)
+
+    def _standard(self, data, factory=Statement):
+        obj = factory()
+        update_from_external_object(obj, _copy(data))
+        return obj
+
+    def _assert_same(self, fast, standard):
+        assert_that(type(fast), is_(same_instance(type(standard))))
+        assert_that(to_external_object(fast),
+                    is_(to_external_object(standard)))
+
+    @fudge.patch('nti.xapi.externalization.update_from_external_object')
+    def test_conformance(self, mock_update):
+        # the standard path must not be needed
+        mock_update.is_callable().raises(AssertionError('fallback'))
+        for data in (self.data, self.complete_data):
+            fast = internalize(_copy(data), Statement)
+            standard = self._standard(data)
+            self._assert_same(fast, standard)
+            for name in ('actor', 'object', 'context', 'result', 'verb',
+                         'timestamp', 'stored', 'authority', 'attachments'):
+                assert_that(type(getattr(fast, name)),
+                            is_(same_instance(type(getattr(standard, name)))))
+            assert_that(fast.timestamp, is_(standard.timestamp))
+            assert_that(fast.result.duration, is_(standard.result.duration))
+
+        data = self.complete_data
+        assert_that(type(internalize(_copy(data), Statement).object.object),
+                    is_(same_instance(type(self._standard(data).object.object))))
+
+        # integers given for booleans
+        data = self.data
+        data['result'].update({'success': 1, 'completion': -3})
+        fast = internalize(_copy(data), Statement)
+        self._assert_same(fast, self._standard(data))
+        assert_that(fast.result.success, is_(same_instance(True)))
+        assert_that(fast.result.completion, is_(same_instance(True)))
+        data['result']['success'] = 0
+        assert_that(internalize(_copy(data), Statement).result.success,
+                    is_(same_instance(False)))
+
+        data = self.result_data
+        fast = internalize(_copy(data), StatementResult)
+        self._assert_same(fast, self._standard(data, StatementResult))
+        assert_that(_UPDATERS, has_key(Statement))
+
+        # external data is left untouched
+        data = self.complete_data
+        internalize(data, Statement)
+        assert_that(data, is_(self.complete_data))
+
+    def test_empty_duration(self):
+        data = self.data
+        data['result']['duration'] = ''
+        data['object'] = {'objectType': 'StatementRef',
+                          'id': 'e05aa883-acaf-40ad-bf54-02c8ce485fb0'}
+        self._assert_same(internalize(_copy(data), Statement),
+                          self._standard(data))
+
+    def test_standard_fallback(self):
+        # standard external fields and values with a type are left to
+        # the standard path
+        data = self.data
+        data['ID'] = 'id'
+        self._assert_same(internalize(_copy(data), Statement),
+                          self._standard(data))
+        data = self.data
+        data['result']['extensions'] = {
+            'http://example.com/a': {'MimeType': 'application/unknown'},
+        }
+        self._assert_same(internalize(_copy(data), Statement),
+                          self._standard(data))
+        data = self.data
+        data['unknown'] = [1, {'Class': 'Unknown'}]
+        self._assert_same(internalize(_copy(data), Statement),
+                          self._standard(data))
+
+        def marked():
+            statement = Statement()
+            interface.alsoProvides(statement, IMarker)
+            return statement
+        self._assert_same(internalize(self.data, marked),
+                          self._standard(self.data, marked))
+
+        def marked_map():
+            display = LanguageMap()
+            interface.alsoProvides(display, IMarker)
+            return display
+        self._assert_same(internalize({'en-US': 'attempted'}, marked_map),
+                          self._standard({'en-US': 'attempted'}, marked_map))
+
+        class Thing(object):
+            pass
+        assert_that(internalize({'a': 1}, Thing), is_(instance_of(Thing)))
+
+        data, standard = self.data, Statement()
+        data['result']['duration'] = timedelta(minutes=1)
+        fast = internalize(dict(data, result=dict(data['result'])), Statement)
+        update_from_external_object(standard, data)
+        self._assert_same(fast, standard)
+
+    def _error(self, func, *args):
+        try:
+            func(*args)
+        except Exception as e:  # pylint: disable=broad-except
+            # ignore the addresses in object reprs
+            return type(e), re.sub(' at 0x[0-9a-f]+', '', str(e))
+        raise AssertionError('No error')  # pragma: no cover
+
+    def test_errors(self):
+        invalid = []
+        data = self.data
+        del data['verb']
+        invalid.append(data)
+        data = self.data
+        data['id'] = 'not-a-uuid'
+        invalid.append(data)
+        data = self.data
+        data['timestamp'] = 'yesterday'
+        invalid.append(data)
+        data = self.data
+        data['verb'] = 'http://adlnet.gov/expapi/verbs/attempted'
+        invalid.append(data)
+        data = self.data
+        data['object']['objectType'] = 'Unknown'
+        invalid.append(data)
+        data = self.data
+        data['attachments'] = data['attachments'][0]
+        invalid.append(data)
+        data = self.data
+        data['attachments'].append('attachment')
+        invalid.append(data)
+        data = self.data
+        data['result']['extensions'] = {'not a uri': 1}
+        invalid.append(data)
+        data = self.data
+        data['result']['duration'] = 'soon'
+        invalid.append(data)
+        data = self.data
+        data['verb']['display'] = {'en-US': 1}
+        invalid.append(data)
+        data = self.data
+        data['context'] = {'contextActivities': {'parent': [{}]}}
+        invalid.append(data)
+        data = self.data
+        data['object'] = {'objectType': 'SubStatement',
+                          'actor': data['actor'],
+                          'verb': data['verb'],
+                          'object': {'objectType': 'SubStatement'}}
+        invalid.append(data)
+        data = _copy(data)
+        data['object']['object'] = dict(data['object'],
+                                        object=self.data['object'])
+        invalid.append(data)
+
+        for data in invalid:
+            expected = self._error(self._standard, data)
+            assert_that(self._error(internalize, _copy(data), Statement),
+                        is_(expected))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_in
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import same_instance
+
+import time
+import unittest
+
+from nti.xapi import ids
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.ids import RANDOM
+from nti.xapi.ids import TIME_ORDERED
+from nti.xapi.ids import random_uuid
+from nti.xapi.ids import get_id_generator
+from nti.xapi.ids import time_ordered_uuid
+
+from nti.xapi.interfaces import _check_uuid
+
+from nti.xapi.retry import RetryPolicy
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_multipart import _statement
+
+from nti.xapi.tests.test_retry import FlakyLRS
+
+
+class TestIds(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def test_generators(self):
+        for generator in (random_uuid, time_ordered_uuid):
+            made = [generator() for _ in range(5000)]
+            assert_that(set(made), has_length(len(made)))
+            for value in made:
+                assert_that(_check_uuid(value), is_(True))
+
+        # time-ordered ids sort in the order they were made
+        made = [time_ordered_uuid() for _ in range(5000)]
+        assert_that(sorted(made), is_(made))
+        millis = int(made[-1][:8] + made[-1][9:13], 16)
+        assert_that(abs(millis - time.time() * 1000) < 60000, is_(True))
+
+    def test_sequence(self):
+        clock = ids._clock
+        millis = clock.millis = int(time.time() * 1000) + 1000
+        clock.sequence = 0xfff
+        first = time_ordered_uuid()
+        assert_that(clock.millis, is_(millis + 1))
+        assert_that(clock.sequence, is_(0))
+        assert_that(first < time_ordered_uuid(), is_(True))
+
+    def test_get_id_generator(self):
+        assert_that(get_id_generator(), is_(same_instance(random_uuid)))
+        assert_that(get_id_generator(RANDOM), is_(same_instance(random_uuid)))
+        assert_that(get_id_generator(TIME_ORDERED),
+                    is_(same_instance(time_ordered_uuid)))
+        assert_that(get_id_generator(str), is_(same_instance(str)))
+        assert_that(calling(get_id_generator).with_args('serial'),
+                    raises(ValueError))
+
+    def test_client(self):
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint, statement_ids=TIME_ORDERED)
+            statements = [_statement(b'data')[0] for _ in range(3)]
+            for statement in statements:
+                statement.attachments = None
+            statements[0].id = given = random_uuid()
+            assert_that(client.save_statements(statements), is_(statements))
+            assert_that(statements[0].id, is_(given))
+            assert_that(statements[2].id > statements[1].id, is_(True))
+            assert_that(list(lrs.statements), is_([s.id for s in statements]))
+
+            statement, sha2 = _statement(b'data')
+            assert_that(client.save_statement(statement, {sha2: b'data'}).id,
+                        is_in(lrs.statements))
+            client.close()
+
+            # the LRS assigns the ids otherwise
+            client = LRSClient(lrs.endpoint)
+            assert_that(client.id_generator, is_(none()))
+            statement.id = None
+            assert_that(client.save_statements([statement])[0].id,
+                        is_in(lrs.statements))
+            client.close()
+
+    def test_retries(self):
+        with FlakyLRS() as lrs:
+            policy = RetryPolicy(backoff=0, budget=False)
+            client = LRSClient(lrs.endpoint, retry_policy=policy,
+                               statement_ids=RANDOM)
+            statement, sha2 = _statement(b'data')
+            lrs.failures = 2
+            assert_that(client.save_statements([statement], {sha2: b'data'}),
+                        is_([statement]))
+            assert_that(lrs.methods, is_(['POST'] * 3))
+            assert_that(list(lrs.statements), is_([statement.id]))
+
+            # without ids, a POST is not sent again
+            client = LRSClient(lrs.endpoint, retry_policy=policy)
+            statement.id = None
+            lrs.failures = 1
+            assert_that(client.save_statements([statement]), is_(none()))
+            client.close()
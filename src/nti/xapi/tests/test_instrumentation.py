@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_entries
+from hamcrest import greater_than
+from hamcrest import contains_exactly
+
+from nti.testing.matchers import verifiably_provides
+
+import unittest
+
+from zope import component
+from zope import interface
+
+from nti.xapi.activity import Activity
+
+from nti.xapi.cache import DocumentCache
+from nti.xapi.cache import StatementCache
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.documents.document import StateDocument
+
+from nti.xapi.entities import Agent
+
+from nti.xapi.instrumentation import Histogram
+from nti.xapi.instrumentation import current_event
+from nti.xapi.instrumentation import HistogramCollector
+
+from nti.xapi.interfaces import ILRSCallEvent
+from nti.xapi.interfaces import ILRSCallObserver
+
+from nti.xapi.retry import RetryPolicy
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_multipart import _statement
+
+from nti.xapi.tests.test_retry import FlakyLRS
+
+
+@interface.implementer(ILRSCallObserver)
+class Recorder(object):
+
+    def __init__(self):
+        self.events = []
+
+    def notify(self, event):
+        assert_that(current_event(), is_(none()))
+        self.events.append(event)
+
+
+@interface.implementer(ILRSCallObserver)
+class Broken(object):
+
+    def notify(self, unused_event):
+        raise ValueError()
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def setUp(self):
+        self.recorder = Recorder()
+        self.collector = HistogramCollector()
+        self.broken = Broken()
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(self.recorder, ILRSCallObserver, name='recorder')
+        gsm.registerUtility(self.collector, ILRSCallObserver, name='collector')
+        gsm.registerUtility(self.broken, ILRSCallObserver, name='broken')
+
+    def tearDown(self):
+        gsm = component.getGlobalSiteManager()
+        for name in ('recorder', 'collector', 'broken'):
+            gsm.unregisterUtility(provided=ILRSCallObserver, name=name)
+
+    def _last(self):
+        return self.recorder.events[-1]
+
+    def test_histogram(self):
+        histogram = Histogram(smallest=0.001, largest=1.0, factor=1.1)
+        assert_that(histogram.percentile(50), is_(none()))
+        assert_that(histogram.mean, is_(none()))
+        for ms in range(1, 101):
+            histogram.record(ms / 1000.0)
+        assert_that(abs(histogram.percentile(50) - 0.05) <= 0.005, is_(True))
+        assert_that(abs(histogram.percentile(99) - 0.099) <= 0.01, is_(True))
+        assert_that(histogram.percentile(100), is_(0.1))
+        assert_that(abs(histogram.mean - 0.0505) < 1e-9, is_(True))
+        histogram.record(5.0)
+        assert_that(histogram.percentile(100), is_(5.0))
+
+    def test_events(self):
+        with FlakyLRS() as lrs:
+            client = LRSClient(lrs.endpoint,
+                               statement_cache=StatementCache(),
+                               document_cache=DocumentCache(),
+                               retry_policy=RetryPolicy(backoff=0, budget=False))
+            statements = [_statement(b'data')[0] for _ in range(3)]
+            for statement in statements:
+                statement.attachments = None
+            client.save_statements(statements)
+            event = self._last()
+            assert_that(event, verifiably_provides(ILRSCallEvent))
+            assert_that(event.operation, is_('save_statements'))
+            assert_that(event.endpoint, is_(lrs.endpoint))
+            assert_that(event.method, is_('POST'))
+            assert_that(event.path, is_('/xapi/statements'))
+            assert_that(event.status, is_(200))
+            assert_that(event.bytes_sent, is_(greater_than(100)))
+            assert_that(event.bytes_received, is_(greater_than(100)))
+            assert_that(event.serialization, is_(greater_than(0)))
+            assert_that(event.network, is_(greater_than(0)))
+            assert_that(event.parsing, is_(greater_than(0)))
+            assert_that(event.duration >= event.network, is_(True))
+            assert_that(event.cache, is_(none()))
+            assert_that(event.error, is_(none()))
+
+            # with attachments
+            statement, sha2 = _statement(b'data')
+            client.save_statement(statement, {sha2: b'data'})
+            assert_that(self._last().bytes_sent, is_(greater_than(4)))
+
+            # cached
+            client.retrieve_statement(statements[0].id)
+            assert_that(self._last().cache, is_('hit'))
+            assert_that(self._last().attempts, is_(0))
+            client.statement_cache.clear()
+            client.retrieve_statement(statements[0].id)
+            assert_that(self._last().cache, is_('miss'))
+
+            activity = Activity(id='http://example.com/activities/a')
+            agent = Agent(mbox='mailto:a@example.com')
+            client.save_state(StateDocument(id='s1', content=b'one',
+                                            activity=activity, agent=agent))
+            for cache in ('miss', 'hit'):
+                client.retrieve_state(activity, agent, 's1')
+                assert_that(self._last().cache, is_(cache))
+
+            # retried, and failed
+            lrs.failures = 1
+            client.about()
+            assert_that(self._last().retries, is_(1))
+            lrs.failures = 3
+            client.about()
+            assert_that(self._last().status, is_(503))
+            client.close()
+
+            # each page
+            del self.recorder.events[:]
+            client = LRSClient(lrs.endpoint)
+            lrs.page_size = 2
+            assert_that(list(client.iter_statements({})), has_length(4))
+            assert_that([e.operation for e in self.recorder.events],
+                        contains_exactly('query_statements', 'more_statements'))
+            # as are the pages of a streamed iteration
+            del self.recorder.events[:]
+            assert_that(list(client.iter_statements({}, stream=True)), has_length(4))
+            assert_that([e.operation for e in self.recorder.events],
+                        contains_exactly('query_statements', 'more_statements'))
+            assert_that([e.status for e in self.recorder.events], is_([200, 200]))
+            assert_that(self._last().path, is_('/xapi/statements'))
+            del self.recorder.events[:]
+            # calls made during a call are part of it
+            events = len(self.recorder.events)
+            client.query_statements({}, callback=lambda unused: client.about())
+            assert_that(self.recorder.events, has_length(events + 1))
+            assert_that(self._last().parsing, is_(greater_than(0)))
+            assert_that(self._last().attempts, is_(3))
+            client.close()
+
+        client = LRSClient('http://127.0.0.1:1/xapi/')
+        assert_that(calling(client.about), raises(Exception))
+        assert_that(self._last().error, is_not(none()))
+        assert_that(self._last().status, is_(none()))
+
+        summary = self.collector.summary()
+        assert_that(self.collector.operations(), contains_exactly(
+            'about', 'more_statements', 'query_statements', 'retrieve_state',
+            'retrieve_statement', 'save_state', 'save_statement', 'save_statements'))
+        assert_that(summary['about'], has_entries('calls', 3, 'errors', 2,
+                                                  'retries', 3))
+        assert_that(summary['retrieve_state'], has_entries('hits', 1, 'misses', 1))
+        assert_that(summary['save_statements']['p50'],
+                    is_(self.collector.percentile('save_statements', 50)))
+        assert_that(summary['save_statements']['p99'], is_not(none()))
+        assert_that(self.collector.percentile('delete_state', 50), is_(none()))
+        self.collector.reset()
+        assert_that(self.collector.summary(), is_({}))
+
+    def test_unobserved(self):
+        self.tearDown()
+        try:
+            with FlakyLRS() as lrs:
+                client = LRSClient(lrs.endpoint)
+                client.about()
+                client.close()
+            assert_that(self.recorder.events, has_length(0))
+        finally:
+            self.setUp()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import same_instance
+
+from nti.testing.matchers import verifiably_provides
+
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+import simplejson as json
+
+from nti.xapi.benchmark import COMPLETE
+from nti.xapi.benchmark import generate_statements
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.compact import CompactStatement
+
+from nti.xapi.externalization import externalize
+from nti.xapi.externalization import internalize
+
+from nti.xapi.interfaces import IInterner
+
+from nti.xapi.interning import Interner
+
+from nti.xapi.statement import Statement
+from nti.xapi.statement import StatementResult
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_externalization import _copy
+from nti.xapi.tests.test_externalization import _ModelDataMixin
+
+
+class TestInterner(unittest.TestCase):
+
+    def test_strings(self):
+        interner = Interner(max_strings=2)
+        assert_that(interner, verifiably_provides(IInterner))
+        first = u''.join([u'http://', u'example.com'])
+        second = u''.join([u'http://', u'example.com'])
+        assert_that(interner.string(first), is_(same_instance(first)))
+        assert_that(interner.string(second), is_(same_instance(first)))
+        interner.string(u'a')
+        # full, so forgotten
+        assert_that(interner.string(u'b'), is_(u'b'))
+        assert_that(interner._strings, has_length(1))
+
+    def test_objects(self):
+        interner = Interner(maxsize=1)
+        key = interner.key(Statement, {'id': 'a', 'b': [1]})
+        assert_that(key, is_(interner.key(Statement, {'b': [1], 'id': 'a'})))
+        assert_that(key, is_not(interner.key(Statement, {'id': 'a', 'b': [2]})))
+        assert_that(interner.key(Statement, {'id': object()}), is_(none()))
+        interner.set(key, 1)
+        assert_that(interner.get(key), is_(1))
+        assert_that(interner, has_length(1))
+        assert_that((interner.hits, interner.misses), is_((1, 0)))
+        interner.clear()
+        assert_that(interner.get(key), is_(none()))
+        assert_that(interner.maxsize, is_(1))
+
+
+class TestInterning(_ModelDataMixin, unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def test_internalize(self):
+        for factory in (Statement, CompactStatement):
+            interner = Interner()
+            data = self.complete_data
+            first = internalize(_copy(data), factory, interner)
+            second = internalize(_copy(data), factory, interner)
+            assert_that(externalize(first), is_(externalize(internalize(_copy(data),
+                                                                      factory))))
+            assert_that(second, is_not(same_instance(first)))
+            assert_that(second.verb, is_(same_instance(first.verb)))
+            assert_that(second.authority, is_(same_instance(first.authority)))
+            assert_that(second.context.instructor,
+                        is_(same_instance(first.context.instructor)))
+            activities = second.context.contextActivities
+            assert_that(activities.parent[0],
+                        is_(same_instance(first.context.contextActivities.parent[0])))
+            # the substatement and its group are not shared, its members are
+            assert_that(second.object, is_not(same_instance(first.object)))
+            assert_that(second.actor, is_not(same_instance(first.actor)))
+            assert_that(second.actor.member[1],
+                        is_(same_instance(first.actor.member[1])))
+            assert_that(second.object.object,
+                        is_(same_instance(first.object.object)))
+
+            # different content, different objects, the same IRIs
+            data['verb']['display'] = {'fr-FR': u'a tenté'}
+            third = internalize(_copy(data), factory, interner)
+            assert_that(third.verb, is_not(same_instance(first.verb)))
+            assert_that(third.verb.id, is_(same_instance(first.verb.id)))
+            attachment = first.attachments[0]
+            assert_that(third.attachments[0], is_not(same_instance(attachment)))
+            assert_that(third.attachments[0].usageType,
+                        is_(same_instance(attachment.usageType)))
+            assert_that(list(third.attachments[0].display)[0],
+                        is_(same_instance(list(attachment.display)[0])))
+
+    def test_client(self):
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint)
+            client.save_statements(generate_statements(20, actors=2, verbs=2,
+                                                       activities=2))
+            client = LRSClient(lrs.endpoint, interner=True)
+            result = client.query_statements({})
+            assert_that(result, instance_of(StatementResult))
+            verbs = set(id(s.verb) for s in result.statements)
+            assert_that(verbs, has_length(2))
+            statements = list(client.iter_statements({}, stream=True))
+            assert_that(set(id(s.verb) for s in statements), is_(verbs))
+            assert_that(statements[0], instance_of(Statement))
+
+            client = LRSClient(lrs.endpoint, compact=True, interner=Interner())
+            statements = list(client.iter_statements({}))
+            assert_that(set(id(s.actor) for s in statements), has_length(2))
+            assert_that(statements[0], instance_of(CompactStatement))
+            client.close()
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc not available')
+    def test_memory(self):
+        data = [json.dumps(externalize(s))
+                for s in generate_statements(2000, COMPLETE)]
+
+        def size(factory, interner=None):
+            tracemalloc.start()
+            try:
+                statements = [internalize(json.loads(d), factory, interner)
+                              for d in data]
+                return tracemalloc.get_traced_memory()[0] / len(statements)
+            finally:
+                tracemalloc.stop()
+
+        standard = size(Statement)
+        interned = size(Statement, Interner())
+        assert_that(interned < standard * 0.7, is_(True))
+        assert_that(size(CompactStatement, Interner()) < interned, is_(True))
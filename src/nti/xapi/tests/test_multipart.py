@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_in
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_entries
+from hamcrest import contains_inanyorder
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from io import BytesIO
+from io import StringIO
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+from requests import Request
+
+from nti.externalization import update_from_external_object
+
+from nti.xapi.attachment import Attachment
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.interfaces import AttachmentMismatchException
+
+from nti.xapi.multipart import MultipartEncoder
+from nti.xapi.multipart import get_boundary
+from nti.xapi.multipart import iter_multipart
+
+from nti.xapi.statement import Statement
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+
+def _statement(data):
+    sha2 = hashlib.sha256(data).hexdigest()
+    attachment = Attachment()
+    update_from_external_object(attachment, {
+        "usageType": "http://adlnet.gov/expapi/attachments/signature",
+        "display": {"en-US": "Signature"},
+        "contentType": "application/octet-stream",
+        "length": len(data),
+        "sha2": sha2,
+    })
+    statement = Statement()
+    update_from_external_object(statement, {
+        "actor": {"mbox": "mailto:a@example.com"},
+        "verb": {"id": "http://adlnet.gov/expapi/verbs/attempted"},
+        "object": {"id": "http://example.com/activities/a"},
+    })
+    statement.attachments = [attachment]
+    return statement, sha2
+
+
+class TestMultipartEncoder(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _file(self, data):
+        path = os.path.join(self.tmpdir, hashlib.sha256(data).hexdigest())
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return path
+
+    def test_encode(self):
+        path = self._file(b'file data')
+        with open(path, 'rb') as fp:
+            fp.read(5)
+            parts = [((('Content-Type', 'application/json'),), b'{}'),
+                     ((('Content-Type', 'text/plain'),
+                       ('X-Experience-API-Hash', 'abc')), BytesIO(b'stream')),
+                     ((('Content-Type', 'text/plain'),), fp),
+                     ((), u'caf\xe9')]
+            encoder = MultipartEncoder(parts, boundary='b', chunk_size=2)
+            expected = (b'--b\r\nContent-Type: application/json\r\n\r\n{}\r\n'
+                        b'--b\r\nContent-Type: text/plain\r\n'
+                        b'X-Experience-API-Hash: abc\r\n\r\nstream\r\n'
+                        b'--b\r\nContent-Type: text/plain\r\n\r\ndata\r\n'
+                        b'--b\r\n\r\ncaf\xc3\xa9\r\n'
+                        b'--b--\r\n')
+            assert_that(encoder.content_type, is_('multipart/mixed; boundary=b'))
+            assert_that(encoder.len, is_(len(expected)))
+            assert_that(b''.join(encoder), is_(expected))
+
+        parts[1][1].seek(0)
+        with open(path, 'rb') as fp:
+            fp.read(5)
+            parts[2] = (parts[2][0], fp)
+            encoder = MultipartEncoder(parts, boundary='b', chunk_size=2)
+            assert_that(encoder.read(3), is_(b'--b'))
+            assert_that(encoder.read(40), is_(expected[3:43]))
+            assert_that(encoder.read(), is_(expected[43:]))
+            assert_that(encoder.read(), is_(b''))
+
+    def test_unknown_length(self):
+        class Stream(object):
+            def __init__(self, data):
+                self.data = BytesIO(data)
+
+            def read(self, size):
+                return self.data.read(size)
+
+        class Positioned(Stream):
+            def tell(self):
+                return self.data.tell()
+
+        for body in (StringIO(u'text'), Stream(b'text'), Positioned(b'text')):
+            encoder = MultipartEncoder([((), body)], boundary='b')
+            assert_that(encoder.len, is_(none()))
+            assert_that(b''.join(encoder), is_(b'--b\r\n\r\ntext\r\n--b--\r\n'))
+
+        path = self._file(b'text')
+        with open(path, 'r') as fp:
+            assert_that(MultipartEncoder([((), fp)]).len, is_(none()))
+
+        # read no more than announced
+        body = BytesIO(b'text')
+        encoder = MultipartEncoder([((), body)], boundary='b')
+        body.seek(0, os.SEEK_END)
+        body.write(b' grown')
+        body.seek(0)
+        assert_that(b''.join(encoder), has_length(encoder.len))
+
+        # as sent by requests
+        prepped = Request('POST', 'http://lrs.io', data=encoder).prepare()
+        assert_that(prepped.headers, has_entries('Content-Length', str(encoder.len)))
+        encoder = MultipartEncoder([((), Stream(b''))])
+        prepped = Request('POST', 'http://lrs.io', data=encoder).prepare()
+        assert_that(prepped.headers, has_entries('Transfer-Encoding', 'chunked'))
+
+    def test_upload(self):
+        data = os.urandom(256 * 1024) + b'\r\n\r\n--\n\r'
+        statement, sha2 = _statement(data)
+        path = self._file(data)
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint)
+            with open(path, 'rb') as fp:
+                assert_that(client.save_statement(statement, {sha2: fp}).id,
+                            is_in(lrs.statements))
+            assert_that(lrs.attachments[sha2], is_(data))
+
+            # chunked, with the attachment twice
+            other, _ = _statement(data)
+            statement.id = None
+            client.save_statements([statement, other],
+                                   {sha2: StringIO(u'caf\xe9')})
+            assert_that(lrs.attachments[sha2], is_(u'caf\xe9'.encode('utf-8')))
+            assert_that(lrs.statements, has_length(3))
+            client.close()
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc not available')
+    def test_memory(self):
+        data = os.urandom(1024 * 1024)
+        path = self._file(data * 32)
+        parts = [((('Content-Type', 'application/json'),), b'[]'),
+                 ((('Content-Type', 'application/octet-stream'),), None)]
+
+        def files_body():
+            with open(path, 'rb') as fp:
+                files = {'json': ('json', b'[]', 'application/json'),
+                         'file': ('file', fp, 'application/octet-stream')}
+                Request('POST', 'http://lrs.io', files=files).prepare()
+
+        def streamed_body():
+            with open(path, 'rb') as fp:
+                parts[1] = (parts[1][0], fp)
+                for _ in MultipartEncoder(parts):
+                    pass
+
+        def peak(func):
+            tracemalloc.start()
+            try:
+                func()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        # the whole body is built in memory by requests, only a chunk
+        # at a time here
+        assert_that(peak(streamed_body) < 2 ** 20, is_(True))
+        assert_that(peak(files_body) > 32 * 2 ** 20, is_(True))
+
+
+class TestMultipartParser(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    body = (b'preamble\r\n'
+            b'--b\r\nContent-Type: application/json\r\n\r\n{}\r\n'
+            b'--b  \r\nContent-Type: application/octet-stream\r\n'
+            b'X-Experience-API-Hash: abc\r\n\r\n\r\n--c-b\r\n\r\n'
+            b'--b\r\n\r\n\r\n'
+            b'--b--\r\nepilogue')
+
+    def _chunks(self, data, size):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def test_get_boundary(self):
+        assert_that(get_boundary('multipart/mixed; boundary=abc'), is_('abc'))
+        assert_that(get_boundary('multipart/mixed;charset=utf-8; Boundary="a b"'),
+                    is_('a b'))
+        assert_that(get_boundary('multipart/mixed; boundary='), is_(none()))
+        assert_that(get_boundary('application/json'), is_(none()))
+        assert_that(get_boundary(None), is_(none()))
+
+    def test_parse(self):
+        for size in (1, 3, 7, len(self.body)):
+            parts = list(iter_multipart(self._chunks(self.body, size), 'b',
+                                        spool_size=4))
+            assert_that(parts, has_length(3))
+            assert_that(parts[0].content_type, is_('application/json'))
+            assert_that(parts[0].sha2, is_(none()))
+            assert_that(parts[0].read(), is_(b'{}'))
+            assert_that(parts[1].sha2, is_('abc'))
+            assert_that(parts[1].length, is_(9))
+            assert_that(parts[1].read(), is_(b'\r\n--c-b\r\n'))
+            assert_that(parts[2].content_type, is_('text/plain'))
+            assert_that(parts[2].read(), is_(b''))
+            # only the large part went to disk
+            assert_that([p.file._rolled for p in parts],
+                        is_([False, True, False]))
+            for part in parts:
+                part.close()
+
+        # the close delimiter ends the body
+        parts = list(iter_multipart([b'--b\r\n\r\nx\r\n--b--'], 'b'))
+        assert_that(parts[0].read(), is_(b'x'))
+        parts[0].close()
+
+    def test_errors(self):
+        for body in (b'no boundary',
+                     b'--b\r\n\r\ntruncated',
+                     b'--b\r\nContent-Type: text/plain',
+                     b'--b\r\n\r\nx\r\n--b'):
+            assert_that(calling(list).with_args(iter_multipart([body], 'b')),
+                        raises(ValueError))
+
+    def _save(self, client, data):
+        statement, sha2 = _statement(data)
+        client.save_statement(statement, {sha2: data})
+        return statement, sha2
+
+    def _close(self, result):
+        for part in result.attachments.values():
+            part.close()
+
+    def test_download(self):
+        with LocalLRS(page_size=2) as lrs:
+            client = LRSClient(lrs.endpoint, attachment_spool_size=1024)
+            saved = [self._save(client, os.urandom(size))
+                     for size in (10, 2048, 100)]
+            hashes = [sha2 for _, sha2 in saved]
+
+            result = client.query_statements({'attachments': 'true'})
+            assert_that(result.statements, has_length(2))
+            assert_that(result.attachments, has_length(2))
+            for sha2 in hashes[:2]:
+                part = result.attachments[sha2]
+                assert_that(part.content_type, is_('application/octet-stream'))
+                assert_that(part.read(), is_(lrs.attachments[sha2]))
+            assert_that(result.attachments[hashes[1]].file._rolled, is_(True))
+            self._close(result)
+            more = client.more_statements(result)
+            assert_that(list(more.attachments), is_([hashes[2]]))
+            self._close(more)
+
+            # streamed, and with a callback
+            found = []
+            result = client.query_statements({'attachments': True},
+                                             callback=found.append)
+            assert_that(found, has_length(2))
+            assert_that(result.attachments, has_length(2))
+            self._close(result)
+            ids = [s.id for s in client.iter_statements({'attachments': 'true'},
+                                                        stream=True)]
+            assert_that(ids, contains_inanyorder(*[s.id for s, _ in saved]))
+            ids = [s.id for s in client.iter_statements({'attachments': 'true'},
+                                                        max_statements=1,
+                                                        stream=True)]
+            assert_that(ids, has_length(1))
+
+            # a single statement
+            statement = client.retrieve_statement(saved[0][0].id)
+            assert_that(statement.attachments[0].sha2, is_(hashes[0]))
+
+            # no attachments without asking
+            result = client.query_statements({})
+            assert_that(result.attachments, is_(none()))
+            client.close()
+
+    def test_verify(self):
+        with LocalLRS() as lrs:
+            client = LRSClient(lrs.endpoint, verify_attachments=True)
+            _, sha2 = self._save(client, b'data')
+            self._save(client, b'data')
+            result = client.query_statements({'attachments': 'true'})
+            assert_that(result.statements, has_length(2))
+            assert_that(result.attachments, has_length(1))
+            assert_that(result.attachments[sha2].read(), is_(b'data'))
+            self._close(result)
+
+            lrs.attachments[sha2] = b'changed'
+            assert_that(calling(client.query_statements).with_args({'attachments': 'true'}),
+                        raises(AttachmentMismatchException))
+            client.close()
+
+    def test_no_parts(self):
+        client = LRSClient('http://lrs.io')
+        assert_that(calling(client.read_multipart_statements).with_args([b'--b--'], 'b'),
+                    raises(ValueError))
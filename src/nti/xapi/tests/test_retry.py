@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_entries
+from hamcrest import less_than_or_equal_to
+
+from nti.testing.matchers import verifiably_provides
+
+import hashlib
+import unittest
+from io import BytesIO
+
+from email.utils import formatdate
+
+import fudge
+
+from requests.exceptions import ConnectTimeout
+from requests.exceptions import ConnectionError  # pylint: disable=redefined-builtin
+
+from nti.xapi.activity import Activity
+
+from nti.xapi.client import LRSClient
+from nti.xapi.client import _positions
+
+from nti.xapi.documents.document import StateDocument
+
+from nti.xapi.entities import Agent
+
+from nti.xapi.interfaces import IRetryPolicy
+
+from nti.xapi.retry import RetryBudget
+from nti.xapi.retry import RetryPolicy
+from nti.xapi.retry import parse_retry_after
+
+from nti.xapi.testing import LocalLRS
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_multipart import _statement
+
+
+class FlakyLRS(LocalLRS):
+    """
+    Fails the next ``failures`` requests with a 503, or ``status``.
+    """
+
+    failures = 0
+    status = 503
+    retry_after = '0'
+
+    def handle(self, method, path, params, headers, body):
+        self.methods.append(method)
+        if self.failures:
+            self.failures -= 1
+            return self._response(self.status, headers={'Retry-After': self.retry_after})
+        return LocalLRS.handle(self, method, path, params, headers, body)
+
+    def start(self):
+        self.methods = []
+        return LocalLRS.start(self)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def _response(self, status, retry_after=None):
+        headers = {'Retry-After': retry_after} if retry_after else {}
+        return fudge.Fake().has_attr(status_code=status, headers=headers) \
+                           .provides('close')
+
+    def _policy(self, **kwargs):
+        self.sleeps = []
+        kwargs.setdefault('jitter', False)
+        return RetryPolicy(sleep=self.sleeps.append, **kwargs)
+
+    def _calls(self, *results):
+        results = list(results)
+
+        def func():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return func
+
+    def test_parse_retry_after(self):
+        assert_that(parse_retry_after('120'), is_(120))
+        assert_that(parse_retry_after(formatdate(1000, usegmt=True), now=990),
+                    is_(10))
+        assert_that(parse_retry_after(formatdate(1000, usegmt=True), now=2000),
+                    is_(0))
+        assert_that(parse_retry_after(formatdate(usegmt=True)),
+                    is_(less_than_or_equal_to(1)))
+        assert_that(parse_retry_after('soon'), is_(none()))
+        assert_that(parse_retry_after(None), is_(none()))
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, reserve=2)
+        assert_that(budget.withdraw(), is_(True))
+        assert_that(budget.withdraw(), is_(True))
+        assert_that(budget.withdraw(), is_(False))
+        budget.deposit()
+        assert_that(budget.withdraw(), is_(False))
+        for _ in range(10):
+            budget.deposit()
+        assert_that(budget.balance, is_(2))
+
+    def test_backoff(self):
+        policy = self._policy(max_attempts=4, backoff=0.5, max_backoff=1.5)
+        assert_that(policy, verifiably_provides(IRetryPolicy))
+        ok = self._response(200)
+        func = self._calls(self._response(500), ConnectionError(),
+                           self._response(502), ok)
+        assert_that(policy.call(func), is_(ok))
+        assert_that(self.sleeps, is_([0.5, 1.0, 1.5]))
+        assert_that(policy.metrics(),
+                    is_({'calls': 1, 'retries': 3, 'recovered': 1,
+                         'exhausted': 0, 'throttled': 0, 'denied': 0}))
+
+        # other statuses are returned as they are
+        not_found = self._response(404)
+        assert_that(policy.call(self._calls(not_found)), is_(not_found))
+        assert_that(policy.recovered, is_(1))
+
+        policy = RetryPolicy(backoff=1)
+        for attempt in (1, 2, 3):
+            assert_that(policy.backoff_delay(attempt),
+                        is_(less_than_or_equal_to(2 ** (attempt - 1))))
+
+    def test_exhausted(self):
+        policy = self._policy(max_attempts=2)
+        unavailable = self._response(503)
+        func = self._calls(self._response(503), unavailable)
+        assert_that(policy.call(func), is_(unavailable))
+        func = self._calls(ConnectTimeout(), ConnectionError('down'))
+        assert_that(calling(policy.call).with_args(func),
+                    raises(ConnectionError, 'down'))
+        assert_that(policy.metrics(),
+                    has_entries('calls', 2, 'retries', 2, 'exhausted', 2))
+
+    def test_retry_after(self):
+        policy = self._policy(max_retry_after=60)
+        ok = self._response(200)
+        func = self._calls(self._response(429, '3'), self._response(503, 'soon'),
+                           ok)
+        assert_that(policy.call(func), is_(ok))
+        assert_that(self.sleeps, is_([3, 1.0]))
+        assert_that(policy.throttled, is_(1))
+
+        # not worth waiting for
+        busy = self._response(503, '120')
+        assert_that(policy.call(self._calls(busy)), is_(busy))
+        assert_that(policy.metrics(),
+                    has_entries('throttled', 2, 'exhausted', 1))
+
+    def test_budget_denied(self):
+        policy = self._policy(budget=RetryBudget(ratio=0, reserve=1))
+        func = self._calls(self._response(500), self._response(500),
+                           self._response(500))
+        assert_that(policy.call(func).status_code, is_(500))
+        assert_that(policy.metrics(),
+                    has_entries('retries', 1, 'denied', 1, 'exhausted', 1))
+
+        policy = self._policy(budget=False)
+        assert_that(policy.budget, is_(none()))
+        func = self._calls(self._response(500), self._response(500),
+                           self._response(200))
+        assert_that(policy.call(func).status_code, is_(200))
+
+
+class TestClientRetries(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def test_idempotent(self):
+        with FlakyLRS() as lrs:
+            policy = RetryPolicy(backoff=0)
+            client = LRSClient(lrs.endpoint, retry_policy=policy)
+            lrs.failures = 2
+            assert_that(client.about(), is_not(none()))
+            assert_that(lrs.methods, is_(['GET'] * 3))
+
+            # POST is not retried
+            statement, sha2 = _statement(b'data')
+            lrs.failures = 1
+            assert_that(client.save_statement(statement, {sha2: b'data'}),
+                        is_(none()))
+
+            # a statement with an id is, its attachments sent again whole
+            statement, sha2 = _statement(b'data')
+            statement.id = '7ccd3322-e1a5-411a-a67d-6a735c76f119'
+            lrs.failures = 1
+            assert_that(client.save_statement(statement, {sha2: BytesIO(b'data')}),
+                        is_not(none()))
+            assert_that(lrs.attachments[sha2], is_(b'data'))
+
+            # unless they can't be rewound
+            class Stream(object):
+                def __init__(self, data):
+                    self.data = BytesIO(data)
+
+                def read(self, size):
+                    return self.data.read(size)
+
+            data = b'other'
+            statement, _ = _statement(data)
+            sha2 = hashlib.sha256(data).hexdigest()
+            statement.id = '7ccd3322-e1a5-411a-a67d-6a735c76f120'
+            lrs.failures = 1
+            assert_that(client.save_statement(statement, {sha2: Stream(data)}),
+                        is_(none()))
+            assert_that(lrs.statements, has_length(1))
+
+            # documents are retried when guarded by their etag
+            activity = Activity(id='http://example.com/activities/a')
+            agent = Agent(mbox='mailto:a@example.com')
+            state = StateDocument(id='s1', content=b'one',
+                                  activity=activity, agent=agent)
+            lrs.failures = 1
+            assert_that(client.save_state(state), is_(none()))
+            assert_that(client.save_state(state), is_not(none()))
+            state = client.retrieve_state(activity, agent, 's1')
+            state.content = b'two'
+            lrs.failures = 1
+            assert_that(client.save_state(state), is_not(none()))
+            assert_that(policy.metrics(),
+                        has_entries('calls', 4, 'retries', 4, 'recovered', 3))
+            client.close()
+
+    def test_positions(self):
+        stream = BytesIO(b'data')
+        stream.read(1)
+        assert_that(_positions([stream, stream]), is_([(stream, 1), (stream, 1)]))
+        assert_that(_positions(None), is_([]))
+        closed = BytesIO()
+        closed.close()
+        assert_that(_positions([stream, closed]), is_(none()))
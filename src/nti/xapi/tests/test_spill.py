@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import contains_exactly
+
+from nti.testing.matchers import verifiably_provides
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from io import StringIO
+
+from nti.xapi.breaker import CircuitBreaker
+
+from nti.xapi.client import LRSClient
+
+from nti.xapi.interfaces import ISpillQueue
+from nti.xapi.interfaces import CircuitOpenException
+
+from nti.xapi.spill import FSYNC_NEVER
+from nti.xapi.spill import FSYNC_ALWAYS
+from nti.xapi.spill import SpillDrainer
+from nti.xapi.spill import DiskSpillQueue
+from nti.xapi.spill import MemorySpillBuffer
+
+from nti.xapi.statement import Statement
+
+from nti.xapi.tests import SharedConfiguringTestLayer
+
+from nti.xapi.tests.test_multipart import _statement
+
+from nti.xapi.tests.test_retry import FlakyLRS
+
+
+def _statements(count):
+    result = []
+    for i in range(count):
+        statement, _ = _statement(b'data')
+        statement.attachments = None
+        statement.id = '7ccd3322-e1a5-411a-a67d-6a735c76f%03d' % i
+        result.append(statement)
+    return result
+
+
+class TestDiskSpillQueue(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, 'spill')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _ids(self, batch):
+        return [s.id for s in batch[0]]
+
+    def test_queue(self):
+        queue = DiskSpillQueue(self.directory, fsync=FSYNC_ALWAYS)
+        assert_that(queue, verifiably_provides(ISpillQueue))
+        assert_that(queue.peek(), is_(none()))
+        statements = _statements(3)
+        attachments = {'a': b'bytes', 'b': BytesIO(b'stream'),
+                       'c': StringIO(u'caf\xe9')}
+        assert_that(queue.put(statements[:2], attachments), is_(True))
+        assert_that(queue.put(statements[2:]), is_(True))
+        assert_that(queue, has_length(3))
+
+        batch = queue.peek()
+        assert_that(batch[0][0], is_(Statement))
+        assert_that(self._ids(batch), is_([s.id for s in statements[:2]]))
+        # attachment data is read from the segment as it is consumed
+        data = batch[1]['b']
+        assert_that(data.read(0), is_(b''))
+        assert_that(data.read(2), is_(b'st'))
+        assert_that(data.seek(1, os.SEEK_CUR), is_(3))
+        assert_that(data.read(), is_(b'eam'))
+        assert_that(data.read(), is_(b''))
+        assert_that(data.seek(-2, os.SEEK_END), is_(4))
+        assert_that(data.tell(), is_(4))
+        data.seek(0)
+        assert_that({k: v.read() for k, v in batch[1].items()},
+                    is_({'a': b'bytes', 'b': b'stream',
+                         'c': u'caf\xe9'.encode('utf-8')}))
+        for data in batch[1].values():
+            data.close()
+        data.close()
+        # the same batch until it is acknowledged
+        assert_that(self._ids(queue.peek()), is_(self._ids(batch)))
+        queue.ack()
+        assert_that(calling(queue.ack), raises(ValueError))
+        assert_that(queue, has_length(1))
+        queue.close()
+
+        # delivery survives reopening
+        queue = DiskSpillQueue(self.directory)
+        assert_that(queue, has_length(1))
+        assert_that(queue.records, is_(1))
+        assert_that(self._ids(queue.peek()), is_([statements[2].id]))
+        assert_that(queue.drain(), has_length(1))
+        assert_that(queue, has_length(0))
+        queue.close()
+        assert_that(calling(DiskSpillQueue).with_args(self.directory, fsync='often'),
+                    raises(ValueError))
+
+    def test_segments(self):
+        queue = DiskSpillQueue(self.directory, segment_size=100, fsync=FSYNC_NEVER)
+        statements = _statements(4)
+        for statement in statements:
+            queue.put([statement], {'a': b'x' * 50})
+        assert_that(queue._segments(), has_length(5))
+        size = queue.size
+        assert_that(size, is_(sum(os.path.getsize(queue._path(n))
+                                  for n in queue._segments())))
+
+        # delivered segments are deleted
+        queue.peek()
+        queue.ack()
+        queue.peek()
+        queue.ack()
+        assert_that(queue._segments(), has_length(4))
+        assert_that(queue.size < size, is_(True))
+        queue.close()
+
+        # left behind by a crash before it was deleted
+        open(queue._path(0), 'wb').close()
+        queue = DiskSpillQueue(self.directory, max_bytes=1)
+        assert_that(queue._segments(), has_length(4))
+        assert_that(queue, has_length(2))
+        assert_that(queue.put(_statements(2)), is_(False))
+        assert_that(queue.overflowed, is_(2))
+        assert_that([s.id for s in queue.drain()],
+                    is_([s.id for s in statements[2:]]))
+        queue.close()
+
+    def test_recovery(self):
+        queue = DiskSpillQueue(self.directory)
+        statements = _statements(3)
+        for statement in statements:
+            queue.put([statement])
+        path = queue._path(0)
+        queue.close()
+
+        # a torn write is discarded
+        with open(path, 'r+b') as fp:
+            fp.seek(-5, os.SEEK_END)
+            fp.truncate()
+        size = os.path.getsize(path)
+        queue = DiskSpillQueue(self.directory)
+        assert_that(queue, has_length(2))
+        assert_that(os.path.getsize(path) < size, is_(True))
+        queue.put(statements[2:])
+        assert_that([s.id for s in queue.drain()], is_([s.id for s in statements]))
+
+        # as is a failed one
+        class Broken(object):
+            def read(self, unused_size):
+                raise IOError('broken')
+        size = os.path.getsize(path)
+        assert_that(calling(queue.put).with_args(statements, {'a': Broken()}),
+                    raises(IOError))
+        assert_that(os.path.getsize(path), is_(size))
+        queue.close()
+
+        # a corrupt record ends its segment
+        directory = os.path.join(self.tmpdir, 'corrupt')
+        queue = DiskSpillQueue(directory, segment_size=1)
+        for statement in statements:
+            queue.put([statement])
+        with open(queue._path(1), 'r+b') as fp:
+            fp.seek(20)
+            fp.write(b'garbage')
+        assert_that(self._ids(queue.peek()), is_([statements[0].id]))
+        queue.ack()
+        assert_that(self._ids(queue.peek()), is_([statements[2].id]))
+        queue.ack()
+        queue.close()
+
+        # without a cursor, delivery starts over from the first segment
+        with open(os.path.join(directory, 'cursor'), 'w') as fp:
+            fp.write('bad')
+        queue = DiskSpillQueue(directory)
+        assert_that(queue, has_length(1))
+        queue.close()
+
+    def test_fsync_interval(self):
+        queue = DiskSpillQueue(self.directory, fsync_interval=0)
+        queue._synced = 0
+        queue.put(_statements(1))
+        assert_that(queue._synced, is_not(0))
+        synced = queue._synced = time.time() + 60
+        queue.put(_statements(1))
+        assert_that(queue._synced, is_(synced))
+        queue.close()
+
+
+class TestClientSpill(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_spill(self):
+        with FlakyLRS() as lrs:
+            queue = DiskSpillQueue(self.tmpdir)
+            client = LRSClient(lrs.endpoint, spill=queue)
+
+            # not delivered, but kept with ids of their own
+            statements = _statements(2)
+            for statement in statements:
+                statement.id = None
+            lrs.failures = 1
+            assert_that(client.save_statements(statements), is_(statements))
+            assert_that(statements[0].id, is_not(none()))
+            data = b'attachment data'
+            statement, sha2 = _statement(data)
+            stream = BytesIO(data)
+            lrs.failures = 1
+            assert_that(client.save_statement(statement, {sha2: stream}),
+                        is_(statement))
+            assert_that(statement.id, is_not(none()))
+            assert_that(queue, has_length(3))
+            assert_that(lrs.statements, has_length(0))
+
+            # client errors are not spilled
+            lrs.failures, lrs.status = 1, 400
+            assert_that(client.save_statements(_statements(1)), is_(none()))
+            assert_that(queue, has_length(3))
+
+            # the drainer replays them once the LRS is back
+            lrs.failures, lrs.status = 100, 503
+            drainer = SpillDrainer(queue, client, interval=60)
+            assert_that(drainer.drain(), is_(False))
+            assert_that(drainer.failures, is_not(0))
+            lrs.failures = 0
+            drainer.wake()
+            for _ in range(100):
+                if not queue:
+                    break
+                time.sleep(0.05)  # pragma: no cover
+            drainer.close(5)
+            assert_that(queue, has_length(0))
+            assert_that(drainer.replayed, is_(3))
+            assert_that(list(lrs.statements),
+                        contains_exactly(*[s.id for s in statements + [statement]]))
+            assert_that(lrs.attachments[sha2], is_(data))
+
+            # a replayed batch is stored once
+            assert_that(client.replay_statements(statements), is_(statements))
+            assert_that(lrs.statements, has_length(3))
+            queue.close()
+            client.close()
+
+    def test_rejected(self):
+        with FlakyLRS() as lrs:
+            queue = DiskSpillQueue(os.path.join(self.tmpdir, 'queue'))
+            dead_letter = DiskSpillQueue(os.path.join(self.tmpdir, 'dead'))
+            client = LRSClient(lrs.endpoint)
+            statements = _statements(3)
+            data = b'attachment data'
+            statement, sha2 = _statement(data)
+            queue.put([statement], {sha2: data})
+            for s in statements:
+                queue.put([s])
+
+            # a rejected batch doesn't hold up the ones after it
+            lrs.failures, lrs.status = 1, 400
+            drainer = SpillDrainer(queue, client, interval=60,
+                                   dead_letter=dead_letter)
+            drainer.close(5)
+            assert_that(drainer.drain(), is_(True))
+            assert_that(drainer.rejected, is_(1))
+            assert_that(drainer.replayed, is_(3))
+            assert_that(drainer.failures, is_(0))
+            assert_that(queue, has_length(0))
+            assert_that(list(lrs.statements),
+                        contains_exactly(*[s.id for s in statements]))
+            batch = dead_letter.peek()
+            assert_that([s.id for s in batch[0]], is_([statement.id]))
+            assert_that(batch[1][sha2].read(), is_(data))
+            batch[1][sha2].close()
+
+            # without a dead letter buffer, or with a full one, it is dropped
+            queue.put(_statements(1))
+            lrs.failures = 1
+            drainer = SpillDrainer(queue, client, interval=60)
+            drainer.close(5)
+            assert_that(drainer.drain(), is_(True))
+            assert_that(drainer.rejected, is_(1))
+            queue.put(_statements(1))
+            lrs.failures = 1
+            drainer.dead_letter = MemorySpillBuffer()
+            drainer.dead_letter.put = lambda *args: False
+            assert_that(drainer.drain(), is_(True))
+            assert_that(drainer.rejected, is_(2))
+
+            # a 429 is tried again later
+            queue.put(_statements(1))
+            lrs.failures, lrs.status = 1, 429
+            assert_that(drainer.drain(), is_(False))
+            assert_that(drainer.failures, is_(1))
+            assert_that(queue, has_length(1))
+            queue.close()
+            dead_letter.close()
+            client.close()
+
+    def test_unavailable(self):
+        spill = MemorySpillBuffer(maxlen=1)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        client = LRSClient('http://127.0.0.1:1/xapi/', spill=spill,
+                           circuit_breaker=breaker)
+        statements = _statements(1)
+        assert_that(client.save_statements(statements), is_(statements))
+        assert_that(client.save_statements(statements), is_(statements))
+        assert_that(spill.dropped, is_(1))
+        assert_that(calling(client.replay_statements).with_args(statements),
+                    raises(CircuitOpenException))
+        queue = DiskSpillQueue(os.path.join(self.tmpdir, 'open'))
+        queue.put(statements)
+        drainer = SpillDrainer(queue, client, interval=60)
+        drainer.close(5)
+        assert_that(drainer.drain(), is_(False))
+        assert_that(drainer.failures, is_not(0))
+        assert_that(queue, has_length(1))
+        queue.close()
+
+        # when the spill buffer is full
+        queue = DiskSpillQueue(self.tmpdir, max_bytes=0)
+        client = LRSClient('http://127.0.0.1:1/xapi/', spill=queue)
+        assert_that(client.save_statements(statements), is_(none()))
+        queue.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import calling
+from hamcrest import raises
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import less_than
+
+import os
+import codecs
+import unittest
+
+import simplejson as json
+
+from nti.xapi.streaming import StatementResultParser
+from nti.xapi.streaming import iter_statement_result
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestStatementResultParser(unittest.TestCase):
+
+    @property
+    def document(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "data", "statement_result.json")
+        with codecs.open(path, "r", "UTF-8") as fp:
+            result = json.load(fp)
+        statement = result['statements'][0]
+        statements = []
+        for i in range(20):
+            statement = dict(statement)
+            statement['result'] = dict(statement['result'],
+                                       response=u'é "}]{[, \\' * i)
+            statements.append(statement)
+        result['statements'] = statements
+        result['more'] = u'/xapi/statements?cursor="10"'
+        result['extra'] = {'nested': [1, {'a': []}]}
+        return result
+
+    def test_chunked(self):
+        document = self.document
+        data = json.dumps(document).encode('utf-8')
+        for size in (1, 2, 3, 7, 64, len(data)):
+            parser = StatementResultParser()
+            statements = []
+            for chunk in _chunks(data, size):
+                statements.extend(parser.feed(chunk))
+                # only the current element is buffered
+                assert_that(len(parser._buf), less_than(1500))
+            statements.extend(parser.close())
+            assert_that(statements, is_(document['statements']))
+            assert_that(parser.more, is_(document['more']))
+            assert_that(parser.members['extra'], is_(document['extra']))
+
+    def test_member_order(self):
+        data = b'{"more": "", "statements": [{"id": "a"}, {"id": "b"}]}'
+        parser = StatementResultParser()
+        statements = list(iter_statement_result(_chunks(data, 5), parser))
+        assert_that(statements, is_([{"id": "a"}, {"id": "b"}]))
+        assert_that(parser.more, is_(''))
+
+        parser = StatementResultParser()
+        assert_that(list(iter_statement_result([b'{"statements": []}'], parser)),
+                    has_length(0))
+        assert_that(parser.more, is_(none()))
+
+        parser = StatementResultParser()
+        parser.feed(u'{"statements": [{"id": "a"}')
+        assert_that(calling(parser.close), raises(ValueError))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import raises
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_entries
+from hamcrest import greater_than
+
+import sys
+import time
+import unittest
+
+import fudge
+
+import requests
+
+import six
+
+import simplejson as json
+
+from nti.xapi.testing import LocalLRS
+from nti.xapi.testing import LocalLRSProcess
+
+from nti.xapi.testing import main
+
+
+class TestLocalLRS(unittest.TestCase):
+
+    def test_statements(self):
+        with LocalLRS(page_size=2) as lrs:
+            url = lrs.endpoint + 'statements'
+            response = requests.post(url, json=[{}, {}, {}])
+            assert_that(response.json(), has_length(3))
+
+            response = requests.put(url, json={}, params={'statementId': 'a'})
+            assert_that(response.status_code, is_(204))
+            response = requests.put(url, json=[{}], params={'statementId': 'b'})
+            assert_that(response.status_code, is_(204))
+            response = requests.put(url, json={})
+            assert_that(response.status_code, is_(400))
+
+            response = requests.get(url, params={'statementId': 'a'})
+            assert_that(response.json(), has_entries('id', 'a'))
+            response = requests.get(url, params={'voidedStatementId': 'c'})
+            assert_that(response.status_code, is_(404))
+
+            page = requests.get(url).json()
+            assert_that(page['statements'], has_length(2))
+            page = requests.get(lrs.endpoint[:-len(lrs.prefix)] + page['more']).json()
+            assert_that(page['statements'], has_length(2))
+            page = requests.get(lrs.endpoint[:-len(lrs.prefix)] + page['more']).json()
+            assert_that(page, has_entries('statements', has_length(1),
+                                          'more', ''))
+
+            response = requests.head(lrs.endpoint + 'about')
+            assert_that(response.status_code, is_(200))
+            response = requests.get(lrs.endpoint + 'unknown')
+            assert_that(response.status_code, is_(404))
+            response = requests.get(lrs.endpoint[:-len(lrs.prefix)] + '/other')
+            assert_that(response.status_code, is_(404))
+        lrs.stop()
+
+    def test_documents(self):
+        with LocalLRS() as lrs:
+            url = lrs.endpoint + 'activities/state'
+            agent = json.dumps({'mbox': 'mailto:a@example.com'})
+            params = {'activityId': 'act', 'agent': agent, 'stateId': 's1'}
+            response = requests.put(url, data=b'one', params=params,
+                                    headers={'Content-Type': 'text/plain'})
+            assert_that(response.status_code, is_(204))
+            response = requests.put(url, data=b'one',
+                                    params=dict(params, stateId='s2'))
+            assert_that(response.status_code, is_(204))
+
+            response = requests.get(url, params=params)
+            assert_that(response.content, is_(b'one'))
+            assert_that(response.headers,
+                        has_entries('Content-Type', 'text/plain'))
+            etag = response.headers['ETag']
+            modified = response.headers['Last-Modified']
+
+            # conditional requests
+            response = requests.get(url, params=params,
+                                    headers={'If-None-Match': etag})
+            assert_that(response.status_code, is_(304))
+            assert_that(response.headers, has_entries('ETag', etag))
+            response = requests.get(url, params=params,
+                                    headers={'If-None-Match': '"other"',
+                                             'If-Modified-Since': modified})
+            assert_that(response.status_code, is_(200))
+            response = requests.get(url, params=params,
+                                    headers={'If-Modified-Since': modified})
+            assert_that(response.status_code, is_(304))
+            response = requests.get(url, params=params,
+                                    headers={'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'})
+            assert_that(response.status_code, is_(200))
+            response = requests.get(url, params=params,
+                                    headers={'If-Modified-Since': 'never'})
+            assert_that(response.status_code, is_(200))
+
+            response = requests.put(url, data=b'two', params=params,
+                                    headers={'If-Match': '"other"'})
+            assert_that(response.status_code, is_(412))
+            response = requests.put(url, data=b'two', params=params,
+                                    headers={'If-Match': etag})
+            assert_that(response.status_code, is_(204))
+            response = requests.delete(url, params=params,
+                                       headers={'If-Match': etag})
+            assert_that(response.status_code, is_(412))
+
+            ids = requests.get(url, params={'activityId': 'act',
+                                            'agent': agent}).json()
+            assert_that(ids, is_(['s1', 's2']))
+            response = requests.delete(url, params=params)
+            assert_that(response.status_code, is_(204))
+            response = requests.get(url, params=params)
+            assert_that(response.status_code, is_(404))
+            response = requests.delete(url, params={'activityId': 'act',
+                                                    'agent': agent})
+            assert_that(response.status_code, is_(204))
+            assert_that(lrs.documents, has_length(0))
+
+            url = lrs.endpoint + 'agents/profile'
+            response = requests.put(url, data=b'x', params={'agent': agent})
+            assert_that(response.status_code, is_(400))
+            response = requests.post(url, data=b'x', params={'agent': agent})
+            assert_that(response.status_code, is_(405))
+
+    def test_faults(self):
+        with LocalLRS(error_status=500) as lrs:
+            url = lrs.endpoint + 'about'
+            lrs.fail(2, retry_after=1)
+            lrs.fail(status=429)
+            response = requests.get(url)
+            assert_that(response.status_code, is_(500))
+            assert_that(response.headers, has_entries('Retry-After', '1'))
+            assert_that(requests.get(url).status_code, is_(500))
+            assert_that(requests.get(url).status_code, is_(429))
+            assert_that(requests.get(url).status_code, is_(200))
+            assert_that(lrs.errors, is_(3))
+
+        # random failures, repeatable with a seed
+        def statuses(lrs):
+            with lrs:
+                return [requests.get(lrs.endpoint + 'about').status_code
+                        for _ in range(20)]
+        first = statuses(LocalLRS(error_rate=0.5, seed=1))
+        assert_that(set(first), is_(set([200, 503])))
+        assert_that(statuses(LocalLRS(error_rate=0.5, seed=1)), is_(first))
+
+        with LocalLRS(latency=0.05, jitter=0.05) as lrs:
+            start = time.time()
+            requests.get(lrs.endpoint + 'about')
+            assert_that(time.time() - start, greater_than(0.05))
+            assert_that(lrs.errors, is_(0))
+
+    def test_join(self):
+        lrs = LocalLRS()
+        assert_that(lrs.join(), is_(True))
+        with lrs:
+            assert_that(lrs.join(0.05), is_(False))
+        assert_that(lrs.join(), is_(True))
+
+    @fudge.patch('nti.xapi.testing.LocalLRS.join')
+    def test_main(self, mock_join):
+        mock_join.expects_call().raises(KeyboardInterrupt)
+        stdout = sys.stdout
+        sys.stdout = six.StringIO()
+        try:
+            main(['--page-size', '5', '--latency', '0.01', '--seed', '1'])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert_that(output.strip().startswith('http://127.0.0.1:'), is_(True))
+
+    def test_process(self):
+        with LocalLRSProcess(page_size=2, error_rate=0) as lrs:
+            url = lrs.endpoint + 'statements'
+            response = requests.post(url, json=[{}, {}, {}])
+            assert_that(response.json(), has_length(3))
+            page = requests.get(url).json()
+            assert_that(page['statements'], has_length(2))
+        assert_that(lrs.process, is_(none()))
+        lrs.stop()
+
+        process = LocalLRSProcess(port='invalid')
+        assert_that(calling(process.start), raises(RuntimeError))
@@ -7,11 +7,14 @@ from __future__ import absolute_import
 
 # pylint: disable=protected-access,too-many-public-methods
 
+from hamcrest import none
 from hamcrest import assert_that
 from hamcrest import has_property
 
 from zope import component
 
+from nti.xapi.ids import time_ordered_uuid
+
 from nti.xapi.interfaces import ILRSClient
 
 import nti.testing.base
@@ -41,3 +44,73 @@ class TestZcml(nti.testing.base.ConfiguringTestBase):
                     has_property('endpoint', 'http://nextthought.com/lrs/'))
         assert_that(lrs_client, has_property('auth', ('foo', 'bar')))
         assert_that(lrs_client, has_property('version', '1.0.3'))
+        assert_that(lrs_client, has_property('document_cache', none()))
+        assert_that(lrs_client, has_property('statement_cache', none()))
+        assert_that(lrs_client, has_property('retry_policy', none()))
+        assert_that(lrs_client, has_property('circuit_breaker', none()))
+        assert_that(lrs_client, has_property('id_generator', none()))
+        assert_that(lrs_client, has_property('compression', none()))
+        assert_that(lrs_client, has_property('timeout', none()))
+        assert_that(lrs_client, has_property('interner', none()))
+
+POOLED_LRS_ZCML_STRING = u"""
+<configure xmlns="http://namespaces.zope.org/zope"
+	xmlns:zcml="http://namespaces.zope.org/zcml"
+	xmlns:xapi="http://nextthought.com/ntp/xapi"
+	i18n_domain='nti.dataserver'>
+	<include package="zope.component" />
+
+	<include package="." file="meta.zcml" />
+	<xapi:registerLRSClient
+				endpoint="http://nextthought.com/lrs"
+				pool_connections="2"
+				pool_maxsize="20"
+				max_retries="3"
+				keep_alive="false"
+				fast_decode="true"
+				codec="json"
+				document_cache_size="50"
+				statement_cache_size="500"
+				statement_cache_ttl="60"
+				verify_attachments="true"
+				attachment_spool_size="4096"
+				retry_attempts="4"
+				retry_backoff="0.25"
+				breaker_threshold="3"
+				breaker_reset_timeout="10"
+				statement_ids="time"
+				compression="deflate"
+				read_timeout="30"
+				compact="true"
+				interning_size="500" />
+</configure>
+"""
+
+
+class TestPooledZcml(nti.testing.base.ConfiguringTestBase):
+
+    def test_lrs(self):
+        self.configure_string(POOLED_LRS_ZCML_STRING)
+        lrs_client = component.getUtility(ILRSClient)
+        assert_that(lrs_client, has_property('pool_connections', 2))
+        assert_that(lrs_client, has_property('pool_maxsize', 20))
+        assert_that(lrs_client, has_property('max_retries', 3))
+        assert_that(lrs_client, has_property('keep_alive', False))
+        assert_that(lrs_client, has_property('fast_decode', True))
+        assert_that(lrs_client, has_property('compact', True))
+        assert_that(lrs_client.interner, has_property('maxsize', 500))
+        assert_that(lrs_client.codec, has_property('name', 'json'))
+        assert_that(lrs_client.document_cache, has_property('maxsize', 50))
+        assert_that(lrs_client.statement_cache, has_property('maxsize', 500))
+        assert_that(lrs_client.statement_cache, has_property('ttl', 60))
+        assert_that(lrs_client, has_property('verify_attachments', True))
+        assert_that(lrs_client, has_property('attachment_spool_size', 4096))
+        assert_that(lrs_client.retry_policy, has_property('max_attempts', 4))
+        assert_that(lrs_client.retry_policy, has_property('backoff', 0.25))
+        breaker = lrs_client.circuit_breaker
+        assert_that(breaker, has_property('failure_threshold', 3))
+        assert_that(breaker, has_property('reset_timeout', 10))
+        assert_that(breaker, has_property('probe', lrs_client.about))
+        assert_that(lrs_client, has_property('id_generator', time_ordered_uuid))
+        assert_that(lrs_client.compression.compressor, has_property('encoding', 'deflate'))
+        assert_that(lrs_client, has_property('timeout', (None, 30)))
@@ -17,13 +17,30 @@ from zope import interface
 from zope.component.zcml import utility
 
 from zope.schema import URI
+from zope.schema import Int
+from zope.schema import Float
+from zope.schema import Bool
 from zope.schema import TextLine
 
+from requests.adapters import DEFAULT_RETRIES
+from requests.adapters import DEFAULT_POOLSIZE
+
+from nti.xapi.breaker import CircuitBreaker
+
+from nti.xapi.cache import DocumentCache
+from nti.xapi.cache import StatementCache
+
 from nti.xapi.client import LRSClient
 
 from nti.xapi.interfaces import Version
 from nti.xapi.interfaces import ILRSClient
 
+from nti.xapi.interning import Interner
+
+from nti.xapi.multipart import SPOOL_SIZE
+
+from nti.xapi.retry import RetryPolicy
+
 logger = __import__('logging').getLogger(__name__)
 
 
@@ -42,11 +59,152 @@ class IRegisterLRSClient(interface.Interface):
                        required=False,
                        default=Version.latest)
 
+    pool_connections = Int(title=u'The number of connection pools to cache.',
+                           required=False,
+                           min=1,
+                           default=DEFAULT_POOLSIZE)
+
+    pool_maxsize = Int(title=u'The maximum number of pooled connections.',
+                       required=False,
+                       min=1,
+                       default=DEFAULT_POOLSIZE)
+
+    max_retries = Int(title=u'The number of retries for failed connections.',
+                      required=False,
+                      min=0,
+                      default=DEFAULT_RETRIES)
+
+    keep_alive = Bool(title=u'Reuse connections between requests.',
+                      required=False,
+                      default=True)
+
+    fast_decode = Bool(title=u'Build statements with the fast internalization.',
+                       required=False,
+                       default=False)
+
+    codec = TextLine(title=u'The name of the JSON codec.',
+                     required=False)
+
+    document_cache_size = Int(title=u'The number of state and profile documents to cache.',
+                              description=u'No documents are cached when 0.',
+                              required=False,
+                              min=0,
+                              default=0)
+
+    statement_cache_size = Int(title=u'The number of statements to cache.',
+                               description=u'No statements are cached when 0.',
+                               required=False,
+                               min=0,
+                               default=0)
+
+    statement_cache_ttl = Float(title=u'The seconds a cached statement is kept.',
+                                required=False,
+                                min=0.0,
+                                default=300.0)
+
+    verify_attachments = Bool(title=u'Check attachment data against its hash before sending it.',
+                              required=False,
+                              default=False)
+
+    attachment_spool_size = Int(title=u'The largest attachment received kept in memory.',
+                                description=u'Larger ones are spooled to a temporary file.',
+                                required=False,
+                                min=0,
+                                default=SPOOL_SIZE)
+
+    retry_attempts = Int(title=u'The most times an idempotent call is made.',
+                         description=u'Failed calls are not retried when 1.',
+                         required=False,
+                         min=1,
+                         default=1)
+
+    retry_backoff = Float(title=u'The seconds before retrying a call, doubled for each retry.',
+                          required=False,
+                          min=0.0,
+                          default=0.5)
+
+    breaker_threshold = Int(title=u'The consecutive failed calls opening the circuit breaker.',
+                            description=u'No circuit breaker is used when 0.',
+                            required=False,
+                            min=0,
+                            default=0)
+
+    breaker_reset_timeout = Float(title=u'The seconds the circuit breaker stays open before probing.',
+                                  required=False,
+                                  min=0.0,
+                                  default=30.0)
+
+    statement_ids = TextLine(title=u'The generator of the ids given to statements before they are sent.',
+                             description=u'Either random or time; the LRS assigns ids when not set.',
+                             required=False)
+
+    compression = TextLine(title=u'The content encoding statements and documents are sent in.',
+                           description=u'Either gzip or deflate; bodies are sent uncompressed when not set.',
+                           required=False)
+
+    connect_timeout = Float(title=u'The seconds to wait for a connection to the LRS.',
+                            required=False,
+                            min=0.0)
+
+    read_timeout = Float(title=u'The seconds to wait for the LRS to respond.',
+                         required=False,
+                         min=0.0)
+
+    compact = Bool(title=u'Build the statements read with the compact classes.',
+                   required=False,
+                   default=False)
+
+    interning_size = Int(title=u'The number of verbs, activities and agents shared by the statements read.',
+                         description=u'Nothing is shared when 0.',
+                         required=False,
+                         min=0,
+                         default=0)
+
 
 def registerLRSClient(_context, endpoint=None, username=None, password=None,
-                      version=Version.latest):
+                      version=Version.latest, pool_connections=DEFAULT_POOLSIZE,
+                      pool_maxsize=DEFAULT_POOLSIZE, max_retries=DEFAULT_RETRIES,
+                      keep_alive=True, fast_decode=False, codec=None,
+                      document_cache_size=0, statement_cache_size=0,
+                      statement_cache_ttl=300.0, verify_attachments=False,
+                      attachment_spool_size=SPOOL_SIZE, retry_attempts=1,
+                      retry_backoff=0.5, breaker_threshold=0,
+                      breaker_reset_timeout=30.0, statement_ids=None,
+                      compression=None, connect_timeout=None,
+                      read_timeout=None, compact=False, interning_size=0):
+    document_cache = statement_cache = retry_policy = breaker = None
+    if document_cache_size:
+        document_cache = DocumentCache(document_cache_size)
+    interner = Interner(interning_size) if interning_size else None
+    if statement_cache_size:
+        statement_cache = StatementCache(statement_cache_size,
+                                         statement_cache_ttl)
+    if retry_attempts > 1:
+        retry_policy = RetryPolicy(retry_attempts, retry_backoff)
+    if breaker_threshold:
+        breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+    timeout = None
+    if connect_timeout is not None or read_timeout is not None:
+        timeout = (connect_timeout, read_timeout)
     factory = partial(LRSClient,
                       endpoint,
                       auth=(username, password),
-                      version=version)
+                      version=version,
+                      pool_connections=pool_connections,
+                      pool_maxsize=pool_maxsize,
+                      max_retries=max_retries,
+                      keep_alive=keep_alive,
+                      fast_decode=fast_decode,
+                      codec=codec,
+                      document_cache=document_cache,
+                      statement_cache=statement_cache,
+                      verify_attachments=verify_attachments,
+                      attachment_spool_size=attachment_spool_size,
+                      retry_policy=retry_policy,
+                      circuit_breaker=breaker,
+                      statement_ids=statement_ids,
+                      compression=compression,
+                      timeout=timeout,
+                      compact=compact,
+                      interner=interner)
     utility(_context, provides=ILRSClient, factory=factory)